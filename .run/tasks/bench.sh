@@ -0,0 +1,14 @@
+# vim: set ft=bash sw=3 ts=3 expandtab:
+# runscript: customized=true
+
+help_bench() {
+   echo "- run bench: Run micro-benchmarks for the hot paths, optionally comparing against a baseline"
+}
+
+task_bench() {
+   cat << EOF > "$WORKING_DIR/benchmark.py"
+from apologies.cli import cli
+cli("benchmark")
+EOF
+   run_command uvrun python "$WORKING_DIR/benchmark.py" "$@"
+}
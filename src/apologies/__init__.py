@@ -1,27 +1,59 @@
-from apologies.engine import Character, Engine
-from apologies.game import Card, CardType, Game, GameMode, History, Pawn, Player, PlayerColor, PlayerView, Position
-from apologies.rules import Action, ActionType, Move, Rules
-from apologies.source import CharacterInputSource, NoOpInputSource, RandomInputSource, RewardV1InputSource
+from apologies.engine import AsyncCharacter, AsyncEngine, Character, Engine, EnginePhase, EngineProfiler, PhaseTiming
+from apologies.game import Card, CardType, Game, GameMode, History, HistoryMode, Pawn, Player, PlayerColor, PlayerView, Position
+from apologies.host import FileStorage, GameHost, GameStorage, HostMetrics, MemoryStorage
+from apologies.rules import Action, ActionType, LegalMoveCache, Move, Rules
+from apologies.source import (
+    AsyncCharacterInputSource,
+    AsyncInputSourceAdapter,
+    CharacterInputSource,
+    ExpectimaxInputSource,
+    MonteCarloInputSource,
+    MoveRequest,
+    NoOpInputSource,
+    QueueInputSource,
+    RandomInputSource,
+    RewardV1InputSource,
+    VectorizedRewardV1InputSource,
+)
 
 __all__ = [
     "Action",
     "ActionType",
+    "AsyncCharacter",
+    "AsyncCharacterInputSource",
+    "AsyncEngine",
+    "AsyncInputSourceAdapter",
     "Card",
     "CardType",
     "Character",
     "CharacterInputSource",
     "Engine",
+    "EnginePhase",
+    "EngineProfiler",
+    "ExpectimaxInputSource",
+    "FileStorage",
     "Game",
+    "GameHost",
     "GameMode",
+    "GameStorage",
     "History",
+    "HistoryMode",
+    "HostMetrics",
+    "LegalMoveCache",
+    "MemoryStorage",
+    "MonteCarloInputSource",
     "Move",
+    "MoveRequest",
     "NoOpInputSource",
     "Pawn",
+    "PhaseTiming",
     "Player",
     "PlayerColor",
     "PlayerView",
     "Position",
+    "QueueInputSource",
     "RandomInputSource",
     "RewardV1InputSource",
     "Rules",
+    "VectorizedRewardV1InputSource",
 ]
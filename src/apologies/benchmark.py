@@ -0,0 +1,335 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# ruff: noqa: T201
+
+"""
+Micro-benchmarks for the hot paths in the rules, the engine, game state copying, and serialization.
+
+Each benchmark builds its fixtures from a fixed seed, so every run times exactly the same work.
+Timing uses timeit: the number of calls per measurement is calibrated so that a measurement takes
+at least 0.2 seconds, and the best and median of several measurements are reported, per call.
+The best time is the most stable, so that is what gets compared against a baseline.
+
+A baseline is just a JSON file of results saved from an earlier run.  Save a baseline before
+making a change, then compare against it afterwards to demonstrate an optimization or to catch
+a regression.  Baselines are only meaningful on the machine and Python version where they were
+saved, so they are deliberately kept per machine rather than committed to the repository.
+
+Attributes:
+    BENCHMARKS(Dict[str, Benchmark]): All available benchmarks, by name
+"""
+
+import json
+import platform
+import statistics
+import timeit
+from collections.abc import Callable
+from pathlib import Path
+from random import Random
+
+from attrs import frozen
+
+from apologies.engine import Character, Engine
+from apologies.game import Card, CardType, Game, GameMode, PlayerColor
+from apologies.reward import RewardCalculatorV1
+from apologies.rules import BoardRules, Rules
+from apologies.source import RandomInputSource
+from apologies.util import create_rng
+
+# Default seed used to build fixtures for every benchmark
+_DEFAULT_SEED = 7
+
+# Number of turns played to set up the mid-game board used by most benchmarks
+_MIDGAME_TURNS = 40
+
+# Number of players in every game that is benchmarked
+_PLAYERS = 4
+
+
+@frozen
+class Benchmark:
+    """
+    A benchmark for a single hot path.
+
+    Attributes:
+        name(str): Name of the benchmark
+        setup(Callable[[Random], Callable[[], object]]): Builds fixtures from a random number generator, returning the function to time
+    """
+
+    name: str
+    setup: Callable[[Random], Callable[[], object]]
+
+
+@frozen
+class BenchmarkResult:
+    """
+    Result of running a benchmark.
+
+    Attributes:
+        name(str): Name of the benchmark
+        number(int): Number of calls in each measurement
+        best_ns(float): Best time per call across all measurements, in nanoseconds
+        median_ns(float): Median time per call across all measurements, in nanoseconds
+    """
+
+    name: str
+    number: int
+    best_ns: float
+    median_ns: float
+
+
+@frozen
+class Regression:
+    """
+    A benchmark that is slower than its baseline by more than the allowed tolerance.
+
+    Attributes:
+        name(str): Name of the benchmark
+        baseline_ns(float): Best time per call in the baseline, in nanoseconds
+        current_ns(float): Best time per call in the current run, in nanoseconds
+    """
+
+    name: str
+    baseline_ns: float
+    current_ns: float
+
+    @property
+    def ratio(self) -> float:
+        """Current time as a multiple of the baseline time."""
+        return self.current_ns / self.baseline_ns
+
+
+def _midgame(rng: Random) -> Game:
+    """Play random moves for a number of turns, returning a game with pawns spread around the board."""
+    rules = Rules(GameMode.STANDARD)
+    game = Game(_PLAYERS)
+    rules.start_game(game)
+    colors = list(game.players)
+    for turn in range(_MIDGAME_TURNS):
+        player = game.players[colors[turn % len(colors)]]
+        card = Card(f"{turn}", rng.choice(list(CardType)))
+        move = rng.choice(rules.construct_legal_moves(game.create_player_view(player.color), card))
+        rules.execute_move(game, player, move)
+    return game
+
+
+def _construct_legal_moves(cardtype: CardType) -> Callable[[Random], Callable[[], object]]:
+    """Benchmark BoardRules.construct_legal_moves() for every pawn of one player, using one type of card."""
+
+    def setup(rng: Random) -> Callable[[], object]:
+        view = _midgame(rng).create_player_view(PlayerColor.RED)
+        board_rules = BoardRules()
+        card = Card("0", cardtype)
+        all_pawns = view.all_pawns()
+        occupancy = BoardRules.occupancy(all_pawns)  # shared across all pawns, the same as in Rules.construct_legal_moves()
+        return lambda: [
+            board_rules.construct_legal_moves(PlayerColor.RED, card, pawn, all_pawns, occupancy) for pawn in view.player.pawns
+        ]
+
+    return setup
+
+
+def _evaluate_move(rng: Random) -> Callable[[], object]:
+    """Benchmark Rules.evaluate_move() for every legal move of a 7 card, on a mid-game board."""
+    view = _midgame(rng).create_player_view(PlayerColor.RED)
+    moves = Rules(GameMode.STANDARD).construct_legal_moves(view, Card("0", CardType.CARD_7))
+    return lambda: [Rules.evaluate_move(view, move) for move in moves]
+
+
+def _game_copy(rng: Random) -> Callable[[], object]:
+    """Benchmark Game.copy() on a mid-game board."""
+    return _midgame(rng).copy
+
+
+def _game_to_json(rng: Random) -> Callable[[], object]:
+    """Benchmark Game.to_json() on a mid-game board."""
+    return _midgame(rng).to_json
+
+
+def _game_from_json(rng: Random) -> Callable[[], object]:
+    """Benchmark Game.from_json() on a mid-game board."""
+    data = _midgame(rng).to_json()
+    return lambda: Game.from_json(data)
+
+
+def _deck_draw(rng: Random) -> Callable[[], object]:
+    """Benchmark Deck.draw(), discarding each card afterwards so the deck never runs out."""
+    deck = Game(_PLAYERS).deck
+    deck.rng = rng
+
+    def draw() -> None:
+        deck.discard(deck.draw())
+
+    return draw
+
+
+def _reward_calculate(rng: Random) -> Callable[[], object]:
+    """Benchmark RewardCalculatorV1.calculate() on a mid-game board."""
+    view = _midgame(rng).create_player_view(PlayerColor.RED)
+    calculator = RewardCalculatorV1()
+    return lambda: calculator.calculate(view)
+
+
+def _play_game(mode: GameMode) -> Callable[[Random], Callable[[], object]]:
+    """Benchmark a full game of Engine.play_next() calls with random players, playing the same game every time."""
+
+    def setup(rng: Random) -> Callable[[], object]:
+        seed = rng.getrandbits(32)
+
+        def play() -> None:
+            characters = [Character(f"Player {index}", RandomInputSource()) for index in range(_PLAYERS)]
+            engine = Engine(mode, characters, rng=seed)
+            engine.start_game()
+            while not engine.completed:
+                engine.play_next()
+
+        return play
+
+    return setup
+
+
+def _benchmarks() -> dict[str, Benchmark]:
+    """Build the set of all available benchmarks, by name."""
+    benchmarks = [
+        Benchmark(f"rules.construct_legal_moves.{cardtype.name}", _construct_legal_moves(cardtype)) for cardtype in CardType
+    ]
+    benchmarks += [
+        Benchmark("rules.evaluate_move", _evaluate_move),
+        Benchmark("game.copy", _game_copy),
+        Benchmark("game.to_json", _game_to_json),
+        Benchmark("game.from_json", _game_from_json),
+        Benchmark("deck.draw", _deck_draw),
+        Benchmark("reward.calculate", _reward_calculate),
+        Benchmark("engine.play_next.standard", _play_game(GameMode.STANDARD)),
+        Benchmark("engine.play_next.adult", _play_game(GameMode.ADULT)),
+    ]
+    return {benchmark.name: benchmark for benchmark in benchmarks}
+
+
+BENCHMARKS = _benchmarks()
+
+
+def run_benchmark(benchmark: Benchmark, repeat: int = 5, number: int | None = None, seed: int = _DEFAULT_SEED) -> BenchmarkResult:
+    """
+    Run a single benchmark.
+
+    Args:
+        benchmark(Benchmark): The benchmark to run
+        repeat(int): Number of measurements to take
+        number(int, optional): Number of calls per measurement, or None to calibrate automatically
+        seed(int): Seed for the random number generator used to build fixtures
+
+    Returns:
+        BenchmarkResult: Result of running the benchmark
+
+    Raises:
+        ValueError: If repeat or number is not positive
+    """
+    if repeat < 1 or (number is not None and number < 1):
+        raise ValueError("Repeat and number must be positive")
+    timer = timeit.Timer(benchmark.setup(create_rng(seed)))
+    number = number if number is not None else timer.autorange()[0]
+    timings = [1_000_000_000 * elapsed / number for elapsed in timer.repeat(repeat=repeat, number=number)]
+    return BenchmarkResult(benchmark.name, number, min(timings), statistics.median(timings))
+
+
+def save_baseline(path: str, results: list[BenchmarkResult]) -> None:
+    """Save results to a JSON file, for use as a baseline later."""
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {
+            result.name: {"number": result.number, "best_ns": result.best_ns, "median_ns": result.median_ns} for result in results
+        },
+    }
+    Path(path).write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+
+
+def load_baseline(path: str) -> list[BenchmarkResult]:
+    """Load results from a JSON file previously written by save_baseline()."""
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    return [
+        BenchmarkResult(name, result["number"], result["best_ns"], result["median_ns"]) for name, result in data["results"].items()
+    ]
+
+
+def compare_baseline(results: list[BenchmarkResult], baseline: list[BenchmarkResult], tolerance: float = 0.1) -> list[Regression]:
+    """
+    Compare results against a baseline, returning any regressions.
+
+    A benchmark has regressed if its best time is more than (1 + tolerance) times its best time in
+    the baseline.  Benchmarks that don't appear in the baseline are ignored.
+
+    Args:
+        results(List[BenchmarkResult]): Results from the current run
+        baseline(List[BenchmarkResult]): Results from the baseline
+        tolerance(float): Allowed slowdown, as a fraction of the baseline time
+
+    Returns:
+        List[Regression]: Benchmarks that are slower than the baseline by more than the tolerance
+    """
+    previous = {result.name: result for result in baseline}
+    return [
+        Regression(result.name, previous[result.name].best_ns, result.best_ns)
+        for result in results
+        if result.name in previous and result.best_ns > (1 + tolerance) * previous[result.name].best_ns
+    ]
+
+
+def _format_ns(value: float) -> str:
+    """Format a time in nanoseconds using a sensible unit."""
+    for unit, scale in [("s", 1_000_000_000), ("ms", 1_000_000), ("us", 1_000)]:
+        if value >= scale:
+            return f"{value / scale:.2f} {unit}"
+    return f"{value:.0f} ns"
+
+
+# pylint: disable=too-many-locals
+def run_benchmarks(  # noqa: PLR0913,PLR0917
+    names: list[str] | None = None,
+    repeat: int = 5,
+    number: int | None = None,
+    seed: int = _DEFAULT_SEED,
+    save: str | None = None,
+    baseline: str | None = None,
+    tolerance: float = 0.1,
+) -> list[Regression]:
+    """
+    Run benchmarks, displaying results and optionally comparing them against a baseline.
+
+    Args:
+        names(List[str], optional): Run only benchmarks whose name contains one of these strings, or None to run all benchmarks
+        repeat(int): Number of measurements to take for each benchmark
+        number(int, optional): Number of calls per measurement, or None to calibrate automatically
+        seed(int): Seed for the random number generator used to build fixtures
+        save(str, optional): Path to a JSON file to save results into, for use as a baseline later
+        baseline(str, optional): Path to a JSON file of baseline results to compare against
+        tolerance(float): Allowed slowdown relative to the baseline, as a fraction of the baseline time
+
+    Returns:
+        List[Regression]: Benchmarks that are slower than the baseline, empty if there is no baseline
+
+    Raises:
+        ValueError: If no benchmarks match the passed-in names
+    """
+    selected = [benchmark for name, benchmark in BENCHMARKS.items() if not names or any(match in name for match in names)]
+    if not selected:
+        raise ValueError("No benchmarks match the passed-in names")
+
+    previous = {result.name: result for result in load_baseline(baseline)} if baseline else {}
+    results = []
+    print(f"{'Benchmark':<45} {'Calls':>8} {'Best':>12} {'Median':>12} {'Baseline':>12}")
+    for benchmark in selected:
+        result = run_benchmark(benchmark, repeat=repeat, number=number, seed=seed)
+        results.append(result)
+        compared = f"{result.best_ns / previous[result.name].best_ns:.2f}x" if result.name in previous else ""
+        print(
+            f"{result.name:<45} {result.number:>8} {_format_ns(result.best_ns):>12} {_format_ns(result.median_ns):>12} {compared:>12}"
+        )
+
+    if save:
+        save_baseline(save, results)
+
+    regressions = compare_baseline(results, list(previous.values()), tolerance)
+    for regression in regressions:
+        print(f"Regression: {regression.name} is {regression.ratio:.2f}x its baseline time")
+    return regressions
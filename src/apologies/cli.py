@@ -9,6 +9,7 @@
 import sys
 from typing import IO, Any
 
+from apologies.benchmark import run_benchmarks
 from apologies.demo import run_demo
 from apologies.game import MAX_PLAYERS, Game, GameMode
 from apologies.render import render_board
@@ -25,6 +26,11 @@
 # Constants used by the simulation CLI
 _SIM_DEFAULT_ITERATIONS = 10
 _SIM_DEFAULT_OUT = "simulation.csv"
+_SIM_DEFAULT_WORKERS = 1
+
+# Constants used by the benchmark CLI
+_BENCH_DEFAULT_REPEAT = 5
+_BENCH_DEFAULT_TOLERANCE = 0.1
 
 
 def demo(argv: list[str], _stdout: IO[str], _stderr: IO[str]) -> None:
@@ -101,6 +107,27 @@ def simulation(argv: list[str], _stdout: IO[str], _stderr: IO[str]) -> None:
         help="Path to the output CSV file",
     )
 
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=_SIM_DEFAULT_WORKERS,
+        help="Number of worker processes, or 0 to use one per CPU",
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed, to replay a previous simulation",
+    )
+
+    parser.add_argument(
+        "--results",
+        type=str,
+        default=None,
+        help="Path to a .csv or .jsonl file to stream per-game results into",
+    )
+
     parser.add_argument(
         "source",
         type=str,
@@ -114,12 +141,83 @@ def simulation(argv: list[str], _stdout: IO[str], _stderr: IO[str]) -> None:
     if args.iter <= 0:
         errors.append("simulation: error: there must be at least 1 iteration")
 
+    if args.workers < 0:
+        errors.append("simulation: error: the number of workers must not be negative")
+
+    if errors:
+        parser.print_usage()
+        print("\n".join(errors))
+        sys.exit(1)
+
+    sources = [source(s) for s in args.source]
+    run_simulation(
+        iterations=args.iter, output=args.out, sources=sources, workers=args.workers, seed=args.seed, results=args.results
+    )
+
+
+def benchmark(argv: list[str], _stdout: IO[str], _stderr: IO[str]) -> None:
+    """Run micro-benchmarks and display results."""
+    parser = argparse.ArgumentParser(
+        description="Run micro-benchmarks for the hot paths in the rules, the engine, copying and serialization.",
+        epilog="Fixtures are built from a fixed seed, so every run times the same work.  Save results "
+        "as a baseline, and then compare a later run against that baseline to catch a regression "
+        "or demonstrate an optimization.  The exit status is 1 if any benchmark regressed.",
+    )
+
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=_BENCH_DEFAULT_REPEAT,
+        help="Number of measurements to take for each benchmark",
+    )
+
+    parser.add_argument(
+        "--save",
+        type=str,
+        default=None,
+        help="Path to a JSON file to save results into, for use as a baseline",
+    )
+
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=None,
+        help="Path to a JSON file of baseline results to compare against",
+    )
+
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=_BENCH_DEFAULT_TOLERANCE,
+        help="Allowed slowdown relative to the baseline, as a fraction of the baseline time",
+    )
+
+    parser.add_argument(
+        "name",
+        type=str,
+        nargs="*",
+        help="Run only benchmarks whose name contains one of these strings",
+    )
+
+    args = parser.parse_args(args=argv[1:])
+
+    errors = []
+    if args.repeat <= 0:
+        errors.append("benchmark: error: there must be at least 1 repeat")
+
+    if args.tolerance < 0:
+        errors.append("benchmark: error: the tolerance must not be negative")
+
     if errors:
         parser.print_usage()
         print("\n".join(errors))
         sys.exit(1)
 
-    run_simulation(iterations=args.iter, output=args.out, sources=[source(s) for s in args.source])
+    regressions = run_benchmarks(
+        names=args.name, repeat=args.repeat, save=args.save, baseline=args.baseline, tolerance=args.tolerance
+    )
+    if regressions:
+        sys.exit(1)
 
 
 def render(_argv: list[str], stdout: IO[str], _stderr: IO[str]) -> None:
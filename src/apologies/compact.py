@@ -0,0 +1,319 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+
+"""
+Compact, integer-encoded representations of game state.
+
+The classes in the game module are convenient to work with, but they are relatively
+expensive to copy, since every player, pawn and position is a separate object.  The
+classes in this module encode the same information as a small set of flat containers,
+which makes them cheap to copy and hash.  This is intended for use by simulations and
+by character input sources that need to search through many possible future states.
+
+Each pawn position is encoded as a small integer, a "position code".  Squares on the
+board use codes 0-59 (the square number itself), squares in the safe area use codes
+60-64, home is 65 and start is 66.  Pawn positions are stored in a bytearray, with
+PAWNS entries per player, in the same order that players appear in the game.
+
+Conversion to and from the classes in the game module is lossless.
+
+The placement of pawns can also be summarized as a Zobrist hash: the exclusive-or of a random
+64-bit number for each pawn at its position.  When a pawn moves, the hash can be updated
+incrementally by xor-ing out the number for its old position and xor-ing in the number for its
+new position, so a search never needs to rehash the whole board.  The random numbers come from
+a fixed seed, so a hash is stable from one run to the next.
+
+Attributes:
+    SAFE_BASE(int): Position code for the first square in the safe area
+    HOME_CODE(int): Position code for the home area
+    START_CODE(int): Position code for the start area
+    POSITION_CODES(int): Total number of distinct position codes
+    ZOBRIST(Dict[PlayerColor, Tuple[Tuple[int, ...], ...]]): Zobrist numbers, indexed by [color][pawn index][position code]
+"""
+
+import random
+from collections.abc import Iterable
+
+from attrs import define, field
+
+from apologies.game import (
+    BOARD_SQUARES,
+    PAWNS,
+    SAFE_SQUARES,
+    Card,
+    Deck,
+    Game,
+    History,
+    Pawn,
+    Player,
+    PlayerColor,
+    PlayerView,
+    Position,
+)
+
+SAFE_BASE = BOARD_SQUARES
+HOME_CODE = SAFE_BASE + SAFE_SQUARES
+START_CODE = HOME_CODE + 1
+POSITION_CODES = START_CODE + 1
+
+
+def _build_zobrist() -> dict[PlayerColor, tuple[tuple[int, ...], ...]]:
+    """Build the table of Zobrist numbers, with a random 64-bit number for each (color, pawn index, position code)."""
+    rng = random.Random(0)  # noqa: S311 # a fixed seed, so hashes are stable from one run to the next
+    return {color: tuple(tuple(rng.getrandbits(64) for _ in range(POSITION_CODES)) for _ in range(PAWNS)) for color in PlayerColor}
+
+
+ZOBRIST = _build_zobrist()
+
+
+def encode_position(position: Position) -> int:
+    """
+    Encode a position as a position code.
+
+    Raises:
+        ValueError: If the position is in an illegal state
+    """
+    if position.home:
+        return HOME_CODE
+    if position.start:
+        return START_CODE
+    if position.safe is not None:
+        return SAFE_BASE + position.safe
+    if position.square is not None:
+        return position.square
+    raise ValueError("Position is in an illegal state")
+
+
+def decode_position(code: int) -> Position:
+    """
+    Decode a position code into a new position.
+
+    Raises:
+        ValueError: If the position code is not valid
+    """
+    if code < SAFE_BASE:
+        return Position(start=False, square=code)
+    if code < HOME_CODE:
+        return Position(start=False, safe=code - SAFE_BASE)
+    if code == HOME_CODE:
+        return Position(start=False, home=True)
+    if code == START_CODE:
+        return Position()
+    raise ValueError("Invalid position code")
+
+
+def zobrist_hash(pawns: Iterable[Pawn]) -> int:
+    """Return the Zobrist hash for the placement of a set of pawns."""
+    result = 0
+    for pawn in pawns:
+        result ^= ZOBRIST[pawn.color][pawn.index][encode_position(pawn.position)]
+    return result
+
+
+def zobrist_update(value: int, pawn: Pawn, old: int, new: int) -> int:
+    """Update a Zobrist hash incrementally, for a pawn that moved from one position code to another."""
+    numbers = ZOBRIST[pawn.color][pawn.index]
+    return value ^ numbers[old] ^ numbers[new]
+
+
+def _zobrist_codes(colors: tuple[PlayerColor, ...], pawns: bytearray) -> int:
+    """Return the Zobrist hash for encoded pawns, with PAWNS entries per player."""
+    result = 0
+    for player, color in enumerate(colors):
+        numbers = ZOBRIST[color]
+        for index in range(PAWNS):
+            result ^= numbers[index][pawns[player * PAWNS + index]]
+    return result
+
+
+def _encode_pawns(players: list[Player]) -> bytearray:
+    """Encode the positions of all pawns for a list of players."""
+    return bytearray(encode_position(pawn.position) for player in players for pawn in player.pawns)
+
+
+def _decode_pawns(color: PlayerColor, pawns: bytearray, offset: int) -> list[Pawn]:
+    """Decode the positions for one player's pawns, starting at an offset into the encoded pawns."""
+    return [Pawn(color, index, position=decode_position(pawns[offset + index])) for index in range(PAWNS)]
+
+
+@define
+class CompactGame:
+    # noinspection PyUnresolvedReferences
+    """
+    A compact representation of a game.
+
+    Callers should generally create a compact game using from_game(), rather than
+    passing in constructor arguments.
+
+    Attributes:
+        colors(Tuple[PlayerColor, ...]): Color of each player in the game, in order
+        pawns(bytearray): Position code for each pawn, with PAWNS entries per player
+        turns(List[int]): Number of turns for each player
+        hands(List[List[Card]]): Cards in each player's hand
+        draw_pile(List[Card]): Cards in the draw pile, in order
+        discard_pile(List[Card]): Cards in the discard pile, in order
+        history(Tuple[History, ...]): Game history, which is carried along but never modified
+    """
+
+    colors: tuple[PlayerColor, ...]
+    pawns: bytearray
+    turns: list[int]
+    hands: list[list[Card]]
+    draw_pile: list[Card] = field(factory=list)
+    discard_pile: list[Card] = field(factory=list)
+    history: tuple[History, ...] = ()
+
+    @property
+    def playercount(self) -> int:
+        """Number of players in the game."""
+        return len(self.colors)
+
+    @property
+    def completed(self) -> bool:
+        """Whether the game is completed."""
+        return self.winner is not None
+
+    @property
+    def winner(self) -> PlayerColor | None:
+        """The color of the winner of the game, if any."""
+        for player, color in enumerate(self.colors):
+            offset = player * PAWNS
+            if self.pawns[offset : offset + PAWNS].count(HOME_CODE) == PAWNS:
+                return color
+        return None
+
+    @staticmethod
+    def from_game(game: Game) -> "CompactGame":
+        """Create a compact representation of a game."""
+        players = list(game.players.values())
+        return CompactGame(
+            colors=tuple(player.color for player in players),
+            pawns=_encode_pawns(players),
+            turns=[player.turns for player in players],
+            hands=[player.hand[:] for player in players],
+            draw_pile=game.deck._draw_pile[:],  # noqa: SLF001
+            discard_pile=game.deck._discard_pile[:],  # noqa: SLF001
+            history=tuple(game.history),
+        )
+
+    def to_game(self) -> Game:
+        """Convert the compact representation back into a fully-independent game."""
+        players = {}
+        for player, color in enumerate(self.colors):
+            pawns = _decode_pawns(color, self.pawns, player * PAWNS)
+            players[color] = Player(color, hand=self.hands[player][:], pawns=pawns, turns=self.turns[player])
+        deck = Deck(draw_pile=self.draw_pile[:], discard_pile=self.discard_pile[:])
+        history = [entry.copy() for entry in self.history]
+        return Game(playercount=self.playercount, players=players, deck=deck, history=history)
+
+    def copy(self) -> "CompactGame":
+        """Return a fully-independent copy of the compact game."""
+        return CompactGame(
+            colors=self.colors,
+            pawns=self.pawns[:],
+            turns=self.turns[:],
+            hands=[hand[:] for hand in self.hands],
+            draw_pile=self.draw_pile[:],
+            discard_pile=self.discard_pile[:],
+            history=self.history,
+        )
+
+    def key(self) -> bytes:
+        """Return a hashable key that identifies the placement of all pawns on the board."""
+        return bytes(self.pawns)
+
+    def zobrist(self) -> int:
+        """Return the Zobrist hash for the placement of all pawns on the board."""
+        return _zobrist_codes(self.colors, self.pawns)
+
+    def offset(self, color: PlayerColor) -> int:
+        """
+        Return the offset of a player's first pawn within the encoded pawns.
+
+        Raises:
+            ValueError: If the color is not part of the game
+        """
+        return self.colors.index(color) * PAWNS
+
+    def position(self, pawn: Pawn) -> int:
+        """Return the position code for a pawn."""
+        return self.pawns[self.offset(pawn.color) + pawn.index]
+
+    def create_player_view(self, color: PlayerColor) -> "CompactView":
+        """Return a compact player-specific view of the game."""
+        player = self.colors.index(color)
+        return CompactView(color, self.colors, self.pawns[:], self.turns[:], self.hands[player][:])
+
+
+@define
+class CompactView:
+    # noinspection PyUnresolvedReferences
+    """
+    A compact representation of a player view.
+
+    Callers should generally create a compact view using from_view() or
+    CompactGame.create_player_view(), rather than passing in constructor arguments.
+
+    Attributes:
+        color(PlayerColor): The color of the player associated with the view
+        colors(Tuple[PlayerColor, ...]): Color of each player in the view, in order
+        pawns(bytearray): Position code for each pawn, with PAWNS entries per player
+        turns(List[int]): Number of turns for each player
+        hand(List[Card]): Cards in the hand of the player associated with the view
+    """
+
+    color: PlayerColor
+    colors: tuple[PlayerColor, ...]
+    pawns: bytearray
+    turns: list[int]
+    hand: list[Card] = field(factory=list)
+
+    @staticmethod
+    def from_view(view: PlayerView) -> "CompactView":
+        """Create a compact representation of a player view."""
+        players = [view.player, *view.opponents.values()]
+        return CompactView(
+            color=view.player.color,
+            colors=tuple(player.color for player in players),
+            pawns=_encode_pawns(players),
+            turns=[player.turns for player in players],
+            hand=view.player.hand[:],
+        )
+
+    def to_view(self) -> PlayerView:
+        """Convert the compact representation back into a fully-independent player view."""
+        player = None
+        opponents = {}
+        for index, color in enumerate(self.colors):
+            pawns = _decode_pawns(color, self.pawns, index * PAWNS)
+            if color == self.color:
+                player = Player(color, hand=self.hand[:], pawns=pawns, turns=self.turns[index])
+            else:
+                opponents[color] = Player(color, pawns=pawns, turns=self.turns[index])
+        if player is None:
+            raise ValueError("Player is not part of the view")
+        return PlayerView(player, opponents)
+
+    def copy(self) -> "CompactView":
+        """Return a fully-independent copy of the compact view."""
+        return CompactView(self.color, self.colors, self.pawns[:], self.turns[:], self.hand[:])
+
+    def key(self) -> bytes:
+        """Return a hashable key that identifies the placement of all pawns on the board."""
+        return bytes(self.pawns)
+
+    def zobrist(self) -> int:
+        """Return the Zobrist hash for the placement of all pawns on the board."""
+        return _zobrist_codes(self.colors, self.pawns)
+
+    def offset(self, color: PlayerColor) -> int:
+        """
+        Return the offset of a player's first pawn within the encoded pawns.
+
+        Raises:
+            ValueError: If the color is not part of the view
+        """
+        return self.colors.index(color) * PAWNS
+
+    def position(self, pawn: Pawn) -> int:
+        """Return the position code for a pawn."""
+        return self.pawns[self.offset(pawn.color) + pawn.index]
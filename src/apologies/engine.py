@@ -1,19 +1,95 @@
 # vim: set ft=python ts=4 sw=4 expandtab:
-# ruff: noqa: S311
 
 """
 Game engine that coordinates character actions to play a game.
 """
 
+import asyncio
 import random
-from collections.abc import Callable
+import time
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from enum import Enum
+from functools import partial
 
 from attrs import define, field
 
-from apologies.game import Card, Game, GameMode, Player, PlayerColor, PlayerView
-from apologies.rules import Move, Rules
-from apologies.source import CharacterInputSource
-from apologies.util import CircularQueue
+from apologies.game import Card, Game, GameMode, HistoryMode, Player, PlayerColor, PlayerView
+from apologies.rules import LegalMoveCache, Move, Rules
+from apologies.source import AsyncCharacterInputSource, CharacterInputSource, NoOpInputSource
+from apologies.util import CircularQueue, create_rng
+
+
+class EnginePhase(Enum):
+    """Enumeration of the phases of play that can be profiled."""
+
+    CREATE_PLAYER_VIEW = "create_player_view"  # Creating the player view that the character's move is based on
+    CONSTRUCT_LEGAL_MOVES = "construct_legal_moves"  # Drawing a card if necessary, and constructing legal moves
+    CHOOSE_MOVE = "choose_move"  # The character's input source choosing a move
+    EXECUTE_MOVE = "execute_move"  # Executing the move, including any discard and draw
+    TURN = "turn"  # An entire turn, including transaction bookkeeping (journal and rollback) not covered by other phases
+
+
+@define
+class PhaseTiming:
+    # noinspection PyUnresolvedReferences
+    """
+    Wall time and number of calls recorded for a phase of play.
+
+    Attributes:
+        calls(int): Number of times the phase was recorded
+        total_ns(int): Total wall time spent in the phase, in nanoseconds
+    """
+
+    calls: int = 0
+    total_ns: int = 0
+
+    @property
+    def mean_ns(self) -> float | None:
+        """Mean wall time per call, in nanoseconds, or None if there have been no calls."""
+        return self.total_ns / self.calls if self.calls else None
+
+    def add(self, elapsed_ns: int, calls: int = 1) -> None:
+        """Add wall time for one or more calls."""
+        self.calls += calls
+        self.total_ns += elapsed_ns
+
+
+@define
+class EngineProfiler:
+    # noinspection PyUnresolvedReferences
+    """
+    Records wall time and call counts for each phase of Engine.play_next().
+
+    Timings are grouped by the name of the character input source that was playing, so a
+    single profiler can aggregate timings across characters, and across many games.
+
+    Attributes:
+        timings(Dict[str, Dict[EnginePhase, PhaseTiming]]): Timings for each phase, by source name
+    """
+
+    timings: dict[str, dict[EnginePhase, PhaseTiming]] = field(factory=dict)
+
+    def record(self, name: str, phase: EnginePhase, elapsed_ns: int) -> None:
+        """Record wall time for one call to a phase of play, for a source."""
+        self.timing(name, phase).add(elapsed_ns)
+
+    def timing(self, name: str, phase: EnginePhase) -> PhaseTiming:
+        """Return the timing for a phase of play for a source, which is empty if nothing has been recorded."""
+        return self.timings.setdefault(name, {}).setdefault(phase, PhaseTiming())
+
+    @contextmanager
+    def measure(self, name: str, phase: EnginePhase) -> Iterator[None]:
+        """Context manager that records the wall time spent within the context, for a source."""
+        start = time.perf_counter_ns()
+        yield
+        self.record(name, phase, time.perf_counter_ns() - start)
+
+    def merge(self, other: "EngineProfiler") -> None:
+        """Merge timings from another profiler into this one."""
+        for name, phases in other.timings.items():
+            for phase, timing in phases.items():
+                self.timing(name, phase).add(timing.total_ns, timing.calls)
 
 
 @define(slots=False)
@@ -66,14 +142,36 @@ class Engine:
     train a machine learning model or to play the game in an asynchronous
     event-driven environment).
 
+    All random choices made by the engine (the first player, cards drawn from the deck,
+    and the replacement for an illegal move) come from the engine's random number generator.
+    The same generator is shared with each character's input source when the game starts.
+    Pass in a seed to make a game reproducible.
+
+    For batch play, such as a simulation, pass in HistoryMode.GENERAL.  Then, the
+    per-move history is not tracked, which avoids building a log message and a timestamp
+    for every move.  Turn counts and game completion still work as normal.  To avoid
+    reconstructing the same legal moves over and over, pass in a LegalMoveCache, which
+    can also be shared across many engines.
+
+    To find out where the time goes during play, pass in an EngineProfiler.  Then, the
+    wall time for each phase of play_next() is recorded, grouped by character input source.
+
     Attributes:
         mode(GameMode): The game mode
         characters(List[Character]): Characters playing the game
+        rng(Random): Random number generator, optionally created from a seed passed to the constructor
+        history_mode(HistoryMode): Controls which actions are tracked in the game history
+        legal_move_cache(LegalMoveCache, optional): Cache of legal moves, passed along to the rules
+        profiler(EngineProfiler, optional): Records timings for each phase of play, if provided
         first(PlayerColor): The first player, chosen randomly by default
     """
 
     mode: GameMode
     characters: list[Character]
+    rng: random.Random = field(default=None, converter=create_rng, kw_only=True)
+    history_mode: HistoryMode = field(default=HistoryMode.FULL, kw_only=True)
+    legal_move_cache: LegalMoveCache | None = field(default=None, kw_only=True)
+    profiler: EngineProfiler | None = field(default=None, kw_only=True)
     first: PlayerColor = field()
     _game: Game = field(init=False)
     _queue: CircularQueue[PlayerColor] = field(init=False)
@@ -83,12 +181,15 @@ class Engine:
     # noinspection PyUnresolvedReferences
     @first.default
     def _default_first(self) -> PlayerColor:
-        return random.choice(list(PlayerColor)[: len(self.characters)])
+        return self.rng.choice(list(PlayerColor)[: len(self.characters)])
 
     # noinspection PyUnresolvedReferences
     @_game.default
     def _default_game(self) -> Game:
-        return Game(playercount=len(self.characters))
+        game = Game(playercount=len(self.characters))
+        game.deck.rng = self.rng
+        game.history_mode = self.history_mode
+        return game
 
     # noinspection PyUnresolvedReferences
     @_queue.default
@@ -98,7 +199,7 @@ def _default_queue(self) -> CircularQueue[PlayerColor]:
     # noinspection PyUnresolvedReferences
     @_rules.default
     def _default_rules(self) -> Rules:
-        return Rules(self.mode)
+        return Rules(self.mode, cache=self.legal_move_cache)
 
     # noinspection PyUnresolvedReferences
     @_map.default
@@ -147,11 +248,43 @@ def winner(self) -> tuple[Character, Player]:
             raise ValueError("Game is not completed")
         return self._map[self._game.winner.color], self._game.winner
 
+    @property
+    def next_color(self) -> PlayerColor:
+        """Color of the player who will take the next turn."""
+        return self._queue.peek()
+
     def reset(self) -> Game:
         """Reset game state."""
         self._game = self._default_game()
         return self._game
 
+    def restore(self, game: Game) -> Game:
+        """
+        Replace game state with a saved game, such as one loaded via Game.from_json().
+
+        The saved game draws cards using this engine's random number generator, and tracks
+        history using this engine's history mode.  Turns continue from this engine's next
+        player, so construct the engine with `first` set to the player whose turn was next
+        when the game was saved.
+
+        Args:
+            game(Game): The saved game
+
+        Returns:
+            Game: Current state of the game.
+
+        Raises:
+            ValueError: If the saved game has a different number of players than this engine
+        """
+        if game.playercount != self.players:
+            raise ValueError("Saved game has the wrong number of players")
+        game.deck.rng = self.rng
+        game.history_mode = self.history_mode
+        self._game = game
+        for character in self.characters:
+            character.source.rng = self.rng
+        return self._game
+
     def start_game(self) -> Game:
         """
         Start the game, returning game state.
@@ -159,6 +292,8 @@ def start_game(self) -> Game:
         Returns:
             Game: Current state of the game.
         """
+        for character in self.characters:
+            character.source.rng = self.rng
         self._rules.start_game(self._game)
         return self._game
 
@@ -181,19 +316,23 @@ def play_next(self) -> Game:
         if self.completed:
             raise ValueError("Game is complete")
 
-        saved = self._game.copy()
-        try:
+        start = time.perf_counter_ns()
+        with self._game.transaction():  # changes are rolled back if this raises, so a failed call is idempotent
             color, character = self.next_turn()
             done = False
             while not done:
-                view = self._game.create_player_view(color)
+                with self._measure(character, EnginePhase.CREATE_PLAYER_VIEW):
+                    view = self._game.create_player_view(color)
                 move = self.choose_next_move(character, view)
-                done = self.execute_move(color, move)
-        except Exception:
-            self._game = saved  # put back original so a failed call is idempotent
-            raise
-        else:
-            return self._game
+                with self._measure(character, EnginePhase.EXECUTE_MOVE):
+                    done = self.execute_move(color, move)
+        if self.profiler is not None:
+            self.profiler.record(character.source.name, EnginePhase.TURN, time.perf_counter_ns() - start)
+        return self._game
+
+    def _measure(self, character: Character, phase: EnginePhase) -> AbstractContextManager[None]:
+        """Return a context manager that records time spent in a phase of play, if a profiler is in use."""
+        return nullcontext() if self.profiler is None else self.profiler.measure(character.source.name, phase)
 
     def draw(self) -> Card:
         """Draw a random card from the game's draw pile."""
@@ -210,11 +349,13 @@ def construct_legal_moves(self, view: PlayerView, card: Card | None = None) -> t
 
     def choose_next_move(self, character: Character, view: PlayerView) -> Move:
         """Choose the next move for a character based on a player view."""
-        _, legal_moves = self.construct_legal_moves(view)
-        move = character.choose_move(self.mode, view, legal_moves[:], Rules.evaluate_move)
+        with self._measure(character, EnginePhase.CONSTRUCT_LEGAL_MOVES):
+            _, legal_moves = self.construct_legal_moves(view)
+        with self._measure(character, EnginePhase.CHOOSE_MOVE):
+            move = character.choose_move(self.mode, view, legal_moves[:], Rules.evaluate_move)
         if move not in legal_moves:  # an illegal move is ignored and we choose randomly for the character
             self._game.track("Illegal move: a random legal move will be chosen", view.player)
-            move = random.choice(legal_moves)
+            move = self.rng.choice(legal_moves)
         return move
 
     def execute_move(self, color: PlayerColor, move: Move) -> bool:
@@ -237,13 +378,282 @@ def _execute_move_standard(self, player: Player, move: Move) -> bool:
     def _execute_move_adult(self, player: Player, move: Move) -> bool:
         """Play the next move under the rules for adult mode, returning True if the player's turn is done."""
         if not move.actions:
-            player.hand.remove(move.card)
+            self._remove_from_hand(player, move.card)
             self.discard(move.card)
-            player.hand.append(self.draw())
+            self._add_to_hand(player, self.draw())
             self._game.track(f"Turn is forfeit; discarded card {move.card.cardtype.value}", player, move.card)
             return True  # player's turn is done if they forfeit
         self._rules.execute_move(self._game, player, move)  # tracks history, potentially completes game
-        player.hand.remove(move.card)
+        self._remove_from_hand(player, move.card)
         self.discard(move.card)
-        player.hand.append(self.draw())
+        self._add_to_hand(player, self.draw())
         return self.completed or not self._rules.draw_again(move.card)  # player's turn is done unless they can draw again
+
+    def _remove_from_hand(self, player: Player, card: Card) -> None:
+        """Remove a card from a player's hand, recording the change if a transaction is in progress."""
+        index = player.hand.index(card)
+        del player.hand[index]
+        if self._game.journal is not None:
+            self._game.journal.record(partial(player.hand.insert, index, card))
+
+    def _add_to_hand(self, player: Player, card: Card) -> None:
+        """Add a card to a player's hand, recording the change if a transaction is in progress."""
+        player.hand.append(card)
+        if self._game.journal is not None:
+            self._game.journal.record(player.hand.pop)
+
+
+@define(slots=False)
+class AsyncCharacter:
+    # noinspection PyUnresolvedReferences
+    """
+    A character that plays a game via AsyncEngine, taking moves from an asynchronous input source.
+
+    Attributes:
+        name(str): The name of this character
+        source(AsyncCharacterInputSource): The asynchronous character input source from which moves are taken
+    """
+
+    name: str
+    source: AsyncCharacterInputSource
+
+    async def choose_move(
+        self, mode: GameMode, view: PlayerView, legal_moves: list[Move], evaluator: Callable[[PlayerView, Move], PlayerView]
+    ) -> Move:
+        """
+        Choose the next move for a character via the asynchronous input source.
+
+        Args:
+            mode(GameMode): Game mode
+            view(PlayerView): Player-specific view of the game
+            legal_moves(Set[Move]): The set of legal moves
+            evaluator(Callable[[PlayerView, Move], PlayerView]): Function to evaluate a move, returning new state
+
+        Returns:
+            Move: The character's next as chosen by the configured source
+        """
+        return await self.source.choose_move(mode, view, legal_moves, evaluator)
+
+
+@define
+class AsyncEngine:
+    # noinspection PyUnresolvedReferences
+    """
+    Game engine that coordinates asynchronous character actions in a game.
+
+    This works just like Engine, except that play_next() is a coroutine that awaits each
+    character's move.  While one game waits on a character (for instance, a person answering
+    over a websocket), the event loop can play turns in other games, so a single event loop
+    can drive many concurrent games::
+
+        engine.start_game()
+        while not engine.completed:
+            state = await engine.play_next()
+
+    Game rules, bookkeeping and random choices are delegated to an underlying Engine, so a
+    game played by an AsyncEngine is identical to one played by an Engine with the same seed
+    and the same choices.  Turns for a single engine must be played one at a time.  If a turn
+    fails or is cancelled, all changes made during the turn are rolled back, and the next call
+    to play_next() retries the turn for the same player.
+
+    To keep a slow or absent character from stalling the game, pass in a move deadline.  If
+    a character doesn't choose a move within the deadline, the choice is cancelled and a
+    random legal move is chosen instead, just like for an illegal move.
+
+    Attributes:
+        mode(GameMode): The game mode
+        characters(List[AsyncCharacter]): Characters playing the game
+        rng(Random): Random number generator, optionally created from a seed passed to the constructor
+        history_mode(HistoryMode): Controls which actions are tracked in the game history
+        legal_move_cache(LegalMoveCache, optional): Cache of legal moves, passed along to the rules
+        profiler(EngineProfiler, optional): Records timings for each phase of play, if provided
+        move_deadline(float, optional): Time allowed for a character to choose each move, in seconds
+        first(PlayerColor): The first player, chosen randomly by default
+        missed_deadlines(int): Number of moves chosen randomly because a character missed the deadline
+    """
+
+    mode: GameMode
+    characters: list[AsyncCharacter]
+    rng: random.Random = field(default=None, converter=create_rng, kw_only=True)
+    history_mode: HistoryMode = field(default=HistoryMode.FULL, kw_only=True)
+    legal_move_cache: LegalMoveCache | None = field(default=None, kw_only=True)
+    profiler: EngineProfiler | None = field(default=None, kw_only=True)
+    move_deadline: float | None = field(default=None, kw_only=True)
+    first: PlayerColor = field()
+    missed_deadlines: int = field(init=False, default=0)
+    _engine: Engine = field(init=False)
+    _map: dict[PlayerColor, AsyncCharacter] = field(init=False)
+    _turn: tuple[PlayerColor, AsyncCharacter] | None = field(init=False, default=None)
+    _playing: bool = field(init=False, default=False)
+
+    # noinspection PyUnresolvedReferences
+    @first.default
+    def _default_first(self) -> PlayerColor:
+        return self.rng.choice(list(PlayerColor)[: len(self.characters)])
+
+    # noinspection PyUnresolvedReferences
+    @_engine.default
+    def _default_engine(self) -> Engine:
+        characters = [Character(character.name, NoOpInputSource()) for character in self.characters]  # moves never come from here
+        return Engine(
+            self.mode,
+            characters,
+            rng=self.rng,
+            history_mode=self.history_mode,
+            legal_move_cache=self.legal_move_cache,
+            first=self.first,
+        )
+
+    # noinspection PyUnresolvedReferences
+    @_map.default
+    def _default_map(self) -> dict[PlayerColor, AsyncCharacter]:
+        result = {}
+        for index, player in enumerate(self._engine.game.players.values(), start=0):
+            result[player.color] = self.characters[index]
+        return result
+
+    @property
+    def players(self) -> int:
+        """Number of players in the game."""
+        return len(self.characters)
+
+    @property
+    def state(self) -> str:
+        """String describing the state of the game."""
+        return self._engine.state
+
+    @property
+    def game(self) -> Game:
+        """A reference to the underlying game."""
+        return self._engine.game
+
+    @property
+    def started(self) -> bool:
+        """Whether the game is started."""
+        return self._engine.started
+
+    @property
+    def completed(self) -> bool:
+        """Whether the game is completed."""
+        return self._engine.completed
+
+    @property
+    def playing(self) -> bool:
+        """Whether a turn is currently being played."""
+        return self._playing
+
+    @property
+    def colors(self) -> dict[PlayerColor, AsyncCharacter]:
+        return self._map.copy()
+
+    def winner(self) -> tuple[AsyncCharacter, Player]:
+        """Return the winner of the game, as a tuple of (AsyncCharacter, Player)"""
+        _, player = self._engine.winner()
+        return self._map[player.color], player
+
+    @property
+    def next_color(self) -> PlayerColor:
+        """Color of the player who will take the next turn."""
+        return self._turn[0] if self._turn is not None else self._engine.next_color
+
+    def reset(self) -> Game:
+        """Reset game state."""
+        self._turn = None
+        return self._engine.reset()
+
+    def restore(self, game: Game) -> Game:
+        """
+        Replace game state with a saved game, such as one loaded via Game.from_json().
+
+        This works like Engine.restore(), so construct the engine with `first` set to
+        the player whose turn was next when the game was saved.
+
+        Raises:
+            ValueError: If the saved game has a different number of players, or if a turn is being played
+        """
+        if self._playing:
+            raise ValueError("A turn is already being played")
+        for character in self.characters:
+            character.source.rng = self.rng
+        self._turn = None
+        return self._engine.restore(game)
+
+    def start_game(self) -> Game:
+        """
+        Start the game, returning game state.
+
+        Returns:
+            Game: Current state of the game.
+        """
+        for character in self.characters:
+            character.source.rng = self.rng
+        return self._engine.start_game()
+
+    def next_turn(self) -> tuple[PlayerColor, AsyncCharacter]:
+        """
+        Get the color and character for the next turn
+        This will give you a different player each time you call it.
+        """
+        color, _ = self._engine.next_turn()
+        return color, self._map[color]
+
+    async def play_next(self) -> Game:
+        """
+        Play the next turn of the game, returning game state as of the end of the turn.
+
+        Returns:
+            Game: Current state of the game.
+
+        Raises:
+            ValueError: If the game is complete, or if a turn is already being played
+        """
+        if self.completed:
+            raise ValueError("Game is complete")
+        if self._playing:
+            raise ValueError("A turn is already being played")
+
+        self._playing = True
+        try:
+            start = time.perf_counter_ns()
+            with self.game.transaction():  # changes are rolled back if this raises, so a failed call is idempotent
+                if self._turn is None:  # otherwise, retry the turn that failed
+                    self._turn = self.next_turn()
+                color, character = self._turn
+                done = False
+                while not done:
+                    with self._measure(character, EnginePhase.CREATE_PLAYER_VIEW):
+                        view = self.game.create_player_view(color)
+                    move = await self.choose_next_move(character, view)
+                    with self._measure(character, EnginePhase.EXECUTE_MOVE):
+                        done = self._engine.execute_move(color, move)
+            self._turn = None
+            if self.profiler is not None:
+                self.profiler.record(character.source.name, EnginePhase.TURN, time.perf_counter_ns() - start)
+            return self.game
+        finally:
+            self._playing = False
+
+    def _measure(self, character: AsyncCharacter, phase: EnginePhase) -> AbstractContextManager[None]:
+        """Return a context manager that records time spent in a phase of play, if a profiler is in use."""
+        return nullcontext() if self.profiler is None else self.profiler.measure(character.source.name, phase)
+
+    async def choose_next_move(self, character: AsyncCharacter, view: PlayerView) -> Move:
+        """Choose the next move for a character based on a player view."""
+        with self._measure(character, EnginePhase.CONSTRUCT_LEGAL_MOVES):
+            _, legal_moves = self._engine.construct_legal_moves(view)
+        deadline = asyncio.timeout(self.move_deadline)  # no deadline if None
+        try:
+            with self._measure(character, EnginePhase.CHOOSE_MOVE):  # nothing is recorded if the choice is cancelled
+                async with deadline:
+                    move = await character.choose_move(self.mode, view, legal_moves[:], Rules.evaluate_move)
+        except TimeoutError:
+            if not deadline.expired():  # the character raised this itself, so it's not a missed deadline
+                raise
+            # a missed deadline is treated like an illegal move
+            self.game.track("Move deadline exceeded: a random legal move will be chosen", view.player)
+            self.missed_deadlines += 1
+            return self.rng.choice(legal_moves)
+        if move not in legal_moves:  # an illegal move is ignored and we choose randomly for the character
+            self.game.track("Illegal move: a random legal move will be chosen", view.player)
+            move = self.rng.choice(legal_moves)
+        return move
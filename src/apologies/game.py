@@ -33,7 +33,11 @@
 
 import json
 import random
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
 from enum import Enum
+from functools import partial
+from typing import Any
 
 from arrow import Arrow
 from arrow import utcnow as arrow_utcnow
@@ -65,6 +69,20 @@ class GameMode(Enum):
     ADULT = "Adult"
 
 
+class HistoryMode(Enum):
+    """
+    Controls which actions are tracked in a game's history.
+
+    In FULL mode, every action is tracked.  In GENERAL mode, only general actions (those
+    not associated with a player, like starting or completing the game) are tracked.
+    Player turn counts are maintained in either mode.  GENERAL mode is intended for
+    simulations and other batch play, where nobody reads the per-move history.
+    """
+
+    FULL = "Full"
+    GENERAL = "General"
+
+
 class PlayerColor(Enum):
     """Enumeration of all player colors, listed in order of use."""
 
@@ -144,45 +162,143 @@ class Card:
     cardtype: CardType
 
 
+@define
+class Journal:
+    """
+    A journal of changes made to game state, which can be rolled back.
+
+    Each entry in the journal is a function that reverses exactly one change.  Rolling
+    back the journal invokes these functions in reverse order, which returns the game
+    to the state it was in when the journal was started.
+    """
+
+    _entries: list[Callable[[], object]] = field(factory=list)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def record(self, undo: Callable[[], object]) -> None:
+        """Record a function that reverses a change that was just made."""
+        self._entries.append(undo)
+
+    def rollback(self) -> None:
+        """Reverse all recorded changes, most recent first, leaving the journal empty."""
+        while self._entries:
+            self._entries.pop()()
+
+
+def _pile_key(pile: list[Card]) -> dict[str, Card]:
+    """Key used to compare piles of cards, where the order of the cards in the pile does not matter."""
+    return {card.id: card for card in pile}
+
+
 @define(slots=False)
 class Deck:
+    # noinspection PyUnresolvedReferences
     """
     The deck of cards associated with a game.
 
     Callers should not pass in constructor arguments. These are accessible to
     support serialization and deserialization.
+
+    The draw and discard piles are lists, but the order of the cards in each pile is not
+    meaningful.  Cards are drawn from a random index in the draw pile, so drawing does not
+    require shuffling and takes constant time.  For compatibility, piles are serialized
+    to JSON as dicts keyed by card id.
+
+    Attributes:
+        journal(Journal): Journal that changes are recorded in, if a transaction is in progress
+        rng(Random): Random number generator used to draw cards, or None to use the random module
     """
 
-    _draw_pile: dict[str, Card] = field()
-    _discard_pile: dict[str, Card] = field(factory=dict)
+    _draw_pile: list[Card] = field(eq=_pile_key)
+    _discard_pile: list[Card] = field(factory=list, eq=_pile_key)
+    _ids: set[str] = field(init=False, eq=False, repr=False)
+    journal: Journal | None = field(default=None, init=False, eq=False, repr=False)
+    rng: random.Random | None = field(default=None, init=False, eq=False, repr=False)
 
     # noinspection PyUnresolvedReferences
     @_draw_pile.default
-    def _default_draw_pile(self) -> dict[str, Card]:  # noqa: PLR6301
-        pile = {}
+    def _default_draw_pile(self) -> list[Card]:  # noqa: PLR6301
+        pile = []
         cardid = 0
         for card in CardType:
             for _ in range(DECK_COUNTS[card]):
-                pile[f"{cardid}"] = Card(f"{cardid}", card)
+                pile.append(Card(f"{cardid}", card))
                 cardid += 1
         return pile
 
+    # noinspection PyUnresolvedReferences
+    @_ids.default
+    def _default_ids(self) -> set[str]:
+        return {card.id for card in self._draw_pile} | {card.id for card in self._discard_pile}
+
+    def copy(self) -> "Deck":
+        """Return a fully-independent copy of the deck."""
+        return Deck(draw_pile=self._draw_pile[:], discard_pile=self._discard_pile[:])  # cards are immutable
+
     def draw(self) -> Card:
         """Draw a random card from the draw pile."""
         if len(self._draw_pile) < 1:
             # this is equivalent to shuffling the discard pile into the draw pile, because we draw randomly from the deck
-            for card in list(self._discard_pile.values()):
-                self._discard_pile.pop(card.id)
-                self._draw_pile[card.id] = card
+            self._draw_pile, self._discard_pile = self._discard_pile, self._draw_pile
+            if self.journal is not None:
+                self.journal.record(self._unshuffle)
         if len(self._draw_pile) < 1:
             raise ValueError("No cards available in deck")  # in any normal game, this should never happen
-        return self._draw_pile.pop(random.choice(list(self._draw_pile.keys())))
+        index = self.rng.randrange(len(self._draw_pile)) if self.rng is not None else random.randrange(len(self._draw_pile))
+        card = self._draw_pile[index]
+        self._draw_pile[index] = self._draw_pile[-1]  # swap the last card into the hole, so removal is constant-time
+        self._draw_pile.pop()
+        self._ids.remove(card.id)
+        if self.journal is not None:
+            self.journal.record(partial(self._undraw, index, card))
+        return card
 
     def discard(self, card: Card) -> None:
         """Discard back to the discard pile."""
-        if card.id in self._draw_pile or card.id in self._discard_pile:
+        if card.id in self._ids:
             raise ValueError("Card already exists in deck")
-        self._discard_pile[card.id] = card
+        self._discard_pile.append(card)
+        self._ids.add(card.id)
+        if self.journal is not None:
+            self.journal.record(self._undiscard)
+
+    def _undraw(self, index: int, card: Card) -> None:
+        """Reverse a draw, putting the card back at its original index in the draw pile."""
+        if index == len(self._draw_pile):
+            self._draw_pile.append(card)
+        else:
+            self._draw_pile.append(self._draw_pile[index])
+            self._draw_pile[index] = card
+        self._ids.add(card.id)
+
+    def _undiscard(self) -> None:
+        """Reverse a discard, removing the most recently discarded card."""
+        self._ids.remove(self._discard_pile.pop().id)
+
+    def _unshuffle(self) -> None:
+        """Reverse a shuffle of the discard pile into the draw pile."""
+        self._draw_pile, self._discard_pile = self._discard_pile, self._draw_pile
+
+
+def _unstructure_deck(deck: Deck) -> dict[str, Any]:
+    """Unstructure a deck, where each pile is represented as a dict keyed by card id."""
+    return {
+        "_draw_pile": {card.id: _CONVERTER.unstructure(card) for card in deck._draw_pile},  # noqa: SLF001
+        "_discard_pile": {card.id: _CONVERTER.unstructure(card) for card in deck._discard_pile},  # noqa: SLF001
+    }
+
+
+def _structure_deck(data: dict[str, Any], _type: type) -> Deck:
+    """Structure a deck, where each pile is represented as a dict keyed by card id."""
+    draw_pile = [_CONVERTER.structure(card, Card) for card in data["_draw_pile"].values()]
+    discard_pile = [_CONVERTER.structure(card, Card) for card in data["_discard_pile"].values()]
+    return Deck(draw_pile=draw_pile, discard_pile=discard_pile)
+
+
+_CONVERTER.register_unstructure_hook(Deck, _unstructure_deck)
+_CONVERTER.register_structure_hook(Deck, _structure_deck)
 
 
 @define(slots=False)
@@ -217,7 +333,7 @@ def __str__(self) -> str:
 
     def copy(self) -> "Position":
         """Return a fully-independent copy of the position."""
-        return _CONVERTER.structure(_CONVERTER.unstructure(self), Position)
+        return Position(self.start, self.home, self.safe, self.square)
 
     def move_to_position(self, position: "Position") -> "Position":
         """
@@ -360,6 +476,10 @@ def _default_position(self) -> Position:  # noqa: PLR6301
     def __str__(self) -> str:
         return f"{self.name}->{self.position}"
 
+    def copy(self) -> "Pawn":
+        """Return a fully-independent copy of the pawn."""
+        return Pawn(self.color, self.index, self.name, self.position.copy())
+
 
 @define
 class Player:
@@ -389,13 +509,12 @@ def _default_pawns(self) -> list[Pawn]:
 
     def copy(self) -> "Player":
         """Return a fully-independent copy of the player."""
-        return _CONVERTER.structure(_CONVERTER.unstructure(self), Player)
+        return Player(self.color, self.hand[:], [pawn.copy() for pawn in self.pawns], self.turns)  # cards are immutable
 
     def public_data(self) -> "Player":
         """Return a fully-independent copy of the player with only public data visible."""
-        player = self.copy()
-        del player.hand[:]  # other players should not see this player's hand when making decisions
-        return player
+        # other players should not see this player's hand when making decisions
+        return Player(self.color, [], [pawn.copy() for pawn in self.pawns], self.turns)
 
     def find_first_pawn_in_start(self) -> Pawn | None:
         """Find the first pawn in the start area, if any."""
@@ -432,6 +551,10 @@ class History:
     def _default_timestamp(self) -> Arrow:  # noqa: PLR6301
         return arrow_utcnow()
 
+    def copy(self) -> "History":
+        """Return a fully-independent copy of the history entry."""
+        return History(self.action, self.color, self.card, self.timestamp)  # timestamps are immutable
+
     def __str__(self) -> str:
         time = self.timestamp.format(ISO_TIME_FORMAT)
         color = "General" if not self.color else self.color.value
@@ -455,7 +578,7 @@ class PlayerView:
 
     def copy(self) -> "PlayerView":
         """Return a fully-independent copy of the player view."""
-        return _CONVERTER.structure(_CONVERTER.unstructure(self), PlayerView)
+        return PlayerView(self.player.copy(), {color: opponent.copy() for color, opponent in self.opponents.items()})
 
     def get_pawn(self, prototype: Pawn) -> Pawn | None:
         """Return the pawn from this view with the same color and index."""
@@ -487,12 +610,16 @@ class Game:
         players(Dict[PlayerColor, Player]): All players in the game
         deck(Deck): The deck of cards for the game
         history(History): Game history
+        history_mode(HistoryMode): Controls which actions are tracked in the game history
+        journal(Journal): Journal that changes are recorded in, if a transaction is in progress
     """
 
     playercount: int = field()
     players: dict[PlayerColor, Player] = field()
     deck: Deck = field(factory=Deck)
     history: list[History] = field(factory=list)
+    history_mode: HistoryMode = field(default=HistoryMode.FULL, init=False, eq=False, repr=False)
+    journal: Journal | None = field(default=None, init=False, eq=False, repr=False)
 
     # noinspection PyUnresolvedReferences
     @playercount.validator
@@ -525,7 +652,10 @@ def winner(self) -> Player:
 
     def copy(self) -> "Game":
         """Return a fully-independent copy of the game."""
-        return _CONVERTER.structure(_CONVERTER.unstructure(self), Game)
+        players = {color: player.copy() for color, player in self.players.items()}
+        game = Game(self.playercount, players, self.deck.copy(), [entry.copy() for entry in self.history])
+        game.history_mode = self.history_mode
+        return game
 
     def to_json(self) -> str:
         """Serialize the game state to JSON."""
@@ -536,11 +666,55 @@ def from_json(data: str) -> "Game":
         """Deserialize the game state from JSON."""
         return _CONVERTER.structure(json.loads(data), Game)
 
+    @contextmanager
+    def transaction(self) -> Iterator["Game"]:
+        """
+        Open a transaction, rolling back all changes to the game if an exception is raised.
+
+        While the transaction is open, changes made via track(), Deck.draw(), Deck.discard()
+        and Rules.execute_move() are recorded in a journal, rather than requiring a snapshot
+        of the entire game up front.  Other code that changes game state within a transaction
+        is responsible for recording its own changes in the journal.  Transactions may be
+        nested; changes from a nested transaction are kept only if the enclosing transaction
+        completes successfully.
+
+        Returns:
+            Iterator[Game]: A context manager that yields this game
+        """
+        outer = self.journal
+        journal = Journal()
+        self.journal = self.deck.journal = journal
+        try:
+            yield self
+        except BaseException:
+            journal.rollback()
+            raise
+        finally:
+            self.journal = self.deck.journal = outer
+        if outer is not None:
+            outer.record(journal.rollback)
+
+    @property
+    def tracks_player_actions(self) -> bool:
+        """Whether actions associated with a player are tracked in the game history."""
+        return self.history_mode == HistoryMode.FULL
+
     def track(self, action: str, player: Player | None = None, card: Card | None = None) -> None:
-        """Tracks an action taken during the game."""
-        self.history.append(History(action, player.color if player else None, card.cardtype if card else None))
+        """Tracks an action taken during the game, subject to the history mode."""
+        recorded = not player or self.tracks_player_actions
+        if recorded:
+            self.history.append(History(action, player.color if player else None, card.cardtype if card else None))
         if player:
             self.players[player.color].turns += 1
+        if self.journal is not None:
+            self.journal.record(partial(self._untrack, player.color if player else None, recorded))
+
+    def _untrack(self, color: PlayerColor | None, recorded: bool) -> None:  # noqa: FBT001
+        """Reverse the most recent call to track()."""
+        if recorded:
+            self.history.pop()
+        if color:
+            self.players[color].turns -= 1
 
     def create_player_view(self, color: PlayerColor) -> PlayerView:
         """Return a player-specific view of the game, showing only the information a player would have available on their turn."""
@@ -0,0 +1,515 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+
+"""
+Host many concurrent games in a single process.
+
+A GameHost owns an AsyncEngine for each game, keyed by a game id, and plays turns for all of
+them from a single event loop.  Turns are scheduled fairly: games take turns in round-robin
+order, with at most one turn in flight per game and a bounded number of turns in flight
+overall, so a busy game can never starve the others.  Each move is subject to a deadline
+(see AsyncEngine), so a slow or absent character can't stall a game.
+
+A game that isn't being played (because it is paused or completed) is idle.  To bound memory,
+idle games are evicted to storage, once they've been idle for too long or when too many games
+are in memory.  An evicted game is saved as JSON via Game.to_json(), along with everything
+else needed to resume it (including the state of its random number generator, so a seeded
+game is still reproducible), except for the characters themselves.  Characters are usually tied
+to something outside the game (like a websocket connection), so the caller supplies them
+again when resuming the game.
+
+Metrics about the games in memory and about recent turn latency are available via metrics().
+"""
+
+import asyncio
+import json
+import random
+import statistics
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Callable
+from functools import partial
+from pathlib import Path
+
+from attrs import define, field, frozen
+
+from apologies.engine import AsyncCharacter, AsyncEngine
+from apologies.game import Game, GameMode, HistoryMode, PlayerColor
+from apologies.rules import LegalMoveCache
+from apologies.util import create_rng
+
+# Number of recent turns that turn latency metrics are calculated from
+_LATENCY_WINDOW = 1000
+
+# Minimum interval between checks for idle games while running, in seconds
+_SWEEP_INTERVAL = 1.0
+
+
+class GameStorage(ABC):
+    """Storage for games that have been evicted from a GameHost, as JSON, keyed by game id."""
+
+    @abstractmethod
+    def save(self, game_id: str, data: str) -> None:
+        """Save data for a game, replacing any existing data."""
+
+    @abstractmethod
+    def load(self, game_id: str) -> str:
+        """
+        Load data for a game.
+
+        Raises:
+            ValueError: If there is no data for the game
+        """
+
+    @abstractmethod
+    def delete(self, game_id: str) -> None:
+        """Delete data for a game, if there is any."""
+
+
+class MemoryStorage(GameStorage):
+    """
+    Storage that keeps evicted games in memory, as JSON.
+
+    A game stored as JSON is much smaller than the live game, but this storage is still
+    unbounded, so it's mainly useful for testing.
+    """
+
+    def __init__(self) -> None:
+        self._data: dict[str, str] = {}
+
+    def save(self, game_id: str, data: str) -> None:
+        self._data[game_id] = data
+
+    def load(self, game_id: str) -> str:
+        if game_id not in self._data:
+            raise ValueError(f"Game not found: {game_id}")
+        return self._data[game_id]
+
+    def delete(self, game_id: str) -> None:
+        self._data.pop(game_id, None)
+
+
+class FileStorage(GameStorage):
+    """
+    Storage that keeps each evicted game in a JSON file in a directory.
+
+    The game id is used as the file name, so it must be valid as a file name.
+
+    Attributes:
+        directory(Path): Directory that files are stored in, which is created if necessary
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, game_id: str) -> Path:
+        return self.directory / f"{game_id}.json"
+
+    def save(self, game_id: str, data: str) -> None:
+        self._path(game_id).write_text(data, encoding="utf-8")
+
+    def load(self, game_id: str) -> str:
+        path = self._path(game_id)
+        if not path.is_file():
+            raise ValueError(f"Game not found: {game_id}")
+        return path.read_text(encoding="utf-8")
+
+    def delete(self, game_id: str) -> None:
+        self._path(game_id).unlink(missing_ok=True)
+
+
+@frozen
+class HostMetrics:
+    # noinspection PyUnresolvedReferences
+    """
+    A snapshot of metrics for a GameHost.
+
+    Latencies are measured over the most recent turns, and include time spent waiting for
+    characters to choose their moves.  A latency is None until enough turns have been played.
+
+    Attributes:
+        active_games(int): Number of games in memory
+        playing_games(int): Number of games with a turn in flight
+        paused_games(int): Number of games in memory that are paused
+        completed_games(int): Number of games in memory that are completed
+        evicted_games(int): Number of games evicted to storage
+        turns(int): Total number of turns played
+        missed_deadlines(int): Total number of moves chosen randomly because a character missed the deadline
+        failed_turns(int): Total number of turns that failed with an error, pausing the game
+        turn_p50_ms(float, optional): Median turn latency, in milliseconds
+        turn_p95_ms(float, optional): 95th percentile turn latency, in milliseconds
+        turn_p99_ms(float, optional): 99th percentile turn latency, in milliseconds
+    """
+
+    active_games: int
+    playing_games: int
+    paused_games: int
+    completed_games: int
+    evicted_games: int
+    turns: int
+    missed_deadlines: int
+    failed_turns: int
+    turn_p50_ms: float | None
+    turn_p95_ms: float | None
+    turn_p99_ms: float | None
+
+
+@define
+class _Session:
+    """A game in memory, along with its scheduling state."""
+
+    engine: AsyncEngine
+    last_active: float
+    paused: bool = False
+    error: BaseException | None = None
+
+
+@define
+class GameHost:
+    # noinspection PyUnresolvedReferences
+    """
+    Hosts many concurrent games, keyed by game id.
+
+    Normally, hosting games is as simple as::
+
+        host.create_game("table-1", GameMode.STANDARD, characters)
+        ...
+        await host.run()
+
+    This plays turns for every game that isn't paused, until there are none left to play.
+    Games may be created, paused, resumed and evicted while the host is running.  Other,
+    more fine-grained methods exist if you need to schedule turns differently.
+
+    Attributes:
+        storage(GameStorage): Storage that idle games are evicted to
+        move_deadline(float, optional): Time allowed for a character to choose each move, in seconds
+        idle_timeout(float, optional): Time after which an idle game is evicted, in seconds
+        max_active(int, optional): Maximum number of games to keep in memory, evicting the least recently active idle games
+        concurrency(int): Maximum number of turns in flight at once, across all games
+        history_mode(HistoryMode): Controls which actions are tracked in each game's history
+        legal_move_cache(LegalMoveCache, optional): Cache of legal moves, shared by all games
+        clock(Callable[[], float]): Clock used to measure idle time and turn latency, in seconds
+    """
+
+    storage: GameStorage = field(factory=MemoryStorage)
+    move_deadline: float | None = field(default=None, kw_only=True)
+    idle_timeout: float | None = field(default=None, kw_only=True)
+    max_active: int | None = field(default=None, kw_only=True)
+    concurrency: int = field(default=100, kw_only=True)
+    history_mode: HistoryMode = field(default=HistoryMode.FULL, kw_only=True)
+    legal_move_cache: LegalMoveCache | None = field(default=None, kw_only=True)
+    clock: Callable[[], float] = field(default=time.monotonic, kw_only=True)
+    _sessions: dict[str, _Session] = field(init=False, factory=dict)
+    _evicted: set[str] = field(init=False, factory=set)
+    _ready: deque[str] = field(init=False, factory=deque)
+    _scheduled: set[str] = field(init=False, factory=set)
+    _playing: set[str] = field(init=False, factory=set)
+    _latencies: deque[float] = field(init=False, factory=lambda: deque(maxlen=_LATENCY_WINDOW))
+    _turns: int = field(init=False, default=0)
+    _missed_deadlines: int = field(init=False, default=0)
+    _failed_turns: int = field(init=False, default=0)
+    _wakeup: asyncio.Event | None = field(init=False, default=None)
+
+    # noinspection PyUnresolvedReferences
+    @concurrency.validator
+    def _check_concurrency(self, _attribute: str, value: int) -> None:
+        if value < 1:
+            raise ValueError("Concurrency must be at least 1")
+
+    @property
+    def game_ids(self) -> list[str]:
+        """Ids of all games, whether in memory or evicted."""
+        return [*self._sessions, *sorted(self._evicted)]
+
+    def engine(self, game_id: str) -> AsyncEngine:
+        """
+        Return the engine for a game in memory.
+
+        Raises:
+            ValueError: If the game is not in memory
+        """
+        return self._session(game_id).engine
+
+    def error(self, game_id: str) -> BaseException | None:
+        """Return the error from the turn that paused a game in memory, if any."""
+        return self._session(game_id).error
+
+    def is_evicted(self, game_id: str) -> bool:
+        """Whether a game has been evicted to storage."""
+        return game_id in self._evicted
+
+    def create_game(self, game_id: str, mode: GameMode, characters: list[AsyncCharacter], seed: int | None = None) -> AsyncEngine:
+        """
+        Create and start a new game, which will be played the next time the host runs.
+
+        Args:
+            game_id(str): Unique id for the game
+            mode(GameMode): The game mode
+            characters(List[AsyncCharacter]): Characters playing the game
+            seed(int, optional): Seed for the game's random number generator
+
+        Returns:
+            AsyncEngine: The engine for the game
+
+        Raises:
+            ValueError: If a game with the same id already exists
+        """
+        if game_id in self._sessions or game_id in self._evicted:
+            raise ValueError(f"Game already exists: {game_id}")
+        engine = self._create_engine(mode, characters, create_rng(seed))
+        engine.start_game()
+        self._add(game_id, engine)
+        return engine
+
+    def pause(self, game_id: str) -> None:
+        """
+        Stop playing turns for a game in memory, once any turn in flight is done.
+
+        Raises:
+            ValueError: If the game is not in memory
+        """
+        session = self._session(game_id)
+        session.paused = True
+        session.last_active = self.clock()
+
+    def resume(self, game_id: str, characters: list[AsyncCharacter] | None = None) -> AsyncEngine:
+        """
+        Resume playing turns for a game, loading it from storage if it was evicted.
+
+        Args:
+            game_id(str): Id of the game
+            characters(List[AsyncCharacter], optional): Characters playing the game, required if it was evicted
+
+        Returns:
+            AsyncEngine: The engine for the game
+
+        Raises:
+            ValueError: If the game doesn't exist, or if it was evicted and suitable characters are not provided
+        """
+        if game_id in self._sessions:
+            session = self._sessions[game_id]
+            if session.paused:
+                session.paused = False
+                session.error = None
+                self._schedule(game_id)
+            return session.engine
+        if game_id not in self._evicted:
+            raise ValueError(f"Game not found: {game_id}")
+        if characters is None:
+            raise ValueError("Characters are required to resume an evicted game")
+        engine = self._load(game_id, characters)
+        self._evicted.discard(game_id)
+        self.storage.delete(game_id)
+        self._add(game_id, engine)
+        return engine
+
+    def evict(self, game_id: str) -> None:
+        """
+        Evict a game in memory to storage.
+
+        Raises:
+            ValueError: If the game is not in memory, or if a turn is being played
+        """
+        session = self._session(game_id)
+        if game_id in self._playing:
+            raise ValueError(f"A turn is being played for game: {game_id}")
+        self.storage.save(game_id, self._save(session.engine))
+        del self._sessions[game_id]
+        self._evicted.add(game_id)
+
+    def evict_idle(self) -> list[str]:
+        """
+        Evict games that have been idle for too long, and then the least recently active idle
+        games while there are more than the maximum number of games in memory.
+
+        Returns:
+            List[str]: Ids of the games that were evicted
+        """
+        now = self.clock()
+        idle = sorted(
+            (session.last_active, game_id)
+            for game_id, session in self._sessions.items()
+            if game_id not in self._playing and (session.paused or session.engine.completed)
+        )
+        excess = len(self._sessions) - self.max_active if self.max_active is not None else 0
+        evicted: list[str] = []
+        for last_active, game_id in idle:
+            if len(evicted) < excess or (self.idle_timeout is not None and now - last_active >= self.idle_timeout):
+                self.evict(game_id)
+                evicted.append(game_id)
+        return evicted
+
+    def remove(self, game_id: str) -> None:
+        """
+        Remove a game entirely, whether it is in memory or evicted.
+
+        Raises:
+            ValueError: If the game doesn't exist, or if a turn is being played
+        """
+        if game_id in self._playing:
+            raise ValueError(f"A turn is being played for game: {game_id}")
+        if game_id in self._sessions:
+            del self._sessions[game_id]
+        elif game_id in self._evicted:
+            self._evicted.discard(game_id)
+            self.storage.delete(game_id)
+        else:
+            raise ValueError(f"Game not found: {game_id}")
+
+    async def play_turn(self, game_id: str) -> Game:
+        """
+        Play the next turn for a game in memory, recording metrics.
+
+        Returns:
+            Game: Current state of the game.
+
+        Raises:
+            ValueError: If the game is not in memory, or if a turn is already being played
+        """
+        session = self._session(game_id)
+        if game_id in self._playing:
+            raise ValueError(f"A turn is being played for game: {game_id}")
+        engine = session.engine
+        missed = engine.missed_deadlines
+        self._playing.add(game_id)
+        start = self.clock()
+        try:
+            game = await engine.play_next()
+        finally:
+            self._playing.discard(game_id)
+            session.last_active = self.clock()
+        self._turns += 1
+        self._missed_deadlines += engine.missed_deadlines - missed
+        self._latencies.append(session.last_active - start)
+        return game
+
+    async def run(self) -> None:
+        """
+        Play turns for all games that aren't paused, until there are no more turns to play.
+
+        Games take turns in round-robin order, with at most one turn in flight per game and at
+        most `concurrency` turns in flight overall.  If a turn fails with an error, the game
+        is paused, and the error is available via error().  Idle games are evicted along
+        the way, according to `idle_timeout` and `max_active`.
+        """
+        self._wakeup = asyncio.Event()
+        tasks: dict[asyncio.Task[Game], str] = {}
+        swept = self.clock()
+        try:
+            while True:
+                while self._ready and len(tasks) < self.concurrency:
+                    game_id = self._ready.popleft()
+                    self._scheduled.discard(game_id)
+                    if self._runnable(game_id):
+                        tasks[asyncio.create_task(self.play_turn(game_id))] = game_id
+                if not tasks:
+                    break
+                self._wakeup.clear()
+                wakeup = asyncio.create_task(self._wakeup.wait())  # lets new or resumed games start promptly
+                await asyncio.wait([*tasks, wakeup], return_when=asyncio.FIRST_COMPLETED)
+                wakeup.cancel()
+                for task in [task for task in tasks if task.done()]:
+                    self._finish(tasks.pop(task), task)
+                if self.clock() - swept >= _SWEEP_INTERVAL:
+                    self.evict_idle()
+                    swept = self.clock()
+            self.evict_idle()
+        finally:
+            for task in tasks:
+                task.cancel()  # the engine rolls back each cancelled turn
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._wakeup = None
+
+    def metrics(self) -> HostMetrics:
+        """Return a snapshot of metrics for the host."""
+        sessions = self._sessions.values()
+        quantiles = statistics.quantiles(self._latencies, n=100, method="inclusive") if len(self._latencies) > 1 else None
+        return HostMetrics(
+            active_games=len(self._sessions),
+            playing_games=len(self._playing),
+            paused_games=sum(1 for session in sessions if session.paused),
+            completed_games=sum(1 for session in sessions if session.engine.completed),
+            evicted_games=len(self._evicted),
+            turns=self._turns,
+            missed_deadlines=self._missed_deadlines,
+            failed_turns=self._failed_turns,
+            turn_p50_ms=1000 * quantiles[49] if quantiles else None,
+            turn_p95_ms=1000 * quantiles[94] if quantiles else None,
+            turn_p99_ms=1000 * quantiles[98] if quantiles else None,
+        )
+
+    def _session(self, game_id: str) -> _Session:
+        """Return the session for a game in memory."""
+        if game_id not in self._sessions:
+            raise ValueError(f"Game not in memory: {game_id}")
+        return self._sessions[game_id]
+
+    def _create_engine(
+        self, mode: GameMode, characters: list[AsyncCharacter], rng: random.Random, first: PlayerColor | None = None
+    ) -> AsyncEngine:
+        """Create an engine configured for this host, with a random first player unless one is provided."""
+        create = partial(
+            AsyncEngine,
+            mode,
+            characters,
+            rng=rng,
+            history_mode=self.history_mode,
+            legal_move_cache=self.legal_move_cache,
+            move_deadline=self.move_deadline,
+        )
+        return create() if first is None else create(first=first)
+
+    def _add(self, game_id: str, engine: AsyncEngine) -> None:
+        """Add a game to memory, and schedule it to be played."""
+        self._sessions[game_id] = _Session(engine, self.clock())
+        self._schedule(game_id)
+
+    def _schedule(self, game_id: str) -> None:
+        """Schedule a game to be played, waking up the host if it is running."""
+        if game_id not in self._scheduled:  # so a game never gets more than its fair share of turns
+            self._scheduled.add(game_id)
+            self._ready.append(game_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _runnable(self, game_id: str) -> bool:
+        """Whether a turn can be played for a game right now."""
+        session = self._sessions.get(game_id)
+        return session is not None and not session.paused and not session.engine.completed and game_id not in self._playing
+
+    def _finish(self, game_id: str, task: "asyncio.Task[Game]") -> None:
+        """Handle a completed turn, scheduling the game's next turn or pausing it after an error."""
+        session = self._sessions.get(game_id)
+        if session is None:  # the game was removed while its turn was being played
+            return
+        if task.cancelled() or task.exception() is not None:
+            self._failed_turns += 1
+            session.paused = True
+            session.error = asyncio.CancelledError() if task.cancelled() else task.exception()
+        elif not session.paused and not session.engine.completed:
+            self._schedule(game_id)
+
+    @staticmethod
+    def _save(engine: AsyncEngine) -> str:
+        """Serialize everything needed to resume a game, except for its characters."""
+        data = {
+            "mode": engine.mode.value,
+            "names": [character.name for character in engine.characters],
+            "next": engine.next_color.value,
+            "rng": engine.rng.getstate(),  # so a resumed game continues exactly as if it had never been evicted
+            "game": engine.game.to_json(),
+        }
+        return json.dumps(data)
+
+    def _load(self, game_id: str, characters: list[AsyncCharacter]) -> AsyncEngine:
+        """Load a game from storage, into a new engine."""
+        data = json.loads(self.storage.load(game_id))
+        if len(characters) != len(data["names"]):
+            raise ValueError(f"Game requires {len(data['names'])} characters")
+        version, state, gauss = data["rng"]
+        rng = random.Random()  # noqa: S311
+        rng.setstate((version, tuple(state), gauss))
+        engine = self._create_engine(GameMode(data["mode"]), characters, rng, first=PlayerColor(data["next"]))
+        engine.restore(Game.from_json(data["game"]))
+        return engine
@@ -27,8 +27,11 @@
 
 from abc import ABC, abstractmethod
 
-from apologies.game import Player, PlayerView
-from apologies.rules import BoardRules
+from attrs import define
+
+from apologies.compact import HOME_CODE, SAFE_BASE, encode_position
+from apologies.game import PAWNS, Player, PlayerColor, PlayerView
+from apologies.rules import DISTANCE_TO_HOME, Move
 
 
 class RewardCalculator(ABC):
@@ -54,6 +57,10 @@ def range(self, players: int) -> tuple[float, float]:  # noqa: PLR6301
         """Return the range of possible rewards for a game."""
         return 0.0, float((players - 1) * 400)  # reward is up to 400 points per opponent
 
+    def incremental(self, view: PlayerView) -> "IncrementalRewardV1":  # noqa: PLR6301
+        """Return an incremental calculator, to calculate the reward for many moves against the same view."""
+        return IncrementalRewardV1.from_view(view)
+
     @staticmethod
     def _reward(view: PlayerView) -> int:
         # Reward measures this player's overall game position relative to their opponents
@@ -73,7 +80,8 @@ def _player_score(player: Player) -> int:
     @staticmethod
     def _distance_incentive(player: Player) -> int:
         # Incentive of 1 point for each square closer to home for each of the player's 4 pawns
-        distance = sum(BoardRules.distance_to_home(pawn) for pawn in player.pawns)
+        distances = DISTANCE_TO_HOME[player.color]
+        distance = sum(distances[encode_position(pawn.position)] for pawn in player.pawns)
         return 260 - distance  # 260 = 4*65, max distance for 4 pawns
 
     @staticmethod
@@ -85,3 +93,73 @@ def _safe_incentive(player: Player) -> int:
     def _winner_incentive(player: Player) -> int:
         # Incentive of 100 points for winning the game
         return 100 if player.all_pawns_in_home() else 0
+
+    @staticmethod
+    def _position_score(color: PlayerColor, positions: list[int]) -> int:
+        # Same as _player_score(), but calculated from the position code for each of the player's pawns
+        distances = DISTANCE_TO_HOME[color]
+        distance_incentive = 260 - sum(distances[code] for code in positions)
+        safe_incentive = sum(10 for code in positions if SAFE_BASE <= code <= HOME_CODE)
+        winner_incentive = 100 if positions.count(HOME_CODE) == PAWNS else 0
+        return distance_incentive + safe_incentive + winner_incentive
+
+
+@define
+class IncrementalRewardV1:
+    # noinspection PyUnresolvedReferences
+    """
+    Incremental version of RewardCalculatorV1, for scoring many moves against the same view.
+
+    The score for each player is calculated once, up front.  The reward for a move is then
+    calculated from the move's actions and side effects, by re-scoring only the players whose
+    pawns are moved.  The resulting player view is never materialized.  The reward for a move is
+    always identical to the reward that RewardCalculatorV1 calculates for the view returned by
+    Rules.evaluate_move().
+
+    Callers should generally create an incremental calculator using from_view() or
+    RewardCalculatorV1.incremental(), rather than passing in constructor arguments.
+
+    Attributes:
+        color(PlayerColor): The color of the player associated with the view
+        positions(Dict[PlayerColor, List[int]]): Position code for each pawn, for each player in the view
+        scores(Dict[PlayerColor, int]): Score for each player in the view
+    """
+
+    color: PlayerColor
+    positions: dict[PlayerColor, list[int]]
+    scores: dict[PlayerColor, int]
+
+    @staticmethod
+    def from_view(view: PlayerView) -> "IncrementalRewardV1":
+        """Create an incremental calculator for a player view."""
+        players = [view.player, *view.opponents.values()]
+        positions = {player.color: [encode_position(pawn.position) for pawn in player.pawns] for player in players}
+        scores = {color: RewardCalculatorV1._position_score(color, codes) for color, codes in positions.items()}  # noqa: SLF001
+        return IncrementalRewardV1(view.player.color, positions, scores)
+
+    @property
+    def reward(self) -> float:
+        """The reward associated with the view itself, before any move is applied."""
+        return float(self._reward(self.scores))
+
+    def calculate(self, move: Move) -> float:
+        """Calculate the reward associated with the view that results from applying a move."""
+        changes: dict[PlayerColor, dict[int, int]] = {}
+        for (color, index), code in move.final_positions().items():
+            positions = self.positions.get(color)
+            if positions is not None and 0 <= index < len(positions):  # if the pawn isn't valid, just ignore it
+                changes.setdefault(color, {})[index] = code
+        if not changes:
+            return self.reward
+        scores = self.scores.copy()
+        for color, changed in changes.items():
+            positions = [changed.get(index, code) for index, code in enumerate(self.positions[color])]
+            scores[color] = RewardCalculatorV1._position_score(color, positions)  # noqa: SLF001
+        return float(self._reward(scores))
+
+    def _reward(self, scores: dict[PlayerColor, int]) -> int:
+        # Same as RewardCalculatorV1._reward(), but calculated from the score for each player
+        player_score = scores[self.color]
+        opponent_score = sum(scores.values()) - player_score
+        reward = ((len(scores) - 1) * player_score) - opponent_score
+        return max(reward, 0)
@@ -1,20 +1,28 @@
 # vim: set ft=python ts=4 sw=4 expandtab:
-# ruff: noqa: PERF401
 
 """
 Implements rules related to game play.
+
+Attributes:
+    DISTANCE_TO_HOME(Dict[PlayerColor, Tuple[int, ...]]): Distance to home for a pawn, indexed by [color][position code]
 """
 
 import uuid
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
 from enum import Enum
+from functools import partial
 
 from attrs import define, field, frozen
 
+from apologies.compact import HOME_CODE, POSITION_CODES, START_CODE, CompactGame, CompactView, decode_position, encode_position
 from apologies.game import (
     ADULT_HAND,
     BOARD_SQUARES,
     CIRCLE,
     DRAW_AGAIN,
+    PAWNS,
     SAFE_SQUARES,
     SLIDE,
     TURN,
@@ -37,6 +45,23 @@ class ActionType(Enum):
     MOVE_TO_POSITION = "Move to position"  # Move a pawn to a specific position on the board
 
 
+# Log of changes made by Rules.apply_move(), as (position, start, home, safe, square) for each position before it was changed
+UndoLog = list[tuple[Position, bool, bool, int | None, int | None]]
+
+# Key returned by Move.key(), as (card type, {(color, pawn index, position code) for each pawn the move touches})
+MoveKey = tuple[CardType, frozenset[tuple[PlayerColor, int, int]]]
+
+# Placement of pawns returned by LegalMoveCache.placement(), as (color of each pawn, position code of each pawn)
+Placement = tuple[tuple[PlayerColor, ...], bytes]
+
+# Key used by LegalMoveCache, as (placement of all pawns, color of the player, card type)
+CacheKey = tuple[Placement, PlayerColor, CardType]
+
+# The range of distances covered by the precomputed move table, which includes every distance allowed by any card
+_MIN_SQUARES = -4
+_MAX_SQUARES = 12
+
+
 @frozen
 class Action:
     # noinspection PyUnresolvedReferences
@@ -76,11 +101,50 @@ class Move:
     # Note that id is not included in equality, because we want to check for move equalivance, and
     # two moves that have different ids (different UUIDs) are still equivalent as long as they have
     # the same card, actions, and side effects.
+    #
+    # If no id is passed in, a UUID is generated the first time the id is needed.  Most legal moves
+    # are discarded (as duplicates, or because a character chose some other move) without anyone
+    # ever looking at the id, so there's no point paying the cost of generating a UUID up-front.
 
     card: Card
     actions: list[Action]
     side_effects: list[Action] = field(factory=list)
-    id: str = field(factory=lambda: uuid.uuid4().hex, eq=False)
+    _id: str | None = field(default=None, eq=False, repr=False)
+
+    @property
+    def id(self) -> str:
+        """Identifier for this move, generated the first time it's needed unless one was passed in."""
+        if self._id is None:
+            generated = uuid.uuid4().hex
+            object.__setattr__(self, "_id", generated)  # noqa: PLC2801 # the move is frozen, but the id isn't part of its value
+            return generated
+        return self._id
+
+    def key(self) -> MoveKey:
+        """
+        Return a hashable key that identifies this move by its card type and the placement that results.
+
+        The placement is the final position code for each pawn that the move touches, after all
+        actions and side effects are executed in order.  Two moves with the same key have exactly
+        the same effect on the board, even if their actions are listed in a different order.
+        """
+        return self.card.cardtype, frozenset((color, index, code) for (color, index), code in self.final_positions().items())
+
+    def final_positions(self) -> dict[tuple[PlayerColor, int], int]:
+        """
+        Return the final position code for each pawn that the move touches, keyed by pawn color and index.
+
+        Actions and side effects are executed in order, like Rules.evaluate_move(), so if a pawn is
+        moved more than once, only its last position is returned.  Pawns are not validated, so callers
+        should ignore any pawn that isn't part of the game or view they are working with.
+        """
+        positions: dict[tuple[PlayerColor, int], int] = {}
+        for action in self.actions + self.side_effects:  # execute actions, then side-effects, in order
+            if action.actiontype == ActionType.MOVE_TO_START:
+                positions[action.pawn.color, action.pawn.index] = START_CODE
+            elif action.actiontype == ActionType.MOVE_TO_POSITION and action.position:
+                positions[action.pawn.color, action.pawn.index] = encode_position(action.position)
+        return positions
 
 
 # noinspection PyMethodMayBeStatic
@@ -89,12 +153,13 @@ class BoardRules:
     Rules related to the way the board works.
     """
 
-    def construct_legal_moves(  # noqa: PLR6301
+    def construct_legal_moves(
         self,
         color: PlayerColor,
         card: Card,
         pawn: Pawn,
         all_pawns: list[Pawn],
+        occupancy: dict[int, Pawn] | None = None,
     ) -> list[Move]:
         """
         Return the set of legal moves for a pawn using a card, possibly empty.
@@ -103,49 +168,88 @@ def construct_legal_moves(  # noqa: PLR6301
             card(Card): Card to be played
             pawn(Pawn): Pawn that the card will be applied to
             all_pawns(List[Pawn]): All pawns on the board, including the one to be played
+            occupancy(Dict[int, Pawn], optional): Occupancy index for all_pawns, built if not provided
 
         Return:
             Set of legal moves for the pawn using the card.
         """
-        moves: list[Move] = []
-        if not pawn.position.home:  # there are no legal moves for a pawn in home
-            if card.cardtype == CardType.CARD_1:
-                moves += BoardRules._construct_legal_moves_1(color, card, pawn, all_pawns)
-            elif card.cardtype == CardType.CARD_2:
-                moves += BoardRules._construct_legal_moves_2(color, card, pawn, all_pawns)
-            elif card.cardtype == CardType.CARD_3:
-                moves += BoardRules._construct_legal_moves_3(color, card, pawn, all_pawns)
-            elif card.cardtype == CardType.CARD_4:
-                moves += BoardRules._construct_legal_moves_4(color, card, pawn, all_pawns)
-            elif card.cardtype == CardType.CARD_5:
-                moves += BoardRules._construct_legal_moves_5(color, card, pawn, all_pawns)
-            elif card.cardtype == CardType.CARD_7:
-                moves += BoardRules._construct_legal_moves_7(color, card, pawn, all_pawns)
-            elif card.cardtype == CardType.CARD_8:
-                moves += BoardRules._construct_legal_moves_8(color, card, pawn, all_pawns)
-            elif card.cardtype == CardType.CARD_10:
-                moves += BoardRules._construct_legal_moves_10(color, card, pawn, all_pawns)
-            elif card.cardtype == CardType.CARD_11:
-                moves += BoardRules._construct_legal_moves_11(color, card, pawn, all_pawns)
-            elif card.cardtype == CardType.CARD_12:
-                moves += BoardRules._construct_legal_moves_12(color, card, pawn, all_pawns)
-            elif card.cardtype == CardType.CARD_APOLOGIES:
-                moves += BoardRules._construct_legal_moves_apologies(color, card, pawn, all_pawns)
-        BoardRules._augment_with_slides(all_pawns, moves)
-        return moves
+        return list(self.iter_legal_moves(color, card, pawn, all_pawns, occupancy))
+
+    def iter_legal_moves(  # noqa: PLR6301,PLR0912
+        self,
+        color: PlayerColor,
+        card: Card,
+        pawn: Pawn,
+        all_pawns: list[Pawn],
+        occupancy: dict[int, Pawn] | None = None,
+    ) -> Iterator[Move]:
+        """
+        Generate the legal moves for a pawn using a card, one at a time.
+
+        This yields the same moves as construct_legal_moves(), in the same order, but each move is
+        constructed only when it's requested.  The pawns must not change until iteration is complete.
+
+        Attributes:
+            card(Card): Card to be played
+            pawn(Pawn): Pawn that the card will be applied to
+            all_pawns(List[Pawn]): All pawns on the board, including the one to be played
+            occupancy(Dict[int, Pawn], optional): Occupancy index for all_pawns, built if not provided
+
+        Return:
+            Iterator over the legal moves for the pawn using the card.
+        """
+        if occupancy is None:
+            occupancy = BoardRules.occupancy(all_pawns)
+        if pawn.position.home:  # there are no legal moves for a pawn in home
+            return
+        if card.cardtype == CardType.CARD_1:
+            moves = BoardRules._construct_legal_moves_1(color, card, pawn, occupancy)
+        elif card.cardtype == CardType.CARD_2:
+            moves = BoardRules._construct_legal_moves_2(color, card, pawn, occupancy)
+        elif card.cardtype == CardType.CARD_3:
+            moves = BoardRules._construct_legal_moves_3(color, card, pawn, occupancy)
+        elif card.cardtype == CardType.CARD_4:
+            moves = BoardRules._construct_legal_moves_4(color, card, pawn, occupancy)
+        elif card.cardtype == CardType.CARD_5:
+            moves = BoardRules._construct_legal_moves_5(color, card, pawn, occupancy)
+        elif card.cardtype == CardType.CARD_7:
+            moves = BoardRules._construct_legal_moves_7(color, card, pawn, all_pawns, occupancy)
+        elif card.cardtype == CardType.CARD_8:
+            moves = BoardRules._construct_legal_moves_8(color, card, pawn, occupancy)
+        elif card.cardtype == CardType.CARD_10:
+            moves = BoardRules._construct_legal_moves_10(color, card, pawn, occupancy)
+        elif card.cardtype == CardType.CARD_11:
+            moves = BoardRules._construct_legal_moves_11(color, card, pawn, all_pawns, occupancy)
+        elif card.cardtype == CardType.CARD_12:
+            moves = BoardRules._construct_legal_moves_12(color, card, pawn, occupancy)
+        else:  # CardType.CARD_APOLOGIES, since the enumeration is exhaustive
+            moves = BoardRules._construct_legal_moves_apologies(color, card, pawn, all_pawns)
+        for move in moves:
+            BoardRules._augment_with_slides(occupancy, move)
+            yield move
 
     @staticmethod
     def distance_to_home(pawn: Pawn) -> int:
-        """Return the distance to home for this pawn, a number of squares when moving forward."""
-        if pawn.position.home:
+        """
+        Return the distance to home for this pawn, a number of squares when moving forward.
+
+        This is a lookup in DISTANCE_TO_HOME.  Callers that already have a position code can
+        index into that table directly.
+        """
+        return DISTANCE_TO_HOME[pawn.color][encode_position(pawn.position)]
+
+    @staticmethod
+    def _distance_to_home(color: PlayerColor, position: Position) -> int:
+        """Calculate the distance to home for a pawn of the given color at a position."""
+        if position.home:
             return 0
-        if pawn.position.start:
+        if position.start:
             return 65
-        if pawn.position.safe is not None:
-            return SAFE_SQUARES - pawn.position.safe
-        circle = CIRCLE[pawn.color].square
-        turn = TURN[pawn.color].square
-        square = pawn.position.square
+        if position.safe is not None:
+            return SAFE_SQUARES - position.safe
+        circle = CIRCLE[color].square
+        turn = TURN[color].square
+        square = position.square
         square_to_corner = BOARD_SQUARES - square  # type: ignore[operator]
         corner_to_turn = turn
         turn_to_home = SAFE_SQUARES + 1
@@ -156,6 +260,29 @@ def distance_to_home(pawn: Pawn) -> int:
             return total
         return total - 60
 
+    @staticmethod
+    def occupancy(all_pawns: list[Pawn], exclude: Pawn | None = None) -> dict[int, Pawn]:
+        """
+        Build an occupancy index, mapping position code to the first pawn found at that position.
+
+        Only squares on the board and in the safe areas are indexed, since any number of pawns
+        may share start or home.
+
+        Attributes:
+            all_pawns(List[Pawn]): All pawns on the board
+            exclude(Pawn, optional): A pawn to leave out of the index
+
+        Return:
+            Occupancy index for the pawns.
+        """
+        occupancy: dict[int, Pawn] = {}
+        for pawn in all_pawns:
+            if exclude is None or pawn != exclude:
+                code = encode_position(pawn.position)
+                if code < HOME_CODE:
+                    occupancy.setdefault(code, pawn)
+        return occupancy
+
     # noinspection PyChainedComparisons
     @staticmethod
     def _position(color: PlayerColor, position: Position, squares: int) -> Position:  # noqa: PLR0912,PLR0911
@@ -205,205 +332,333 @@ def _position(color: PlayerColor, position: Position, squares: int) -> Position:
         raise ValueError("Position is in an illegal state")
 
     @staticmethod
-    def _construct_legal_moves_1(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
-        """Return the set of legal moves for a pawn using CARD_1, possibly empty."""
-        moves: list[Move] = []
-        moves += BoardRules._move_circle(color, card, pawn, all_pawns)
-        moves += BoardRules._move_simple(color, card, pawn, all_pawns, 1)
-        return moves
+    def _target(color: PlayerColor, position: Position, squares: int) -> Position | None:
+        """
+        Look up the new position for a forward or backwards move, or None if the move is not legal.
+
+        This gives the same result as _position(), but uses the precomputed move table rather than
+        recursing.  A new position is returned every time, so the caller is free to modify it.
+        """
+        if _MIN_SQUARES <= squares <= _MAX_SQUARES:
+            target = _MOVE_TABLE[color][encode_position(position)][squares - _MIN_SQUARES]
+            return None if target is None else decode_position(target)
+        try:
+            return BoardRules._position(color, position, squares)
+        except ValueError:
+            return None
 
     @staticmethod
-    def _construct_legal_moves_2(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
-        """Return the set of legal moves for a pawn using CARD_2, possibly empty."""
-        moves: list[Move] = []
-        moves += BoardRules._move_circle(color, card, pawn, all_pawns)
-        moves += BoardRules._move_simple(color, card, pawn, all_pawns, 2)
-        return moves
+    def _construct_legal_moves_1(color: PlayerColor, card: Card, pawn: Pawn, occupancy: dict[int, Pawn]) -> Iterator[Move]:
+        """Generate the legal moves for a pawn using CARD_1, if any."""
+        yield from BoardRules._move_circle(color, card, pawn, occupancy)
+        yield from BoardRules._move_simple(color, card, pawn, occupancy, 1)
 
     @staticmethod
-    def _construct_legal_moves_3(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
-        """Return the set of legal moves for a pawn using CARD_3, possibly empty."""
-        return BoardRules._move_simple(color, card, pawn, all_pawns, 3)
+    def _construct_legal_moves_2(color: PlayerColor, card: Card, pawn: Pawn, occupancy: dict[int, Pawn]) -> Iterator[Move]:
+        """Generate the legal moves for a pawn using CARD_2, if any."""
+        yield from BoardRules._move_circle(color, card, pawn, occupancy)
+        yield from BoardRules._move_simple(color, card, pawn, occupancy, 2)
 
     @staticmethod
-    def _construct_legal_moves_4(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
-        """Return the set of legal moves for a pawn using CARD_4, possibly empty."""
-        return BoardRules._move_simple(color, card, pawn, all_pawns, -4)
+    def _construct_legal_moves_3(color: PlayerColor, card: Card, pawn: Pawn, occupancy: dict[int, Pawn]) -> Iterator[Move]:
+        """Generate the legal moves for a pawn using CARD_3, if any."""
+        return BoardRules._move_simple(color, card, pawn, occupancy, 3)
 
     @staticmethod
-    def _construct_legal_moves_5(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
-        """Return the set of legal moves for a pawn using CARD_5, possibly empty."""
-        return BoardRules._move_simple(color, card, pawn, all_pawns, 5)
+    def _construct_legal_moves_4(color: PlayerColor, card: Card, pawn: Pawn, occupancy: dict[int, Pawn]) -> Iterator[Move]:
+        """Generate the legal moves for a pawn using CARD_4, if any."""
+        return BoardRules._move_simple(color, card, pawn, occupancy, -4)
 
     @staticmethod
-    def _construct_legal_moves_7(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
-        """Return the set of legal moves for a pawn using CARD_7, possibly empty."""
-        moves: list[Move] = []
-        moves += BoardRules._move_simple(color, card, pawn, all_pawns, 7)
-        moves += BoardRules._move_split(color, card, pawn, all_pawns)
-        return moves
+    def _construct_legal_moves_5(color: PlayerColor, card: Card, pawn: Pawn, occupancy: dict[int, Pawn]) -> Iterator[Move]:
+        """Generate the legal moves for a pawn using CARD_5, if any."""
+        return BoardRules._move_simple(color, card, pawn, occupancy, 5)
 
     @staticmethod
-    def _construct_legal_moves_8(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
-        """Return the set of legal moves for a pawn using CARD_8, possibly empty."""
-        return BoardRules._move_simple(color, card, pawn, all_pawns, 8)
+    def _construct_legal_moves_7(
+        color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn], occupancy: dict[int, Pawn]
+    ) -> Iterator[Move]:
+        """Generate the legal moves for a pawn using CARD_7, if any."""
+        yield from BoardRules._move_simple(color, card, pawn, occupancy, 7)
+        yield from BoardRules._move_split(color, card, pawn, all_pawns)
 
     @staticmethod
-    def _construct_legal_moves_10(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
-        """Return the set of legal moves for a pawn using CARD_10, possibly empty."""
-        moves: list[Move] = []
-        moves += BoardRules._move_simple(color, card, pawn, all_pawns, 10)
-        moves += BoardRules._move_simple(color, card, pawn, all_pawns, -1)
-        return moves
+    def _construct_legal_moves_8(color: PlayerColor, card: Card, pawn: Pawn, occupancy: dict[int, Pawn]) -> Iterator[Move]:
+        """Generate the legal moves for a pawn using CARD_8, if any."""
+        return BoardRules._move_simple(color, card, pawn, occupancy, 8)
 
     @staticmethod
-    def _construct_legal_moves_11(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
-        """Return the set of legal moves for a pawn using CARD_11, possibly empty."""
-        moves: list[Move] = []
-        moves += BoardRules._move_swap(color, card, pawn, all_pawns)
-        moves += BoardRules._move_simple(color, card, pawn, all_pawns, 11)
-        return moves
+    def _construct_legal_moves_10(color: PlayerColor, card: Card, pawn: Pawn, occupancy: dict[int, Pawn]) -> Iterator[Move]:
+        """Generate the legal moves for a pawn using CARD_10, if any."""
+        yield from BoardRules._move_simple(color, card, pawn, occupancy, 10)
+        yield from BoardRules._move_simple(color, card, pawn, occupancy, -1)
+
+    @staticmethod
+    def _construct_legal_moves_11(
+        color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn], occupancy: dict[int, Pawn]
+    ) -> Iterator[Move]:
+        """Generate the legal moves for a pawn using CARD_11, if any."""
+        yield from BoardRules._move_swap(color, card, pawn, all_pawns)
+        yield from BoardRules._move_simple(color, card, pawn, occupancy, 11)
 
     @staticmethod
-    def _construct_legal_moves_12(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
-        """Return the set of legal moves for a pawn using CARD_12, possibly empty."""
-        return BoardRules._move_simple(color, card, pawn, all_pawns, 12)
+    def _construct_legal_moves_12(color: PlayerColor, card: Card, pawn: Pawn, occupancy: dict[int, Pawn]) -> Iterator[Move]:
+        """Generate the legal moves for a pawn using CARD_12, if any."""
+        return BoardRules._move_simple(color, card, pawn, occupancy, 12)
 
     @staticmethod
-    def _construct_legal_moves_apologies(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
-        """Return the set of legal moves for a pawn using CARD_APOLOGIES, possibly empty."""
+    def _construct_legal_moves_apologies(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> Iterator[Move]:
+        """Generate the legal moves for a pawn using CARD_APOLOGIES, if any."""
         return BoardRules._move_apologies(color, card, pawn, all_pawns)
 
     @staticmethod
-    def _find_pawn(all_pawns: list[Pawn], position: Position) -> Pawn | None:
-        """Return the first pawn at the indicated position, or None."""
-        for pawn in all_pawns:
-            if pawn.position == position:
-                return pawn
-        return None
+    def _find_pawn(occupancy: dict[int, Pawn], position: Position) -> Pawn | None:
+        """Return the first pawn at the indicated position on the board or in a safe area, or None."""
+        return occupancy.get(encode_position(position))
 
     @staticmethod
-    def _move_circle(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
+    def _move_circle(color: PlayerColor, card: Card, pawn: Pawn, occupancy: dict[int, Pawn]) -> Iterator[Move]:
         # For start-related cards, a pawn in the start area can move to the associated
         # circle position if that position is not occupied by another pawn of the same color.
-        moves: list[Move] = []
         if pawn.position.start:
-            conflict = BoardRules._find_pawn(all_pawns, CIRCLE[color])
+            conflict = BoardRules._find_pawn(occupancy, CIRCLE[color])
             if not conflict:
-                moves.append(Move(card, actions=[Action(ActionType.MOVE_TO_POSITION, pawn, CIRCLE[color].copy())]))
+                yield Move(card, actions=[Action(ActionType.MOVE_TO_POSITION, pawn, CIRCLE[color].copy())])
             elif conflict and conflict.color != color:
-                moves.append(
-                    Move(
-                        card,
-                        actions=[Action(ActionType.MOVE_TO_POSITION, pawn, CIRCLE[color].copy())],
-                        side_effects=[Action(ActionType.MOVE_TO_START, conflict)],
-                    )
+                yield Move(
+                    card,
+                    actions=[Action(ActionType.MOVE_TO_POSITION, pawn, CIRCLE[color].copy())],
+                    side_effects=[Action(ActionType.MOVE_TO_START, conflict)],
                 )
-        return moves
 
     @staticmethod
-    def _move_simple(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn], squares: int) -> list[Move]:
+    def _move_simple(color: PlayerColor, card: Card, pawn: Pawn, occupancy: dict[int, Pawn], squares: int) -> Iterator[Move]:
         # For most cards, a pawn on the board can move forward or backward if the
         # resulting position is not occupied by another pawn of the same color.
-        moves: list[Move] = []
         if pawn.position.square is not None or pawn.position.safe is not None:
-            try:
-                target = BoardRules._position(color, pawn.position, squares)
-                if target.home or target.start:  # by definition, there can't be a conflict going to home or start
-                    moves.append(Move(card, actions=[Action(ActionType.MOVE_TO_POSITION, pawn, target)]))
-                else:
-                    conflict = BoardRules._find_pawn(all_pawns, target)
-                    if not conflict:
-                        moves.append(Move(card, actions=[Action(ActionType.MOVE_TO_POSITION, pawn, target)]))
-                    elif conflict and conflict.color != color:
-                        moves.append(
-                            Move(
-                                card,
-                                actions=[Action(ActionType.MOVE_TO_POSITION, pawn, target)],
-                                side_effects=[Action(ActionType.MOVE_TO_START, conflict)],
-                            )
-                        )
-            except ValueError:
+            target = BoardRules._target(color, pawn.position, squares)
+            if target is None:
                 pass  # if the requested position is not legal, then just ignore it
-        return moves
+            elif target.home or target.start:  # by definition, there can't be a conflict going to home or start
+                yield Move(card, actions=[Action(ActionType.MOVE_TO_POSITION, pawn, target)])
+            else:
+                conflict = BoardRules._find_pawn(occupancy, target)
+                if not conflict:
+                    yield Move(card, actions=[Action(ActionType.MOVE_TO_POSITION, pawn, target)])
+                elif conflict and conflict.color != color:
+                    yield Move(
+                        card,
+                        actions=[Action(ActionType.MOVE_TO_POSITION, pawn, target)],
+                        side_effects=[Action(ActionType.MOVE_TO_START, conflict)],
+                    )
 
     @staticmethod
-    def _move_split(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
+    def _move_split(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> Iterator[Move]:
         # For the 7 card, we can split up the move between two different pawns.
         # Any combination of 7 forward moves is legal, as long as the resulting position
         # is not occupied by another pawn of the same color.
-        moves: list[Move] = []
         for other in all_pawns:
             if other != pawn and other.color == color and not other.position.home and not other.position.start:
+                occupancy = BoardRules.occupancy(all_pawns, exclude=other)  # the other pawn is moving, so it can't conflict
                 for left, right in [(1, 6), (2, 5), (3, 4), (4, 3), (5, 2), (6, 1)]:  # legal ways to split up a move of 7
-                    left_moves = BoardRules._move_simple(color, card, pawn, [p for p in all_pawns if p != other], left)
-                    right_moves = BoardRules._move_simple(color, card, other, [p for p in all_pawns if p != other], right)
-                    if left_moves and right_moves:
-                        moves.append(
-                            Move(
+                    left_move = next(BoardRules._move_simple(color, card, pawn, occupancy, left), None)
+                    if left_move:  # if the first half isn't legal, there's no need to look at the second half
+                        right_move = next(BoardRules._move_simple(color, card, other, occupancy, right), None)
+                        if right_move:
+                            yield Move(
                                 card,
-                                actions=left_moves[0].actions + right_moves[0].actions,
-                                side_effects=left_moves[0].side_effects + right_moves[0].side_effects,
+                                actions=left_move.actions + right_move.actions,
+                                side_effects=left_move.side_effects + right_move.side_effects,
                             )
-                        )
-        return moves
 
     @staticmethod
-    def _move_swap(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
+    def _move_swap(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> Iterator[Move]:
         # For the 11 card, a pawn on the board can swap with another pawn of a different
         # color, as long as that pawn is outside of the start area, safe area, or home area.
-        moves: list[Move] = []
         if pawn.position.square is not None:  # pawn is on the board
             for swap in all_pawns:
                 if swap.color != color and not swap.position.home and not swap.position.start and swap.position.safe is None:
-                    moves.append(
-                        Move(
-                            card,
-                            actions=[
-                                Action(ActionType.MOVE_TO_POSITION, pawn, swap.position.copy()),
-                                Action(ActionType.MOVE_TO_POSITION, swap, pawn.position.copy()),
-                            ],
-                        )
+                    yield Move(
+                        card,
+                        actions=[
+                            Action(ActionType.MOVE_TO_POSITION, pawn, swap.position.copy()),
+                            Action(ActionType.MOVE_TO_POSITION, swap, pawn.position.copy()),
+                        ],
                     )
-        return moves
 
     @staticmethod
-    def _move_apologies(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> list[Move]:
+    def _move_apologies(color: PlayerColor, card: Card, pawn: Pawn, all_pawns: list[Pawn]) -> Iterator[Move]:
         # For the Apologies card, a pawn in start can swap with another pawn of a different
         # color, as long as that pawn is outside of the start area, safe area, or home area.
-        moves: list[Move] = []
         if pawn.position.start:
             for swap in all_pawns:
                 if swap.color != color and not swap.position.home and not swap.position.start and swap.position.safe is None:
-                    moves.append(
-                        Move(
-                            card,
-                            actions=[
-                                Action(ActionType.MOVE_TO_POSITION, pawn, swap.position.copy()),
-                                Action(ActionType.MOVE_TO_START, swap),
-                            ],
-                        )
+                    yield Move(
+                        card,
+                        actions=[
+                            Action(ActionType.MOVE_TO_POSITION, pawn, swap.position.copy()),
+                            Action(ActionType.MOVE_TO_START, swap),
+                        ],
                     )
-        return moves
 
     # pylint: disable=too-many-nested-blocks
     @staticmethod
-    def _augment_with_slides(all_pawns: list[Pawn], moves: list[Move]) -> None:
-        """Augument any legal moves with additional side-effects that occur as a result of slides."""
-        for move in moves:  # noqa: PLR1702
-            for action in move.actions:
-                if action.actiontype == ActionType.MOVE_TO_POSITION:  # look at any move to a position on the board
-                    for color in [color for color in PlayerColor if color != action.pawn.color]:  # any color other than the pawn's
-                        for start, end in SLIDE[color]:  # look at all slides with this color
-                            if action.position and action.position.square == start:  # if the pawn landed on the start of the slide
-                                action.position.move_to_square(end)  # move the pawn to the end of the slide
-                                for square in range(start + 1, end + 1):  # and then bump any pawns that were already on the slide
-                                    # Note: in this one case, a pawn can bump another pawn of the same color
-                                    pawn = BoardRules._find_pawn(all_pawns, Position().move_to_square(square))
-                                    if pawn:
-                                        bump = Action(ActionType.MOVE_TO_START, pawn)
-                                        if bump not in move.actions:
-                                            move.side_effects.append(bump)
+    def _augment_with_slides(occupancy: dict[int, Pawn], move: Move) -> None:
+        """Augument a legal move with additional side-effects that occur as a result of slides."""
+        for action in move.actions:  # noqa: PLR1702
+            if action.actiontype == ActionType.MOVE_TO_POSITION:  # look at any move to a position on the board
+                for color in [color for color in PlayerColor if color != action.pawn.color]:  # any color other than the pawn's
+                    for start, end in SLIDE[color]:  # look at all slides with this color
+                        if action.position and action.position.square == start:  # if the pawn landed on the start of the slide
+                            action.position.move_to_square(end)  # move the pawn to the end of the slide
+                            for square in range(start + 1, end + 1):  # and then bump any pawns that were already on the slide
+                                # Note: in this one case, a pawn can bump another pawn of the same color
+                                pawn = occupancy.get(square)  # the position code for a square is the square itself
+                                if pawn:
+                                    bump = Action(ActionType.MOVE_TO_START, pawn)
+                                    if bump not in move.actions:
+                                        move.side_effects.append(bump)
+
+
+def _build_move_table() -> dict[PlayerColor, tuple[tuple[int | None, ...], ...]]:
+    """Build the move table, mapping (color, position code, squares) to a target position code or None if illegal."""
+    table = {}
+    for color in PlayerColor:
+        rows = []
+        for code in range(POSITION_CODES):
+            row: list[int | None] = []
+            for squares in range(_MIN_SQUARES, _MAX_SQUARES + 1):
+                try:
+                    row.append(encode_position(BoardRules._position(color, decode_position(code), squares)))  # noqa: SLF001
+                except ValueError:
+                    row.append(None)
+            rows.append(tuple(row))
+        table[color] = tuple(rows)
+    return table
+
+
+# Precomputed targets for every forward or backwards move allowed by any card, indexed by [color][code][squares - _MIN_SQUARES]
+_MOVE_TABLE = _build_move_table()
+
+
+def _build_distance_table() -> dict[PlayerColor, tuple[int, ...]]:
+    """Build the distance table, mapping (color, position code) to the distance to home."""
+    return {
+        color: tuple(BoardRules._distance_to_home(color, decode_position(code)) for code in range(POSITION_CODES))  # noqa: SLF001
+        for color in PlayerColor
+    }
+
+
+# Precomputed distance to home for every position, indexed by [color][code]
+DISTANCE_TO_HOME = _build_distance_table()
+
+
+def _copy_actions(actions: Iterable[Action], pawns: dict[tuple[PlayerColor, int], Pawn]) -> list[Action]:
+    """Copy actions along with their pawns and positions, sharing one copy of each pawn via the passed-in dict."""
+    result = []
+    for action in actions:
+        pawn = pawns.get((action.pawn.color, action.pawn.index))
+        if pawn is None:
+            pawn = pawns[action.pawn.color, action.pawn.index] = action.pawn.copy()
+        position = action.position.copy() if action.position else None
+        result.append(Action(action.actiontype, pawn, position))
+    return result
+
+
+@define
+class LegalMoveCache:
+    # noinspection PyUnresolvedReferences
+    """
+    A bounded least-recently-used cache of legal moves, for use by Rules.construct_legal_moves().
+
+    The legal moves for a card depend only on the placement of the pawns on the board (which
+    pawn of which color is where), the color of the player, and the type of the card.  So,
+    the cache is keyed on exactly that, and each entry holds a template for each legal move.
+    A template is re-bound to the caller's card on every hit, so the moves that are returned
+    always reference the card that was actually played, and each move gets its own identifier.
+    The pawns and positions referenced by a template's actions are private copies, and every
+    hit returns new copies of them, so neither changes to a view nor changes to a returned
+    move can affect what is cached.
+
+    A single cache can be shared across many Rules objects (for instance, across all of the
+    games in a simulation), since nothing in the cache depends on any particular game.  Use
+    the hit and miss counters to size the cache for a workload.
+
+    Attributes:
+        maxsize(int): Maximum number of entries to hold, where each entry is one (board, color, card type)
+        hits(int): Number of lookups that were found in the cache
+        misses(int): Number of lookups that were not found in the cache
+    """
+
+    maxsize: int = field()
+    hits: int = field(init=False, default=0)
+    misses: int = field(init=False, default=0)
+    _entries: OrderedDict[CacheKey, list[tuple[tuple[Action, ...], tuple[Action, ...]]]] = field(init=False, factory=OrderedDict)
+
+    # noinspection PyUnresolvedReferences
+    @maxsize.validator
+    def _check_maxsize(self, _attribute: str, value: int) -> None:
+        if value < 1:
+            raise ValueError("Cache size must be at least 1")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups that were found in the cache, or 0.0 if there have been no lookups."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @staticmethod
+    def placement(all_pawns: list[Pawn]) -> Placement:
+        """Return a compact, hashable summary of the placement of a list of pawns, for use in a cache key."""
+        return tuple(pawn.color for pawn in all_pawns), bytes(encode_position(pawn.position) for pawn in all_pawns)
+
+    def get(self, key: CacheKey, card: Card) -> list[Move] | None:
+        """
+        Return the cached legal moves for a key, re-bound to a card, or None if the key is not cached.
+
+        Args:
+            key(CacheKey): Cache key, as (placement, color, card type)
+            card(Card): Card that the returned moves should reference
+
+        Returns:
+            List[Move]: New legal moves based on the cached templates, or None
+        """
+        templates = self._entries.get(key)
+        if templates is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        moves = []
+        for actions, side_effects in templates:
+            pawns: dict[tuple[PlayerColor, int], Pawn] = {}
+            moves.append(Move(card, _copy_actions(actions, pawns), _copy_actions(side_effects, pawns)))
+        return moves
+
+    def put(self, key: CacheKey, moves: list[Move]) -> None:
+        """
+        Cache templates for the legal moves associated with a key, evicting the least-recently-used entry if necessary.
+
+        Args:
+            key(CacheKey): Cache key, as (placement, color, card type)
+            moves(List[Move]): Legal moves to cache, which are not modified
+        """
+        pawns: dict[tuple[PlayerColor, int], Pawn] = {}
+        self._entries[key] = [
+            (tuple(_copy_actions(move.actions, pawns)), tuple(_copy_actions(move.side_effects, pawns))) for move in moves
+        ]
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries from the cache and reset the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
 
 
 # noinspection PyProtectedMember
@@ -413,11 +668,17 @@ class Rules:
     """
     Implements rules related to game play.
 
+    Pass in a LegalMoveCache to cache the results of construct_legal_moves().  This helps when
+    the same board is evaluated more than once, which is common in adult mode (where a player
+    evaluates each card in a hand against the same board, turn after turn) and in simulations.
+
     Attributes:
         mode(GameMode): The game mode
+        cache(LegalMoveCache, optional): Cache of legal moves, or None to always construct legal moves from scratch
     """
 
     mode: GameMode
+    cache: LegalMoveCache | None = field(default=None, kw_only=True)
     _board_rules: BoardRules = field(init=False, factory=BoardRules)
 
     # noinspection PyMethodMayBeStatic
@@ -449,19 +710,62 @@ def construct_legal_moves(self, view: PlayerView, card: Card | None = None) -> l
         Returns:
             List[Move]: Set of legal moves for the player, as described above.
         """
-        moves: list[Move] = []
+        return list(self.iter_legal_moves(view, card))
+
+    def iter_legal_moves(self, view: PlayerView, card: Card | None = None) -> Iterator[Move]:
+        """
+        Generate all legal moves for a player and its opponents, one at a time.
+
+        This yields the same moves as construct_legal_moves(), in the same order, but moves are
+        constructed only as they're requested.  A caller that only needs the first move that meets
+        some condition can stop early, without paying to construct the rest.  The view must not
+        change until iteration is complete.  If a cache is in use, all of the moves for a card are
+        constructed at once, so that they can be cached.
+
+        Attributes:
+            view(PlayerView): Player-specific view of the game
+            card(Card, optional): The card to play, or None if move should come from player's hand
+
+        Returns:
+            Iterator[Move]: Iterator over the legal moves for the player, as described above.
+
+        Raises:
+            ValueError: If no legal moves can be constructed, which is an internal error
+        """
+        found = False
         all_pawns = view.all_pawns()
+        occupancy = BoardRules.occupancy(all_pawns)  # built once, and shared across all cards and pawns
+        placement = LegalMoveCache.placement(all_pawns) if self.cache is not None else ((), b"")
         for played in [card] if card else view.player.hand:
-            for pawn in view.player.pawns:
-                for move in self._board_rules.construct_legal_moves(view.player.color, played, pawn, all_pawns):
-                    if move not in moves:  # filter out duplicates
-                        moves.append(move)
-        if not moves:  # if there are no legal moves, then forfeit (discarding one card) becomes the only allowable move
+            if self.cache is None:
+                moves: Iterable[Move] = self._iter_card_moves(view.player, played, all_pawns, occupancy)
+            else:
+                key = (placement, view.player.color, played.cardtype)
+                cached = self.cache.get(key, played)
+                if cached is None:
+                    cached = list(self._iter_card_moves(view.player, played, all_pawns, occupancy))
+                    self.cache.put(key, cached)
+                moves = cached
+            for move in moves:
+                found = True
+                yield move
+        if not found:  # if there are no legal moves, then forfeit (discarding one card) becomes the only allowable move
             for played in [card] if card else view.player.hand:
-                moves.append(Move(played, []))
-        if not moves:  # if there are still no legal moves, then this is an internal error
+                found = True
+                yield Move(played, [])
+        if not found:  # if there are still no legal moves, then this is an internal error
             raise ValueError("Internal error: could not construct any legal moves")
-        return moves
+
+    def _iter_card_moves(self, player: Player, card: Card, all_pawns: list[Pawn], occupancy: dict[int, Pawn]) -> Iterator[Move]:
+        """Generate the legal moves for one of a player's cards, without any duplicates."""
+        # Playing a different card is a different move, even if the type is the same, so it's sufficient to filter within one card
+        seen: set[MoveKey] = set()
+        for pawn in player.pawns:
+            for move in self._board_rules.iter_legal_moves(player.color, card, pawn, all_pawns, occupancy):
+                key = move.key()
+                if key not in seen:  # filter out duplicates
+                    seen.add(key)
+                    yield move
 
     # noinspection PyMethodMayBeStatic
     def execute_move(self, game: Game, player: Player, move: Move) -> None:  # noqa: PLR6301
@@ -473,17 +777,23 @@ def execute_move(self, game: Game, player: Player, move: Move) -> None:  # noqa:
             player(Player): Color of the player associated with the move
             move(Move): Move to validate
         """
-        log = f"Played card {move.card.cardtype.value}: [ "
+        verbose = game.tracks_player_actions  # otherwise, there's no point in building a log message
+        log = f"Played card {move.card.cardtype.value}: [ " if verbose else ""
         for action in move.actions + move.side_effects:  # execute actions, then side-effects, in order
             # Keep in mind that the pawn on the action is a different object than the pawn in the game
             pawn = game.players[action.pawn.color].pawns[action.pawn.index]
+            if game.journal is not None:
+                game.journal.record(partial(pawn.position.move_to_position, pawn.position.copy()))
             if action.actiontype == ActionType.MOVE_TO_START:
                 pawn.position.move_to_start()
-                log += f"{pawn.name}->start, "
+                if verbose:
+                    log += f"{pawn.name}->start, "
             elif action.actiontype == ActionType.MOVE_TO_POSITION and action.position:
                 pawn.position.move_to_position(action.position)
-                log += f"{pawn}, "
-        log += "]"
+                if verbose:
+                    log += f"{pawn}, "
+        if verbose:
+            log += "]"
         game.track(log, player, move.card)
         if game.completed:
             game.track(f"Game completed: winner is {game.winner.color.value} after {game.winner.turns} turns")
@@ -514,6 +824,97 @@ def evaluate_move(view: PlayerView, move: Move) -> PlayerView:
                     pawn.position.move_to_position(action.position)
         return result
 
+    @staticmethod
+    def apply_move(view: PlayerView, move: Move) -> UndoLog:
+        """
+        Apply the passed-in move to a player view in-place, returning a log that can be used to undo it.
+
+        This gives the same result as evaluate_move(), but modifies the passed-in view rather than
+        constructing a new one, so it's much cheaper when evaluating many moves.  The caller must pass
+        the returned log to undo_move() to restore the view to its original state.  Most callers will
+        want to use evaluate_move_in_place() instead, which guarantees that the undo happens.
+
+        Args:
+            view(PlayerView): Player-specific view of the game, which will be modified
+            move(Move): Move to apply
+
+        Returns:
+            UndoLog: Log of changes that were made to the view
+        """
+        undo: UndoLog = []
+        for action in move.actions + move.side_effects:  # execute actions, then side-effects, in order
+            # Keep in mind that the pawn on the action is a different object than the pawn in the view
+            pawn = Rules._find_view_pawn(view, action.pawn)
+            if pawn:  # if the pawn isn't valid, just ignore it
+                position = pawn.position
+                if action.actiontype == ActionType.MOVE_TO_START:
+                    undo.append((position, position.start, position.home, position.safe, position.square))
+                    position.move_to_start()
+                elif action.actiontype == ActionType.MOVE_TO_POSITION and action.position:
+                    undo.append((position, position.start, position.home, position.safe, position.square))
+                    position.move_to_position(action.position)
+        return undo
+
+    @staticmethod
+    def undo_move(undo: UndoLog) -> None:
+        """
+        Undo a move that was previously applied to a player view with apply_move().
+
+        Args:
+            undo(UndoLog): Log of changes returned from apply_move()
+        """
+        for position, start, home, safe, square in reversed(undo):
+            position.start, position.home, position.safe, position.square = start, home, safe, square
+
+    @staticmethod
+    @contextmanager
+    def evaluate_move_in_place(view: PlayerView, move: Move) -> Iterator[PlayerView]:
+        """
+        Context manager that temporarily applies the passed-in move to a player view.
+
+        Within the context, the view reflects the state after executing the move, exactly as if it
+        had been returned from evaluate_move().  When the context exits, even due to an exception, the
+        view is restored to its original state.  No copy of the view is made, so callers must not
+        hold on to the view or any of its pawns after the context exits.
+
+        Args:
+            view(PlayerView): Player-specific view of the game, which will be temporarily modified
+            move(Move): Move to evaluate
+
+        Returns:
+            Iterator[PlayerView]: The passed-in view, with the move applied
+        """
+        undo = Rules.apply_move(view, move)
+        try:
+            yield view
+        finally:
+            Rules.undo_move(undo)
+
+    @staticmethod
+    def _find_view_pawn(view: PlayerView, prototype: Pawn) -> Pawn | None:
+        """Return the pawn from a view with the same color and index, like PlayerView.get_pawn() without a scan."""
+        player = view.player if prototype.color == view.player.color else view.opponents.get(prototype.color)
+        if player is None or not 0 <= prototype.index < len(player.pawns):
+            return None
+        pawn = player.pawns[prototype.index]
+        return pawn if pawn.index == prototype.index else view.get_pawn(prototype)
+
+    @staticmethod
+    def execute_compact_move(state: CompactGame | CompactView, move: Move) -> None:
+        """
+        Execute a player's move against a compact game or view, updating state in-place.
+
+        This is equivalent to evaluate_move(), but operates on the compact representation and
+        does not create any new objects.  No history is tracked and no cards are discarded.
+
+        Args:
+            state(CompactGame | CompactView): Compact state to operate on
+            move(Move): Move to execute
+        """
+        for (color, index), code in move.final_positions().items():
+            if color in state.colors and 0 <= index < PAWNS:  # if the pawn isn't valid, just ignore it
+                state.pawns[state.offset(color) + index] = code
+
     @staticmethod
     def _setup_adult_mode(game: Game) -> None:
         """Setup adult mode at the start of the game, which moves some pieces and deals some cards."""
@@ -3,23 +3,46 @@
 
 """
 Run a simulation to see how well different character input sources behave.
+
+Results are streamed rather than collected in memory.  As each game finishes, its result
+is optionally written to a per-game results file, and is folded into online accumulators
+for the scenario.  Scenario statistics are computed from those accumulators: means use
+Welford's method, and medians are estimated with the P-squared algorithm.  So, memory use
+stays flat regardless of the number of iterations, and the results for any completed games
+and scenarios survive an interrupted run.
+
+Every game is also profiled with an EngineProfiler, using a high-resolution clock.  For each
+source, the scenario CSV file includes the mean wall time per call for each phase of play, and
+the estimated p50, p95 and p99 latency for a turn and for a decision (a call to choose_move()),
+across all games in the scenario.
+
+Attributes:
+    BASE_HEADERS(List[str]): Columns in the scenario CSV file that apply to all sources
+    SOURCE_HEADERS(List[str]): Columns in the scenario CSV file that are repeated for each source
+    RESULT_HEADERS(List[str]): Columns in the per-game results CSV file
 """
 
 import csv
-import statistics
+import json
+import os
+import random
+import time
 import typing
-from collections.abc import Sequence
-from itertools import combinations_with_replacement
+from bisect import bisect_right
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import combinations_with_replacement, islice
 from pathlib import Path
 
-from arrow import Arrow
 from arrow import now as arrow_now
-from attrs import frozen
+from attrs import define, field, frozen
 
-from apologies.engine import Character, Engine
-from apologies.game import MAX_PLAYERS, MIN_PLAYERS, GameMode, Player
+from apologies.engine import Character, Engine, EnginePhase, EngineProfiler
+from apologies.game import MAX_PLAYERS, MIN_PLAYERS, GameMode, HistoryMode, PlayerColor
 from apologies.source import CharacterInputSource
-from apologies.util import ISO_TIMESTAMP_FORMAT
+from apologies.util import ISO_TIMESTAMP_FORMAT, create_rng
 
 if typing.TYPE_CHECKING:
     # noinspection PyUnusedImports
@@ -45,29 +68,273 @@
     "Mean Turns",
     "Median Duration (ms)",
     "Mean Duration (ms)",
+    "Mean Turn (us)",
+    "Mean Create Player View (us)",
+    "Mean Construct Legal Moves (us)",
+    "Mean Choose Move (us)",
+    "Mean Execute Move (us)",
+    "Turn p50 (us)",
+    "Turn p95 (us)",
+    "Turn p99 (us)",
+    "Decision p50 (us)",
+    "Decision p95 (us)",
+    "Decision p99 (us)",
     "Wins",
     "Win %",
 ]
 
+RESULT_HEADERS = [
+    "Scenario",
+    "Mode",
+    "Players",
+    "Iteration",
+    "Winner",
+    "Color",
+    "Turns",
+    "Duration (ms)",
+]
+
+# Upper bound on the number of games in a shard, so work is spread evenly and results arrive steadily
+_MAX_SHARD_ITERATIONS = 100
+
+# Number of shards per worker that may be queued or completed but not yet consumed
+_SHARDS_PER_WORKER = 2
+
+# Number of markers used by the P-squared algorithm
+_P2_MARKERS = 5
+
+# Phases of play profiled for each source, in the same order as the per-phase columns in SOURCE_HEADERS
+_PHASES = [
+    EnginePhase.TURN,
+    EnginePhase.CREATE_PLAYER_VIEW,
+    EnginePhase.CONSTRUCT_LEGAL_MOVES,
+    EnginePhase.CHOOSE_MOVE,
+    EnginePhase.EXECUTE_MOVE,
+]
+
+# Phases of play with a latency distribution for each source, in the same order as the latency columns in SOURCE_HEADERS
+_LATENCY_PHASES = [EnginePhase.TURN, EnginePhase.CHOOSE_MOVE]
+
+# Quantiles of each latency distribution, in the same order as the latency columns in SOURCE_HEADERS
+_LATENCY_QUANTILES = [0.5, 0.95, 0.99]
 
-def _mean(data: Sequence[float]) -> float | None:
-    """Calculate the mean rounded to 2 decimal places or return None if there is not any data."""
-    return round(statistics.mean(data), 2) if data else None
 
+def _round(value: float | None) -> float | None:
+    """Round a value to 2 decimal places, or return None if there is no value."""
+    return round(value, 2) if value is not None else None
 
-def _median(data: Sequence[float]) -> float | None:
-    """Calculate the median rounded to 2 decimal places or return None if there is not any data."""
-    return round(statistics.median(data), 2) if data else None
+
+@define
+class _Quantile:
+    """
+    Online estimate of a quantile, using the P-squared algorithm in constant memory.
+
+    See: Jain and Chlamtac, "The P² Algorithm for Dynamic Calculation of Quantiles and
+    Histograms Without Storing Observations", CACM 28(10), 1985.  The estimate is exact
+    until more than five values have been added.
+    """
+
+    p: float
+    _heights: list[float] = field(factory=list)
+    _positions: list[int] = field(factory=lambda: list(range(1, _P2_MARKERS + 1)))
+    _desired: list[float] = field(init=False)
+    _increments: list[float] = field(init=False)
+
+    # noinspection PyUnresolvedReferences
+    @_desired.default
+    def _default_desired(self) -> list[float]:
+        return [1, 1 + 2 * self.p, 1 + 4 * self.p, 3 + 2 * self.p, 5]
+
+    # noinspection PyUnresolvedReferences
+    @_increments.default
+    def _default_increments(self) -> list[float]:
+        return [0, self.p / 2, self.p, (1 + self.p) / 2, 1]
+
+    @property
+    def value(self) -> float | None:
+        """The current estimate of the quantile, or None if no values have been added."""
+        if not self._heights:
+            return None
+        if self._positions[-1] > _P2_MARKERS:
+            return self._heights[2]
+        rank = self.p * (len(self._heights) - 1)  # exact, interpolating between the values that have been added
+        lower = int(rank)
+        upper = min(lower + 1, len(self._heights) - 1)
+        return self._heights[lower] + (rank - lower) * (self._heights[upper] - self._heights[lower])
+
+    def add(self, value: float) -> None:
+        """Add a value to the estimate."""
+        heights, positions = self._heights, self._positions
+        if len(heights) < _P2_MARKERS:
+            heights.insert(bisect_right(heights, value), value)
+            return
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[-1]:
+            heights[-1] = value
+            cell = _P2_MARKERS - 2
+        else:
+            cell = bisect_right(heights, value) - 1
+        for marker in range(cell + 1, _P2_MARKERS):
+            positions[marker] += 1
+        for marker in range(_P2_MARKERS):
+            self._desired[marker] += self._increments[marker]
+        for marker in range(1, _P2_MARKERS - 1):
+            offset = self._desired[marker] - positions[marker]
+            if (offset >= 1 and positions[marker + 1] - positions[marker] > 1) or (
+                offset <= -1 and positions[marker - 1] - positions[marker] < -1
+            ):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(marker, step)
+                if not heights[marker - 1] < height < heights[marker + 1]:
+                    height = self._linear(marker, step)
+                heights[marker] = height
+                positions[marker] += step
+
+    def _parabolic(self, marker: int, step: int) -> float:
+        """Adjust a marker height using the piecewise-parabolic formula."""
+        q, n = self._heights, self._positions
+        return q[marker] + step / (n[marker + 1] - n[marker - 1]) * (
+            (n[marker] - n[marker - 1] + step) * (q[marker + 1] - q[marker]) / (n[marker + 1] - n[marker])
+            + (n[marker + 1] - n[marker] - step) * (q[marker] - q[marker - 1]) / (n[marker] - n[marker - 1])
+        )
+
+    def _linear(self, marker: int, step: int) -> float:
+        """Adjust a marker height using linear interpolation, if the parabolic formula is out of bounds."""
+        q, n = self._heights, self._positions
+        return q[marker] + step * (q[marker + step] - q[marker]) / (n[marker + step] - n[marker])
+
+
+@define
+class _Summary:
+    """Online summary of a series of values: the count, the mean via Welford's method, and an estimated median."""
+
+    count: int = 0
+    _mean: float = 0.0
+    _median: _Quantile = field(factory=lambda: _Quantile(0.5))
+
+    @property
+    def mean(self) -> float | None:
+        """The mean of the values, or None if no values have been added."""
+        return self._mean if self.count > 0 else None
+
+    @property
+    def median(self) -> float | None:
+        """The estimated median of the values, or None if no values have been added."""
+        return self._median.value
+
+    def add(self, value: float) -> None:
+        """Add a value to the summary."""
+        self.count += 1
+        self._mean += (value - self._mean) / self.count
+        self._median.add(value)
+
+
+@define
+class _Latency:
+    """Online estimates of the quantiles of a latency distribution, in constant memory."""
+
+    _quantiles: list[_Quantile] = field(factory=lambda: [_Quantile(p) for p in _LATENCY_QUANTILES])
+
+    @property
+    def values(self) -> list[float | None]:
+        """The estimated value of each quantile, in the same order as _LATENCY_QUANTILES."""
+        return [quantile.value for quantile in self._quantiles]
+
+    def add(self, value: float) -> None:
+        """Add a value to the estimates."""
+        for quantile in self._quantiles:
+            quantile.add(value)
+
+
+@define
+class _GameProfiler(EngineProfiler):
+    """Profiler for a single game, which also keeps individual samples for the phases with a latency distribution."""
+
+    samples: dict[tuple[str, EnginePhase], list[int]] = field(factory=dict)
+
+    def record(self, name: str, phase: EnginePhase, elapsed_ns: int) -> None:
+        super().record(name, phase, elapsed_ns)
+        if phase in _LATENCY_PHASES:
+            self.samples.setdefault((name, phase), []).append(elapsed_ns)
+
+
+@define
+class _ScenarioProfile:
+    """Phase timings and latency distributions for each source, across all games in a scenario."""
+
+    timings: EngineProfiler = field(factory=EngineProfiler)
+    latencies: dict[str, dict[EnginePhase, _Latency]] = field(factory=dict)
+
+    def latency(self, name: str, phase: EnginePhase) -> _Latency:
+        """Return the latency distribution for a phase of play for a source, which is empty if nothing has been added."""
+        return self.latencies.setdefault(name, {}).setdefault(phase, _Latency())
+
+    def add(self, profile: _GameProfiler) -> None:
+        """Add the profile for a game."""
+        self.timings.merge(profile)
+        for (name, phase), samples in profile.samples.items():
+            latency = self.latency(name, phase)
+            for sample in samples:
+                latency.add(sample)
 
 
 @frozen
 class _Result:
     """Result of a single game within a scenario."""
 
-    start: Arrow
-    stop: Arrow
-    character: Character
-    player: Player
+    scenario: int
+    iteration: int
+    winner: str
+    color: PlayerColor
+    turns: int
+    duration_ms: float
+    profile: _GameProfiler = field(factory=_GameProfiler, eq=False)
+
+
+@define
+class _Accumulator:
+    """Online statistics about the games won by a source, or by any source, within a scenario."""
+
+    turns: _Summary = field(factory=_Summary)
+    durations: _Summary = field(factory=_Summary)
+
+    @property
+    def wins(self) -> int:
+        """Number of games won."""
+        return self.turns.count
+
+    def add(self, result: _Result) -> None:
+        """Add the result of a game to the statistics."""
+        self.turns.add(result.turns)
+        self.durations.add(result.duration_ms)
+
+
+@frozen
+class _Scenario:
+    """A scenario to be simulated: a game mode and a combination of sources."""
+
+    scenario: int
+    mode: GameMode
+    players: int
+    case: int
+    combination: tuple[CharacterInputSource, ...]
+
+    @property
+    def prefix(self) -> str:
+        """Prefix used when displaying progress for the scenario."""
+        return f"Scenario {self.scenario}: {self.mode.name} mode with {self.players} players (case {self.case}): "
+
+
+@frozen
+class _Shard:
+    """A shard of work for a scenario, to be run in a worker process."""
+
+    scenario: _Scenario
+    seed: int
+    first: int
+    iterations: int
 
 
 @frozen
@@ -81,19 +348,28 @@ class _Statistics:
     mean_duration: float | None
     wins: int
     win_percent: float
+    mean_phases: list[float | None] = field(factory=list)
+    latencies: list[float | None] = field(factory=list)
 
     @staticmethod
-    def for_results(name: str | None, results: list[_Result]) -> "_Statistics":
-        in_scope = [result for result in results if name is None or result.character.source.name == name]
-        turns = [result.player.turns for result in in_scope]
-        durations_ms = [(result.stop - result.start).microseconds / 1000 for result in in_scope]
-        median_turns = _median(turns)
-        mean_turns = _mean(turns)
-        median_duration = _median(durations_ms)
-        mean_duration = _mean(durations_ms)
-        wins = len(in_scope)
-        win_percent = 0.0 if len(results) == 0 else round(100.0 * (wins / len(results)), 1)
-        return _Statistics(name, median_turns, mean_turns, median_duration, mean_duration, wins, win_percent)
+    def for_accumulator(
+        name: str | None, accumulator: _Accumulator, games: int, profile: _ScenarioProfile | None = None
+    ) -> "_Statistics":
+        median_turns = _round(accumulator.turns.median)
+        mean_turns = _round(accumulator.turns.mean)
+        median_duration = _round(accumulator.durations.median)
+        mean_duration = _round(accumulator.durations.mean)
+        wins = accumulator.wins
+        win_percent = 0.0 if games == 0 else round(100.0 * (wins / games), 1)
+        mean_phases, latencies = [], []
+        if name is not None and profile is not None:  # timings are in microseconds, and include all games, not just wins
+            timings = [profile.timings.timing(name, phase).mean_ns for phase in _PHASES]
+            mean_phases = [_round(timing / 1000) if timing is not None else None for timing in timings]
+            values = [value for phase in _LATENCY_PHASES for value in profile.latency(name, phase).values]
+            latencies = [_round(value / 1000) if value is not None else None for value in values]
+        return _Statistics(
+            name, median_turns, mean_turns, median_duration, mean_duration, wins, win_percent, mean_phases, latencies
+        )
 
 
 @frozen
@@ -109,21 +385,18 @@ class _Analysis:
     source_stats: dict[str, _Statistics]
 
 
-# pylint: disable=too-many-positional-arguments
-def _analyze_scenario(  # noqa: PLR0917,PLR0913
-    scenario: int,
-    mode: GameMode,
-    iterations: int,
-    players: int,
-    sources: Sequence[CharacterInputSource],
-    combination: Sequence[CharacterInputSource],
-    results: list[_Result],
+def _analyze_scenario(
+    scenario: _Scenario, iterations: int, overall: _Accumulator, accumulators: dict[str, _Accumulator], profile: _ScenarioProfile
 ) -> _Analysis:
     """Analyze a scenario, generating data that can be written to the CSV file."""
-    playernames = [source.name for source in combination] + [""] * (MAX_PLAYERS - len(combination))
-    overall_stats = _Statistics.for_results(None, results)
-    source_stats = {name: _Statistics.for_results(name, results) for name in sorted({source.name for source in sources})}
-    return _Analysis(f"Scenario {scenario}", mode.name, iterations, players, playernames, overall_stats, source_stats)
+    playernames = [source.name for source in scenario.combination] + [""] * (MAX_PLAYERS - len(scenario.combination))
+    overall_stats = _Statistics.for_accumulator(None, overall, overall.wins)
+    source_stats = {
+        name: _Statistics.for_accumulator(name, accumulator, overall.wins, profile) for name, accumulator in accumulators.items()
+    }
+    return _Analysis(
+        f"Scenario {scenario.scenario}", scenario.mode.name, iterations, scenario.players, playernames, overall_stats, source_stats
+    )
 
 
 def _write_header(csvwriter: "_writer", sources: list[CharacterInputSource]) -> None:
@@ -146,61 +419,199 @@ def _write_scenario(csvwriter: "_writer", analysis: _Analysis) -> None:
         analysis.overall_stats.mean_duration,
     ]
     for stats in analysis.source_stats.values():
-        row += [stats.median_turns, stats.mean_turns, stats.median_duration, stats.mean_duration, stats.wins, stats.win_percent]
+        row += [stats.median_turns, stats.mean_turns, stats.median_duration, stats.mean_duration]
+        row += stats.mean_phases
+        row += stats.latencies
+        row += [stats.wins, stats.win_percent]
     csvwriter.writerow(row)
 
 
-def _run_scenario(prefix: str, iterations: int, engine: Engine) -> list[_Result]:
-    """Run a particular scenario, playing a game repeatedly for a set number of iterations."""
-    results = []
-    for i in range(iterations):
-        print(" " * 100, end="\r", flush=True)
-        print(f"{prefix}iteration {i}", end="\r", flush=True)
-        start = arrow_now()
-        engine.reset()
-        engine.start_game()
-        while not engine.completed:
-            engine.play_next()
-        stop = arrow_now()
-        character, player = engine.winner()
-        results.append(_Result(start, stop, character, player))
-    return results
+@contextmanager
+def _result_writer(path: str | None) -> Iterator[Callable[[_Scenario, _Result], None]]:
+    """
+    Open a per-game results file, yielding a function that writes one result to it.
+
+    The file is written as JSON Lines if the path ends with .jsonl, and as CSV otherwise.
+    The file is line-buffered, so every result is on disk as soon as its game finishes.
+    If there is no path, results are discarded.
+    """
+    if path is None:
+        yield lambda _scenario, _result: None
+        return
+
+    with Path(path).open("w", newline="", encoding="utf-8", buffering=1) as file:
+        if Path(path).suffix == ".jsonl":
+
+            def write_jsonl(scenario: _Scenario, result: _Result) -> None:
+                row = {
+                    "scenario": scenario.scenario,
+                    "mode": scenario.mode.name,
+                    "players": scenario.players,
+                    "iteration": result.iteration,
+                    "winner": result.winner,
+                    "color": result.color.value,
+                    "turns": result.turns,
+                    "duration_ms": result.duration_ms,
+                }
+                file.write(json.dumps(row) + "\n")
+
+            yield write_jsonl
+        else:
+            csvwriter = csv.writer(file, quoting=csv.QUOTE_ALL, lineterminator="\n")
+            csvwriter.writerow(RESULT_HEADERS)
+
+            def write_csv(scenario: _Scenario, result: _Result) -> None:
+                csvwriter.writerow([
+                    f"Scenario {scenario.scenario}",
+                    scenario.mode.name,
+                    scenario.players,
+                    result.iteration,
+                    result.winner,
+                    result.color.value,
+                    result.turns,
+                    result.duration_ms,
+                ])
+
+            yield write_csv
+
+
+def _scenarios(sources: list[CharacterInputSource]) -> Iterator[_Scenario]:
+    """Generate all scenarios for a set of sources, in order."""
+    scenario = 0
+    for mode in GameMode:
+        for players in range(MIN_PLAYERS, MAX_PLAYERS + 1):
+            for case, combination in enumerate(combinations_with_replacement(sources, players), start=0):
+                scenario += 1
+                yield _Scenario(scenario, mode, players, case, combination)
+
+
+def _shard_sizes(iterations: int, workers: int) -> list[int]:
+    """Split the iterations for a scenario into nearly-equal, non-empty shards, with at least one per worker."""
+    shards = min(iterations, max(workers, -(-iterations // _MAX_SHARD_ITERATIONS)))
+    return [iterations // shards + (1 if shard < iterations % shards else 0) for shard in range(shards)]
+
+
+def _game_rng(seed: int, scenario: int, iteration: int) -> random.Random:
+    """Create the random number generator for a single game, derived from the simulation seed."""
+    return create_rng(f"{seed}:{scenario}:{iteration}")  # string seeds are hashed the same way in every process
+
+
+def _play_game(scenario: _Scenario, seed: int, iteration: int) -> _Result:
+    """Play a single game to completion, returning the result."""
+    characters = [Character(name=source.name, source=source) for source in scenario.combination]
+    rng = _game_rng(seed, scenario.scenario, iteration)
+    profiler = _GameProfiler()
+    engine = Engine(mode=scenario.mode, characters=characters, rng=rng, history_mode=HistoryMode.GENERAL, profiler=profiler)
+    start = time.perf_counter_ns()
+    engine.start_game()
+    while not engine.completed:
+        engine.play_next()
+    stop = time.perf_counter_ns()
+    character, player = engine.winner()
+    duration_ms = (stop - start) / 1_000_000
+    return _Result(scenario.scenario, iteration, character.source.name, player.color, player.turns, duration_ms, profiler)
+
+
+def _run_shard(shard: _Shard) -> list[_Result]:
+    """Run a shard of a scenario within a worker process."""
+    iterations = range(shard.first, shard.first + shard.iterations)
+    return [_play_game(shard.scenario, shard.seed, iteration) for iteration in iterations]
+
+
+def _run_serial(scenarios: list[_Scenario], seed: int, iterations: int) -> Iterator[_Result]:
+    """Run scenarios one after another in this process, generating results in scenario and iteration order."""
+    for scenario in scenarios:
+        for iteration in range(iterations):
+            yield _play_game(scenario, seed, iteration)
+
+
+def _run_parallel(scenarios: list[_Scenario], seed: int, iterations: int, workers: int) -> Iterator[_Result]:
+    """Run scenarios across a pool of worker processes, generating results in scenario and iteration order."""
+    sizes = _shard_sizes(iterations, workers)
+    firsts = [sum(sizes[:shard]) for shard in range(len(sizes))]
+    shards = (_Shard(scenario, seed, first, size) for scenario in scenarios for first, size in zip(firsts, sizes, strict=True))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: deque[Future[list[_Result]]] = deque()  # bounded, so completed results never pile up in memory
+        for shard in shards:
+            pending.append(executor.submit(_run_shard, shard))
+            if len(pending) >= workers * _SHARDS_PER_WORKER:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
 
 
 # pylint: disable=too-many-locals,line-too-long
-def run_simulation(iterations: int, output: str, sources: list[CharacterInputSource]) -> None:
+def run_simulation(  # noqa: PLR0913,PLR0914,PLR0917
+    iterations: int,
+    output: str,
+    sources: list[CharacterInputSource],
+    workers: int = 1,
+    seed: int | None = None,
+    results: str | None = None,
+) -> None:
     """
     Run a simulation.
 
+    Every game is played with its own random number generator, derived from the simulation
+    seed along with the scenario and iteration number.  So, a simulation run with the same
+    seed plays the same games, regardless of the number of workers.  If no seed is provided,
+    a random seed is chosen and displayed, so that the simulation can be replayed later.
+
+    With more than one worker, the iterations for each scenario are split into shards, and
+    the shards are played in a pool of worker processes.  Results are always consumed in
+    scenario and iteration order, and the CSV file has the same structure regardless of the
+    number of workers.  Sources must be picklable so they can be passed to the worker processes.
+
+    Each scenario is written to the output file as soon as all of its games are finished.
+    If a results path is provided, a row for every game is also written to that file as soon
+    as the game is finished, in CSV or JSON Lines format depending on the file extension.
+
     Args:
         iterations(int): The number of iterations (number of times to play the game)
         output(str): Path to the output file to write
         sources(List[CharacterInputSource]): The source to use for each player in the game
+        workers(int): Number of worker processes to use, or 0 to use one worker per CPU
+        seed(int): Seed for the random number generators used to play each game
+        results(str): Optional path to a .csv or .jsonl file to write per-game results into
+
+    Raises:
+        ValueError: If the number of workers is negative
     """
-    with Path(output).open("w", newline="", encoding="utf-8") as csvfile:
+    if workers < 0:
+        raise ValueError("Number of workers must not be negative")
+    workers = workers or os.cpu_count() or 1
+    seed = seed if seed is not None else create_rng().getrandbits(32)
+    names = sorted({source.name for source in sources})
+
+    with Path(output).open("w", newline="", encoding="utf-8") as csvfile, _result_writer(results) as write_result:
         csvwriter = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
         _write_header(csvwriter, sources)
 
         start = arrow_now()
         print(f"Starting simulation at {start.format(ISO_TIMESTAMP_FORMAT)}, using {iterations} iterations per scenario")
-
-        scenario = 0
-        results = []
-        for mode in GameMode:
-            for players in range(MIN_PLAYERS, MAX_PLAYERS + 1):
-                for case, combination in enumerate(combinations_with_replacement(sources, players), start=0):
-                    scenario += 1
-                    prefix = f"Scenario {scenario}: {mode.name} mode with {players} players (case {case}): "
-                    characters = [Character(name=source.name, source=source) for source in combination]
-                    engine = Engine(mode=mode, characters=characters)
-                    print(" " * 100, end="\r", flush=True)
-                    print(f"{prefix}starting", end="\r", flush=True)
-                    results = _run_scenario(prefix, iterations, engine)
-                    print(f"{prefix}analyzing", end="\r", flush=True)
-                    analysis = _analyze_scenario(scenario, mode, iterations, players, sources, combination, results)
-                    print(f"{prefix}writing CSV", end="\r", flush=True)
-                    _write_scenario(csvwriter, analysis)
-                    print(f"{prefix}done", end="\r", flush=True)
+        print(f"Using random seed {seed}")
+
+        scenarios = list(_scenarios(sources))
+        parallel = workers > 1
+        runner = _run_parallel(scenarios, seed, iterations, workers) if parallel else _run_serial(scenarios, seed, iterations)
+        for scenario in scenarios:
+            prefix = scenario.prefix
+            overall = _Accumulator()
+            accumulators = {name: _Accumulator() for name in names}
+            profile = _ScenarioProfile()
+            for result in islice(runner, iterations):
+                print(" " * 100, end="\r", flush=True)
+                print(f"{prefix}iteration {result.iteration}", end="\r", flush=True)
+                write_result(scenario, result)
+                overall.add(result)
+                accumulators[result.winner].add(result)
+                profile.add(result.profile)
+            print(f"{prefix}analyzing", end="\r", flush=True)
+            analysis = _analyze_scenario(scenario, iterations, overall, accumulators, profile)
+            print(f"{prefix}writing CSV", end="\r", flush=True)
+            _write_scenario(csvwriter, analysis)
+            csvfile.flush()  # so results for completed scenarios survive an interrupted run
+            print(f"{prefix}done", end="\r", flush=True)
 
         stop = arrow_now()
         print(" " * 100, end="\r", flush=True)
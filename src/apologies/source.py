@@ -5,23 +5,46 @@
 Character input sources.  A character could be a person or could be computer-driven.
 """
 
+import asyncio
+import math
 import operator
 import random
+import time
 from abc import ABC, abstractmethod
 from collections.abc import Callable
+from itertools import accumulate
 from pydoc import locate
 
-from apologies.game import GameMode, PlayerView
-from apologies.reward import RewardCalculatorV1
-from apologies.rules import Move
+from attrs import define, field, frozen
 
+from apologies.compact import encode_position, zobrist_hash, zobrist_update
+from apologies.game import DECK_COUNTS, DRAW_AGAIN, PAWNS, Card, CardType, GameMode, Player, PlayerColor, PlayerView
+from apologies.reward import IncrementalRewardV1, RewardCalculatorV1
+from apologies.rules import Move, MoveKey, Rules, UndoLog
 
-class CharacterInputSource(ABC):
+
+class _InputSource(ABC):  # noqa: B024
     """
-    A generic source of input for a character, which could be a person or could be computer-driven.
-    Concrete character input sources must have a valid zero-arguments constructor.
+    Behavior shared by synchronous and asynchronous character input sources.
+
+    A source that makes random choices should use the random number generator in `rng`.  The
+    engine replaces this with its own generator when a game starts, so that a game played with
+    a seeded engine is reproducible.
     """
 
+    _rng: random.Random | None = None
+
+    @property
+    def rng(self) -> random.Random:
+        """The random number generator that the source should use for any random choices."""
+        if self._rng is None:
+            self._rng = random.Random()
+        return self._rng
+
+    @rng.setter
+    def rng(self, rng: random.Random) -> None:
+        self._rng = rng
+
     @property
     def fullname(self) -> str:
         """Get the fully-qualified name of the character input source."""
@@ -32,6 +55,13 @@ def name(self) -> str:
         """Get the fully-qualified name of the character input source."""
         return type(self).__name__
 
+
+class CharacterInputSource(_InputSource):
+    """
+    A generic source of input for a character, which could be a person or could be computer-driven.
+    Concrete character input sources must have a valid zero-arguments constructor.
+    """
+
     @abstractmethod
     def choose_move(
         self,
@@ -65,6 +95,128 @@ def choose_move(
         """
 
 
+class AsyncCharacterInputSource(_InputSource):
+    """
+    A generic asynchronous source of input for a character, for use with AsyncEngine.
+
+    This is equivalent to CharacterInputSource, except that choose_move() is a coroutine.  While
+    one character waits on a slow source (such as a person answering over a websocket, or a
+    remote bot), the event loop is free to run other games.  To use a synchronous source with
+    AsyncEngine, wrap it in an AsyncInputSourceAdapter.
+    """
+
+    @abstractmethod
+    async def choose_move(
+        self,
+        mode: GameMode,
+        view: PlayerView,
+        legal_moves: list[Move],
+        evaluator: Callable[[PlayerView, Move], PlayerView],
+    ) -> Move:
+        """
+        Choose the next move for a character.
+
+        The rules are the same as for CharacterInputSource.choose_move().  The source `must` return
+        a move from among the passed-in set of legal moves, or else a legal move will be chosen at
+        random and executed.
+
+        Args:
+            mode(GameMode): Game mode
+            view(PlayerView): Player-specific view of the game
+            legal_moves(List[Move]): The set of legal moves
+            evaluator(Callable[[PlayerView, Move], PlayerView]): Function to evaluate a move, returning new state
+
+        Returns:
+            Move: The character's next move
+        """
+
+
+class AsyncInputSourceAdapter(AsyncCharacterInputSource):
+    """
+    An asynchronous input source that delegates to a synchronous character input source.
+
+    The synchronous source runs directly on the event loop, so this is intended for sources that
+    choose quickly, such as the computer-driven sources in this module.  The source's name and
+    random number generator are those of the synchronous source.
+    """
+
+    def __init__(self, source: CharacterInputSource) -> None:
+        self.source = source
+
+    @property
+    def rng(self) -> random.Random:
+        """The random number generator of the synchronous source."""
+        return self.source.rng
+
+    @rng.setter
+    def rng(self, rng: random.Random) -> None:
+        self.source.rng = rng
+
+    @property
+    def name(self) -> str:
+        """The name of the synchronous source."""
+        return self.source.name
+
+    async def choose_move(
+        self,
+        mode: GameMode,
+        view: PlayerView,
+        legal_moves: list[Move],
+        evaluator: Callable[[PlayerView, Move], PlayerView],
+    ) -> Move:
+        """Choose the next move for a character via the synchronous source."""
+        return self.source.choose_move(mode, view, legal_moves, evaluator)
+
+
+@frozen
+class MoveRequest:
+    # noinspection PyUnresolvedReferences
+    """
+    A request for a character to choose a move, published by QueueInputSource.
+
+    Attributes:
+        mode(GameMode): Game mode
+        view(PlayerView): Player-specific view of the game
+        legal_moves(List[Move]): The set of legal moves
+        reply(Future[Move]): Future that the chosen move should be set on
+    """
+
+    mode: GameMode
+    view: PlayerView
+    legal_moves: list[Move]
+    reply: "asyncio.Future[Move]"
+
+
+class QueueInputSource(AsyncCharacterInputSource):
+    """
+    An asynchronous input source that publishes a request to a queue, and waits for the reply.
+
+    This connects a character to something outside of the game, such as a person answering over
+    a websocket.  Each time a move is needed, a MoveRequest is put on the queue.  Whatever reads
+    from the queue must eventually call `request.reply.set_result(move)`, or set an exception on
+    the reply to abort the turn.  The reply is cancelled if the engine stops waiting (for instance,
+    when a move deadline passes), so check `request.reply.done()` before setting a result.
+
+    Attributes:
+        requests(Queue[MoveRequest]): Queue that requests are published to
+    """
+
+    def __init__(self, requests: "asyncio.Queue[MoveRequest] | None" = None) -> None:
+        self.requests: asyncio.Queue[MoveRequest] = requests if requests is not None else asyncio.Queue()
+
+    async def choose_move(
+        self,
+        mode: GameMode,
+        view: PlayerView,
+        legal_moves: list[Move],
+        _evaluator: Callable[[PlayerView, Move], PlayerView],
+    ) -> Move:
+        """Publish a request for the next move, and wait for the reply."""
+        reply: asyncio.Future[Move] = asyncio.get_running_loop().create_future()
+        await self.requests.put(MoveRequest(mode, view, legal_moves, reply))
+        return await reply
+
+
 class NoOpInputSource(CharacterInputSource):
     """
     A no-op input source, which raises an error if ever used.
@@ -73,7 +225,7 @@ class NoOpInputSource(CharacterInputSource):
     application uses a different model, you may use lower-level methods to interact with
     the game engine directly, rather than getting user input from a callback.  In that case,
     you will use this character input source.  If you get an error, you'll know that you've
-    done something wrong.
+    done something wrong.  For an application built on asyncio, consider AsyncEngine instead.
     """
 
     def choose_move(
@@ -87,7 +239,7 @@ class RandomInputSource(CharacterInputSource):
     A source of input for a character which chooses randomly from among legal moves.
     """
 
-    def choose_move(  # noqa: PLR6301
+    def choose_move(
         self,
         _mode: GameMode,
         _view: PlayerView,
@@ -95,7 +247,7 @@ def choose_move(  # noqa: PLR6301
         _evaluator: Callable[[PlayerView, Move], PlayerView],
     ) -> Move:
         """Randomly choose the next move for a character."""
-        return random.choice(legal_moves)
+        return self.rng.choice(legal_moves)
 
 
 # noinspection PyMethodMayBeStatic
@@ -141,8 +293,419 @@ def calculate(
         evaluator: Callable[[PlayerView, Move], PlayerView],
     ) -> tuple[Move, float]:
         """Calculate the reward associated with a move, returning a tuple of (Move, reward)."""
+        if evaluator is Rules.evaluate_move:  # evaluate in-place to get the same result, without copying the view
+            with Rules.evaluate_move_in_place(view, move) as result:
+                return move, self.calculator.calculate(result)
         return move, self.calculator.calculate(evaluator(view, move))
 
+    def _default_scoring(self, evaluator: Callable[[PlayerView, Move], PlayerView]) -> bool:
+        """Whether moves are scored by the default evaluator, calculate() and calculator, so a faster equivalent can be used."""
+        return (
+            evaluator is Rules.evaluate_move
+            and getattr(self.calculate, "__func__", None) is RewardV1InputSource.calculate
+            and getattr(self.calculator.calculate, "__func__", None) is RewardCalculatorV1.calculate
+        )
+
+    def choose_move(
+        self,
+        mode: GameMode,
+        view: PlayerView,
+        legal_moves: list[Move],
+        evaluator: Callable[[PlayerView, Move], PlayerView],
+    ) -> Move:
+        """
+        Choose the next move for a player by scoring the available moves.
+
+        When moves are scored the default way, each move is scored incrementally against the view,
+        which gives the same result as calculate() without evaluating the move.  If calculate(), the
+        calculator, or the evaluator has been replaced, every move is scored via calculate() instead.
+        """
+        if not self._default_scoring(evaluator):
+            return super().choose_move(mode, view, legal_moves, evaluator)
+        incremental = self.calculator.incremental(view)  # the view is scored once, and then each move is scored as a delta
+        evaluated = [(move, incremental.calculate(move)) for move in legal_moves]
+        evaluated.sort(reverse=True, key=operator.itemgetter(1))  # sort the highest-scoring move to the top
+        return evaluated[0][0]  # return the highest-scoring move
+
+
+class VectorizedRewardV1InputSource(RewardV1InputSource):
+    """
+    A variant of RewardV1InputSource that scores all of the legal moves at once using NumPy.
+
+    This chooses exactly the same moves as RewardV1InputSource, but is faster when there are
+    many legal moves to choose from, as in ADULT mode.  It requires the optional `numpy` extra.
+    """
+
+    def choose_move(
+        self,
+        mode: GameMode,
+        view: PlayerView,
+        legal_moves: list[Move],
+        evaluator: Callable[[PlayerView, Move], PlayerView],
+    ) -> Move:
+        """Choose the next move for a player by scoring all of the available moves in a single pass."""
+        if not self._default_scoring(evaluator):  # the same fallback as RewardV1InputSource
+            return super().choose_move(mode, view, legal_moves, evaluator)
+
+        from apologies.vectorized import rewards_v1  # noqa: PLC0415 # numpy is optional, so import only when needed
+
+        rewards = rewards_v1(view, legal_moves)
+        return legal_moves[int(rewards.argmax())]  # argmax picks the first highest-scoring move, just like a stable sort
+
+
+# A card of each type, used when searching through possible card draws
+_CARDS = {cardtype: Card(cardtype.value, cardtype) for cardtype in DECK_COUNTS}
+
+
+@define
+class _SearchState:
+    """Game state for a search, which is modified in-place as moves are played and then restored."""
+
+    rules: Rules
+    view: PlayerView
+    players: dict[PlayerColor, Player] = field(init=False)
+    undo: list[UndoLog] = field(init=False, factory=list)
+    hashes: list[int] = field(init=False)
+
+    # noinspection PyUnresolvedReferences
+    @players.default
+    def _default_players(self) -> dict[PlayerColor, Player]:
+        players = {self.view.player.color: self.view.player, **self.view.opponents}
+        return {color: players[color] for color in PlayerColor if color in players}  # in the order that players take turns
+
+    # noinspection PyUnresolvedReferences
+    @hashes.default
+    def _default_hashes(self) -> list[int]:
+        return [zobrist_hash(self.view.all_pawns())]
+
+    def key(self) -> int:
+        """Return the Zobrist hash for the current placement of all pawns on the board."""
+        return self.hashes[-1]
+
+    def legal_moves(self, color: PlayerColor, card: Card) -> list[Move]:
+        """Return the legal moves for a player, for a card drawn from the deck."""
+        view = PlayerView(self.players[color], {other: player for other, player in self.players.items() if other != color})
+        return self.rules.construct_legal_moves(view, card=card)
+
+    def play(self, color: PlayerColor, move: Move) -> "_ChanceNode":
+        """Play a move for a player, returning a chance node for the next card draw."""
+        pawns = {
+            (action.pawn.color, action.pawn.index): self.players[action.pawn.color].pawns[action.pawn.index]
+            for action in move.actions + move.side_effects
+            if action.pawn.color in self.players and 0 <= action.pawn.index < PAWNS
+        }
+        old = [(pawn, encode_position(pawn.position)) for pawn in pawns.values()]
+        self.undo.append(Rules.apply_move(self.view, move))
+        value = self.hashes[-1]
+        for pawn, code in old:  # the hash is updated incrementally, for only the pawns that moved
+            value = zobrist_update(value, pawn, code, encode_position(pawn.position))
+        self.hashes.append(value)
+        if move.actions and self.players[color].all_pawns_in_home():
+            return _ChanceNode(color, winner=color)
+        if move.actions and DRAW_AGAIN[move.card.cardtype]:
+            return _ChanceNode(color)
+        order = list(self.players)
+        return _ChanceNode(order[(order.index(color) + 1) % len(order)])
+
+    def unplay(self) -> None:
+        """Undo the most recent move that was played."""
+        Rules.undo_move(self.undo.pop())
+        self.hashes.pop()
+
+    def restore(self) -> None:
+        """Restore the original state, undoing all of the moves that have been played."""
+        while self.undo:
+            self.unplay()
+
+    def values(self, winner: PlayerColor | None) -> dict[PlayerColor, float]:
+        """
+        Return the value of the current state for each player, in the range [-1, 1].
+
+        This is the RewardCalculatorV1 reward, scaled by its maximum, except that it is not clamped
+        at zero.  A player that is behind still prefers to fall less far behind.
+        """
+        if winner:
+            return {player: 1.0 if player == winner else -1.0 for player in self.players}
+        scores = IncrementalRewardV1.from_view(self.view).scores
+        total = sum(scores.values())
+        maximum = (len(scores) - 1) * 400  # the same range as RewardCalculatorV1
+        return {player: ((len(scores) - 1) * score - (total - score)) / maximum for player, score in scores.items()}
+
+
+@define
+class _ChanceNode:
+    """A node in the search tree after a move is played, where the next player draws a card."""
+
+    color: PlayerColor  # the player who draws next
+    winner: PlayerColor | None = None
+    visits: int = 0
+    values: dict[PlayerColor, float] = field(factory=dict)
+    children: dict[CardType, "_DecisionNode"] = field(factory=dict)
+
+
+@define
+class _DecisionNode:
+    """A node in the search tree where a player chooses which move to play."""
+
+    color: PlayerColor  # the player who chooses
+    key: int
+    moves: dict[MoveKey, Move]
+    untried: list[MoveKey]
+    visits: int = 0
+    values: dict[PlayerColor, float] = field(factory=dict)
+    children: dict[MoveKey, _ChanceNode] = field(factory=dict)
+
+    @staticmethod
+    def create(color: PlayerColor, key: int, moves: list[Move]) -> "_DecisionNode":
+        """Create a decision node where a player chooses among a list of moves."""
+        keyed = {move.key(): move for move in moves}
+        return _DecisionNode(color, key, keyed, list(keyed))
+
+
+class MonteCarloInputSource(CharacterInputSource):
+    """
+    A source of input for a character which chooses its next move using Monte Carlo Tree Search.
+
+    Each iteration of the search walks down the tree, choosing moves using UCB1 and treating
+    each card draw as a chance node, where the card type is sampled according to the composition
+    of a full deck.  When the search reaches a node that has not been expanded yet, it plays out
+    a limited number of random turns, and then scores the resulting position for every player
+    using the RewardCalculatorV1 incentives (or 1.0 for the winner, if the game ends).  Each player
+    chooses its own moves to maximize its own score.
+
+    Opponents' hands are not visible in a player view, so the search models every future turn
+    as a single card drawn from the deck, as in standard mode.  The search tree is kept between
+    turns.  If the position on a later turn was already reached in the previous search, that
+    part of the tree is reused, so its statistics are not lost.  The tree is never reused from
+    one game to the next: the engine assigns its own `rng` when a game starts, and a new random
+    number generator discards the tree, so each game plays the same way no matter what was
+    played before it.
+
+    The search runs for a fixed number of iterations, or for a fixed amount of time per move
+    if a time budget is set.  All random choices come from `rng`, so a seeded engine makes the
+    search reproducible when it is limited by iterations rather than time.
+
+    Attributes:
+        rollouts(int): Number of search iterations per move, used if there is no time budget
+        time_budget(float): Time budget per move in seconds, or None to run a fixed number of iterations
+        depth(int): Maximum number of turns to play out at random after expanding the tree
+        exploration(float): Exploration constant for UCB1
+    """
+
+    def __init__(self, rollouts: int = 200, time_budget: float | None = None, depth: int = 4, exploration: float = 1.4) -> None:
+        self.rollouts = rollouts
+        self.time_budget = time_budget
+        self.depth = depth
+        self.exploration = exploration
+        self._tree: _DecisionNode | None = None
+        self._cards = list(_CARDS.values())
+        self._weights = list(accumulate(DECK_COUNTS.values()))
+
+    @property
+    def rng(self) -> random.Random:
+        """The random number generator that the source should use for any random choices."""
+        return super().rng
+
+    @rng.setter
+    def rng(self, rng: random.Random) -> None:
+        if rng is not self._rng:  # a new generator means a new game, so the previous search tree doesn't apply
+            self._tree = None
+        self._rng = rng
+
+    def choose_move(
+        self,
+        mode: GameMode,
+        view: PlayerView,
+        legal_moves: list[Move],
+        _evaluator: Callable[[PlayerView, Move], PlayerView],
+    ) -> Move:
+        """Choose the next move for a character by searching the game tree."""
+        if len(legal_moves) == 1:
+            return legal_moves[0]
+        state = _SearchState(Rules(mode), view.copy())  # the search modifies its copy of the view, and always restores it
+        root = self._root(view.player.color, state.key(), legal_moves)
+        deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+        iterations = 0
+        while time.perf_counter() < deadline if deadline is not None else iterations < self.rollouts:
+            try:
+                self._iterate(state, root)
+            finally:
+                state.restore()
+            iterations += 1
+        self._tree = root
+        chosen = max(root.children, key=lambda move: root.children[move].visits, default=None)
+        return root.moves[chosen] if chosen is not None else legal_moves[0]
+
+    def _root(self, color: PlayerColor, key: int, legal_moves: list[Move]) -> _DecisionNode:
+        """Return the root of the search tree, reusing a node from the previous search if possible."""
+        root = _DecisionNode.create(color, key, legal_moves)
+        previous = self._find(color, key)
+        if previous:
+            root.children = {move: child for move, child in previous.children.items() if move in root.moves}
+            root.untried = [move for move in root.untried if move not in root.children]
+            root.visits = sum(child.visits for child in root.children.values())
+        return root
+
+    def _find(self, color: PlayerColor, key: int) -> _DecisionNode | None:
+        """Find the most-visited decision node in the previous search tree for a player and position."""
+        found = None
+        nodes: list[_DecisionNode | _ChanceNode] = [self._tree] if self._tree else []
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, _DecisionNode) and node.color == color and node.key == key:
+                if found is None or node.visits > found.visits:
+                    found = node
+            nodes.extend(node.children.values())
+        return found
+
+    def _iterate(self, state: _SearchState, root: _DecisionNode) -> None:
+        """Run a single iteration of the search: selection, expansion, playout and backpropagation."""
+        path: list[_DecisionNode | _ChanceNode] = [root]
+        node = root
+        color, winner = root.color, None
+        while True:
+            if node.untried:  # expand a move that hasn't been tried yet
+                move = node.untried.pop(self.rng.randrange(len(node.untried)))
+                chance = node.children[move] = state.play(node.color, node.moves[move])
+                path.append(chance)
+                color, winner = chance.color, chance.winner
+                break
+            move = self._select(node)
+            chance = node.children[move]
+            state.play(node.color, node.moves[move])
+            path.append(chance)
+            color, winner = chance.color, chance.winner
+            if winner:
+                break
+            card = self._draw()
+            decision = chance.children.get(card.cardtype)
+            if decision is None:  # expand a card draw that hasn't been seen yet
+                moves = state.legal_moves(color, card)
+                decision = chance.children[card.cardtype] = _DecisionNode.create(color, state.key(), moves)
+                path.append(decision)
+                break
+            path.append(decision)
+            node = decision
+        values = self._playout(state, color, winner)
+        for visited in path:
+            visited.visits += 1
+            for player, value in values.items():
+                visited.values[player] = visited.values.get(player, 0.0) + value
+
+    def _select(self, node: _DecisionNode) -> MoveKey:
+        """Select the child of a fully-expanded decision node with the highest UCB1 score for the player who chooses."""
+        log = math.log(node.visits)
+
+        def ucb1(move: MoveKey) -> float:
+            child = node.children[move]
+            return child.values.get(node.color, 0.0) / child.visits + self.exploration * math.sqrt(log / child.visits)
+
+        return max(node.children, key=ucb1)
+
+    def _draw(self) -> Card:
+        """Draw a card at random, weighted by the composition of a full deck."""
+        return self.rng.choices(self._cards, cum_weights=self._weights)[0]
+
+    def _playout(self, state: _SearchState, color: PlayerColor, winner: PlayerColor | None) -> dict[PlayerColor, float]:
+        """Play out random turns starting with a player, and return the resulting value for each player."""
+        for _ in range(self.depth):
+            if winner:
+                break
+            move = self.rng.choice(state.legal_moves(color, self._draw()))
+            chance = state.play(color, move)
+            color, winner = chance.color, chance.winner
+        return state.values(winner)
+
+
+class ExpectimaxInputSource(CharacterInputSource):
+    """
+    A source of input for a character which chooses its next move using a depth-limited expectimax search.
+
+    Each legal move is played against a copy of the view.  Then, for the next player's reply,
+    the search averages over every type of card that player might draw.  Each card type is
+    weighted by the cards remaining in the deck.  The deck composition isn't visible in a
+    player view, so this is a full deck less the cards in the player's own hand.  For each card,
+    the player chooses the reply that maximizes its own score.  The search continues that way
+    until it reaches the configured depth, where every player is scored using the incentives
+    from RewardCalculatorV1 (or 1.0 for the winner, if the game ends).
+
+    A depth of 1 evaluates only the player's own move.  The default depth of 2 also considers
+    the next player's reply.  Different moves often reach the same placement of pawns, like
+    the many ways to split a 7 or swap with an 11.  A transposition table, keyed on the
+    placement of all pawns, makes sure each of these positions is only searched once per move.
+
+    Attributes:
+        depth(int): Number of moves to search, starting with the player's own move
+    """
+
+    def __init__(self, depth: int = 2) -> None:
+        self.depth = depth
+        self._table: dict[tuple[int, PlayerColor | None, int], dict[PlayerColor, float]] = {}
+        self._hits = 0
+
+    def choose_move(
+        self,
+        mode: GameMode,
+        view: PlayerView,
+        legal_moves: list[Move],
+        _evaluator: Callable[[PlayerView, Move], PlayerView],
+    ) -> Move:
+        """Choose the next move for a character by searching the game tree."""
+        if len(legal_moves) == 1:
+            return legal_moves[0]
+        state = _SearchState(Rules(mode), view.copy())  # the search modifies its copy of the view, and always restores it
+        weights = {cardtype: count for cardtype, count in self._remaining(view).items() if count > 0}
+        self._table, self._hits = {}, 0
+        values = [self._move(state, weights, view.player.color, move, self.depth)[view.player.color] for move in legal_moves]
+        return legal_moves[values.index(max(values))]  # the first highest-scoring move, like RewardV1InputSource
+
+    @staticmethod
+    def _remaining(view: PlayerView) -> dict[CardType, int]:
+        """Return the number of cards of each type that might remain in the deck, as far as the player can tell."""
+        remaining = DECK_COUNTS.copy()
+        for card in view.player.hand:
+            remaining[card.cardtype] -= 1
+        return remaining
+
+    def _move(
+        self, state: _SearchState, weights: dict[CardType, int], color: PlayerColor, move: Move, depth: int
+    ) -> dict[PlayerColor, float]:
+        """Play a move for a player, and return the resulting value for each player."""
+        chance = state.play(color, move)
+        try:
+            if chance.winner or depth <= 1:
+                return self._leaf(state, chance.winner)
+            return self._chance(state, weights, chance.color, depth - 1)
+        finally:
+            state.unplay()
+
+    def _leaf(self, state: _SearchState, winner: PlayerColor | None) -> dict[PlayerColor, float]:
+        """Return the value of the current state for each player, using the transposition table."""
+        key = (state.key(), None, 0)
+        if key in self._table:
+            self._hits += 1
+        else:
+            self._table[key] = state.values(winner)
+        return self._table[key]
+
+    def _chance(
+        self, state: _SearchState, weights: dict[CardType, int], color: PlayerColor, depth: int
+    ) -> dict[PlayerColor, float]:
+        """Return the expected value for each player when a player draws a card, using the transposition table."""
+        key = (state.key(), color, depth)
+        if key in self._table:
+            self._hits += 1
+            return self._table[key]
+        total = sum(weights.values())
+        values = dict.fromkeys(state.players, 0.0)
+        for cardtype, weight in weights.items():
+            replies = [self._move(state, weights, color, move, depth) for move in state.legal_moves(color, _CARDS[cardtype])]
+            best = max(replies, key=operator.itemgetter(color))  # each player chooses the reply that is best for itself
+            for player, value in best.items():
+                values[player] += value * weight / total
+        self._table[key] = values
+        return values
+
 
 # noinspection PyCallingNonCallable
 def source(name: str) -> CharacterInputSource:
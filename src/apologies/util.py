@@ -4,6 +4,7 @@
 Utility functionality.
 """
 
+import random
 from typing import Generic, TypeVar
 
 import cattrs
@@ -30,6 +31,19 @@ def __init__(self) -> None:
         self.register_structure_hook(Arrow, lambda string, _: arrow_get(string, _SERIALIZATION_FORMAT) if string else None)
 
 
+def create_rng(seed: int | str | random.Random | None = None) -> random.Random:
+    """
+    Create a random number generator.
+
+    Args:
+        seed(int | str | Random | None): A seed for a new generator, or an existing generator to use as-is
+
+    Returns:
+        Random: A generator created from the seed, or the existing generator
+    """
+    return seed if isinstance(seed, random.Random) else random.Random(seed)  # noqa: S311
+
+
 T = TypeVar("T")
 """Generic type"""
 
@@ -65,3 +79,7 @@ def next(self) -> T:
         if len(self._working) == 0:
             self._working.extend(self.entries)
         return self._working.pop(0)
+
+    def peek(self) -> T:
+        """Get the next entry from the queue, without removing it."""
+        return self._working[0] if self._working else self.entries[0]
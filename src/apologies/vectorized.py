@@ -0,0 +1,71 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+
+"""
+Vectorized reward calculations, implemented using NumPy.
+
+RewardCalculatorV1 scores a single player view at a time, so a reward-based source has to
+evaluate each legal move separately and walk the resulting view.  The functions in this
+module instead score all of the legal moves for a view in a single pass.  The resulting pawn
+positions are encoded as a (moves x pawns) array of position codes (see apologies.compact),
+and all of the incentives are computed from that array at once.
+
+NumPy is an optional dependency.  Install the `numpy` extra (i.e. `apologies[numpy]`) to use
+this module.  No other module imports it, except lazily via VectorizedRewardV1InputSource.
+"""
+
+from functools import cache
+
+import numpy as np
+import numpy.typing as npt
+
+from apologies.compact import HOME_CODE, SAFE_BASE, encode_position
+from apologies.game import PAWNS, PlayerColor, PlayerView
+from apologies.rules import DISTANCE_TO_HOME, Move
+
+
+@cache
+def _distances(color: PlayerColor) -> npt.NDArray[np.int64]:
+    """Return the distance to home for a pawn of the given color, indexed by position code."""
+    return np.array(DISTANCE_TO_HOME[color])
+
+
+def _positions(view: PlayerView, moves: list[Move]) -> npt.NDArray[np.intp]:
+    """Return a (moves x pawns) array of the position code for each pawn after each move."""
+    players = [view.player, *view.opponents.values()]
+    offsets = {player.color: index * PAWNS for index, player in enumerate(players)}
+    current = [encode_position(pawn.position) for player in players for pawn in player.pawns]
+    positions = np.tile(np.array(current, dtype=np.intp), (len(moves), 1))
+    for row, move in enumerate(moves):
+        changes = {}
+        for (color, index), code in move.final_positions().items():
+            offset = offsets.get(color)
+            if offset is not None and 0 <= index < PAWNS:  # if the pawn isn't valid, just ignore it
+                changes[offset + index] = code
+        if changes:
+            positions[row, list(changes.keys())] = list(changes.values())
+    return positions
+
+
+def rewards_v1(view: PlayerView, moves: list[Move]) -> npt.NDArray[np.int64]:
+    """
+    Calculate the RewardCalculatorV1 reward for the view that results from each of a list of moves.
+
+    The result is identical to calling RewardCalculatorV1.calculate() on the view returned by
+    Rules.evaluate_move() for each move, but the view is never modified or copied.
+
+    Args:
+        view(PlayerView): Player-specific view of the game
+        moves(List[Move]): Moves to evaluate against the view
+
+    Returns:
+        NDArray: The reward for each move, in the same order as the moves
+    """
+    players = [view.player, *view.opponents.values()]
+    positions = _positions(view, moves).reshape(len(moves), len(players), PAWNS)
+    distances = np.stack([_distances(player.color) for player in players])  # (players x position codes)
+    distance = distances[np.arange(len(players))[:, np.newaxis], positions].sum(axis=2)
+    safe = ((positions >= SAFE_BASE) & (positions <= HOME_CODE)).sum(axis=2)  # pawns in the safe area or in home
+    winner = (positions == HOME_CODE).all(axis=2)
+    scores = (260 - distance) + (10 * safe) + (100 * winner)  # same incentives as RewardCalculatorV1._player_score()
+    rewards = (len(view.opponents) * scores[:, 0]) - scores[:, 1:].sum(axis=1)
+    return np.maximum(rewards, 0)  # type: ignore[no-any-return]
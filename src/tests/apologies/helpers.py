@@ -0,0 +1,29 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# Shared helpers for the unit tests
+
+from collections.abc import Iterator
+
+from apologies.game import Game, GameMode, PlayerView
+from apologies.rules import Move, Rules
+from apologies.util import create_rng
+
+
+def random_positions(seed: int = 5, turns: int = 60) -> Iterator[tuple[PlayerView, list[Move]]]:
+    """
+    Play random ADULT mode games for 2, 3 and 4 players, yielding a view and its legal moves at every turn.
+
+    The games are seeded, so the same positions are generated every time.  The view is the
+    view for the player whose turn it is, and it must not be modified by the caller.
+    """
+    rng = create_rng(seed)
+    for playercount in [2, 3, 4]:
+        game = Game(playercount)
+        game.deck.rng = rng  # adult mode deals cards when the game starts, so the deck must be seeded too
+        rules = Rules(GameMode.ADULT)
+        rules.start_game(game)
+        for turn in range(turns):
+            player = list(game.players.values())[turn % playercount]
+            view = game.create_player_view(player.color)
+            moves = rules.construct_legal_moves(view)
+            yield view, moves
+            rules.execute_move(game, player, rng.choice(moves))
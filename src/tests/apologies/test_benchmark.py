@@ -0,0 +1,96 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+
+import json
+
+import pytest
+
+from apologies.benchmark import (
+    BENCHMARKS,
+    Benchmark,
+    BenchmarkResult,
+    Regression,
+    _format_ns,
+    compare_baseline,
+    load_baseline,
+    run_benchmark,
+    run_benchmarks,
+    save_baseline,
+)
+from apologies.game import CardType
+from apologies.util import create_rng
+
+
+class TestFunctions:
+    def test_benchmarks(self):
+        assert len(BENCHMARKS) == len(CardType) + 8
+        for name, benchmark in BENCHMARKS.items():
+            assert benchmark.name == name
+            benchmark.setup(create_rng(7))()  # every benchmark can be set up and called
+
+    def test_fixed_seed(self):
+        setup = BENCHMARKS["rules.construct_legal_moves.CARD_7"].setup
+        assert setup(create_rng(7))() == setup(create_rng(7))()  # the same seed times the same work
+
+    def test_format_ns(self):
+        assert _format_ns(512) == "512 ns"
+        assert _format_ns(1_500) == "1.50 us"
+        assert _format_ns(2_250_000) == "2.25 ms"
+        assert _format_ns(3_000_000_000) == "3.00 s"
+
+
+class TestRunBenchmark:
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            run_benchmark(BENCHMARKS["deck.draw"], repeat=0)
+        with pytest.raises(ValueError):
+            run_benchmark(BENCHMARKS["deck.draw"], number=0)
+
+    def test_run(self):
+        calls = []
+        benchmark = Benchmark("test", lambda rng: lambda: calls.append(rng))
+        result = run_benchmark(benchmark, repeat=3, number=10)
+        assert result.name == "test"
+        assert result.number == 10
+        assert len(calls) == 3 * 10
+        assert 0 < result.best_ns <= result.median_ns
+
+
+class TestBaseline:
+    def test_save_and_load(self, tmp_path):
+        path = tmp_path / "baseline.json"
+        results = [BenchmarkResult("one", 10, 100.0, 110.0), BenchmarkResult("two", 20, 200.0, 250.0)]
+        save_baseline(str(path), results)
+        assert set(json.loads(path.read_text(encoding="utf-8"))) == {"python", "machine", "results"}
+        assert load_baseline(str(path)) == results
+
+    def test_compare(self):
+        baseline = [BenchmarkResult("one", 10, 100.0, 110.0), BenchmarkResult("two", 20, 200.0, 250.0)]
+        results = [
+            BenchmarkResult("one", 10, 109.0, 120.0),
+            BenchmarkResult("two", 20, 300.0, 300.0),
+            BenchmarkResult("new", 1, 5.0, 5.0),
+        ]
+        regressions = compare_baseline(results, baseline)
+        assert regressions == [Regression("two", 200.0, 300.0)]
+        assert regressions[0].ratio == 1.5
+        assert compare_baseline(results, baseline, tolerance=0.6) == []
+        assert compare_baseline(results, baseline, tolerance=0.05) == [
+            Regression("one", 100.0, 109.0),
+            Regression("two", 200.0, 300.0),
+        ]
+
+
+class TestRunBenchmarks:
+    def test_no_match(self):
+        with pytest.raises(ValueError):
+            run_benchmarks(names=["bogus"])
+
+    def test_save_and_compare(self, tmp_path, capsys):
+        path = tmp_path / "baseline.json"
+        assert run_benchmarks(names=["deck.draw", "game.copy"], repeat=1, number=1, save=str(path)) == []
+        assert [result.name for result in load_baseline(str(path))] == ["game.copy", "deck.draw"]
+        baseline = [BenchmarkResult(result.name, 1, 1.0, 1.0) for result in load_baseline(str(path))]  # impossibly fast
+        save_baseline(str(path), baseline)
+        regressions = run_benchmarks(names=["deck.draw"], repeat=1, number=1, baseline=str(path))
+        assert [regression.name for regression in regressions] == ["deck.draw"]
+        assert "Regression: deck.draw" in capsys.readouterr().out
@@ -0,0 +1,243 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+
+import pytest
+
+from apologies.compact import (
+    HOME_CODE,
+    POSITION_CODES,
+    SAFE_BASE,
+    START_CODE,
+    ZOBRIST,
+    CompactGame,
+    CompactView,
+    decode_position,
+    encode_position,
+    zobrist_hash,
+    zobrist_update,
+)
+from apologies.engine import Character, Engine
+from apologies.game import BOARD_SQUARES, PAWNS, SAFE_SQUARES, Game, GameMode, PlayerColor, Position
+from apologies.rules import Action, ActionType, Move, Rules
+from apologies.source import RandomInputSource
+from tests.apologies.helpers import random_positions
+
+
+def _create_realistic_game():
+    """Create a realistic game with changes to the defaults for all types of values."""
+    game = Game(4)
+    game.track("this happened")
+    game.track("another thing", game.players[PlayerColor.RED])
+    card1 = game.deck.draw()
+    card2 = game.deck.draw()
+    game.deck.draw()  # just throw it away
+    game.deck.discard(card1)
+    game.deck.discard(card2)
+    game.players[PlayerColor.RED].pawns[0].position.move_to_square(32)
+    game.players[PlayerColor.BLUE].pawns[2].position.move_to_home()
+    game.players[PlayerColor.BLUE].hand.append(card1)
+    game.players[PlayerColor.YELLOW].pawns[3].position.move_to_safe(1)
+    game.players[PlayerColor.GREEN].pawns[1].position.move_to_square(19)
+    game.players[PlayerColor.GREEN].hand.append(card2)
+    return game
+
+
+class TestFunctions:
+    def test_encode_position(self):
+        assert encode_position(Position().move_to_start()) == START_CODE
+        assert encode_position(Position().move_to_home()) == HOME_CODE
+        for square in range(SAFE_SQUARES):
+            assert encode_position(Position().move_to_safe(square)) == SAFE_BASE + square
+        for square in range(BOARD_SQUARES):
+            assert encode_position(Position().move_to_square(square)) == square
+
+    def test_encode_position_invalid(self):
+        with pytest.raises(ValueError):
+            encode_position(Position(start=False))
+
+    def test_decode_position(self):
+        for code in range(POSITION_CODES):
+            assert encode_position(decode_position(code)) == code
+
+    def test_decode_position_invalid(self):
+        with pytest.raises(ValueError):
+            decode_position(POSITION_CODES)
+
+    def test_zobrist_table(self):
+        assert list(ZOBRIST) == list(PlayerColor)
+        numbers = [number for color in PlayerColor for pawn in ZOBRIST[color] for number in pawn]
+        assert len(numbers) == len(PlayerColor) * PAWNS * POSITION_CODES
+        assert len(set(numbers)) == len(numbers)
+        assert all(0 <= number < 2**64 for number in numbers)
+        assert ZOBRIST[PlayerColor.RED][0][0] == 0x629F6FBED82C07CD  # stable from one run to the next, due to the fixed seed
+
+    def test_zobrist_hash(self):
+        game = _create_realistic_game()
+        pawns = game.create_player_view(PlayerColor.RED).all_pawns()
+        assert zobrist_hash(pawns) == zobrist_hash(reversed(pawns))  # order doesn't matter
+        assert zobrist_hash(pawns) != zobrist_hash(Game(4).create_player_view(PlayerColor.RED).all_pawns())
+        assert zobrist_hash([]) == 0
+
+    def test_zobrist_update(self):
+        game = _create_realistic_game()
+        pawns = game.create_player_view(PlayerColor.RED).all_pawns()
+        value = zobrist_hash(pawns)
+        pawn = game.players[PlayerColor.GREEN].pawns[1]
+        old = encode_position(pawn.position)
+        pawn.position.move_to_square(25)
+        updated = zobrist_update(value, pawn, old, encode_position(pawn.position))
+        assert updated == zobrist_hash(game.create_player_view(PlayerColor.RED).all_pawns())
+        assert zobrist_update(updated, pawn, encode_position(pawn.position), old) == value  # moving back restores the hash
+
+
+def _played_games():
+    """Play seeded random games to completion, yielding the game after every turn."""
+    for mode, playercount in [(GameMode.STANDARD, 2), (GameMode.ADULT, 3), (GameMode.ADULT, 4)]:
+        characters = [Character(f"{index}", RandomInputSource()) for index in range(playercount)]
+        engine = Engine(mode, characters, rng=playercount)
+        engine.start_game()
+        yield engine.game
+        while not engine.completed:
+            yield engine.play_next()
+
+
+class TestCompactGame:
+    def test_roundtrip_played_games(self):
+        for game in _played_games():
+            compact = CompactGame.from_game(game)
+            assert compact.to_game() == game
+            assert compact.completed == game.completed
+            assert compact.winner == (game.winner.color if game.completed else None)
+            for color in game.players:
+                view = game.create_player_view(color)
+                assert compact.create_player_view(color).to_view() == view
+                assert CompactView.from_view(view).to_view() == view
+
+    def test_roundtrip(self):
+        game = _create_realistic_game()
+        compact = CompactGame.from_game(game)
+        assert compact.playercount == 4
+        assert compact.colors == (PlayerColor.RED, PlayerColor.YELLOW, PlayerColor.GREEN, PlayerColor.BLUE)
+        assert len(compact.pawns) == 4 * PAWNS
+        assert compact.to_game() == game
+
+    def test_roundtrip_independent(self):
+        game = _create_realistic_game()
+        copy = CompactGame.from_game(game).to_game()
+        copy.players[PlayerColor.RED].pawns[0].position.move_to_home()
+        copy.players[PlayerColor.RED].hand.append(copy.deck.draw())
+        copy.history[0].action = "changed"
+        assert game.players[PlayerColor.RED].pawns[0].position.square == 32
+        assert len(game.players[PlayerColor.RED].hand) == 0
+        assert game.history[0].action == "this happened"
+
+    def test_copy(self):
+        compact = CompactGame.from_game(_create_realistic_game())
+        copy = compact.copy()
+        assert copy is not compact and copy == compact
+        copy.pawns[0] = HOME_CODE
+        copy.hands[0].append(copy.draw_pile.pop())
+        assert compact.pawns[0] == 32
+        assert len(compact.hands[0]) == 0
+        assert len(compact.draw_pile) == len(copy.draw_pile) + 1
+
+    def test_key(self):
+        compact = CompactGame.from_game(_create_realistic_game())
+        copy = compact.copy()
+        assert compact.key() == copy.key()
+        copy.pawns[0] = HOME_CODE
+        assert compact.key() != copy.key()
+
+    def test_zobrist(self):
+        game = _create_realistic_game()
+        compact = CompactGame.from_game(game)
+        assert compact.zobrist() == zobrist_hash(game.create_player_view(PlayerColor.RED).all_pawns())
+        assert compact.create_player_view(PlayerColor.BLUE).zobrist() == compact.zobrist()
+        copy = compact.copy()
+        copy.pawns[0] = HOME_CODE
+        assert compact.zobrist() != copy.zobrist()
+
+    def test_position(self):
+        game = _create_realistic_game()
+        compact = CompactGame.from_game(game)
+        assert compact.position(game.players[PlayerColor.RED].pawns[0]) == 32
+        assert compact.position(game.players[PlayerColor.BLUE].pawns[2]) == HOME_CODE
+        assert compact.position(game.players[PlayerColor.YELLOW].pawns[3]) == SAFE_BASE + 1
+        assert compact.position(game.players[PlayerColor.GREEN].pawns[0]) == START_CODE
+
+    def test_completed_and_winner(self):
+        game = Game(2)
+        compact = CompactGame.from_game(game)
+        assert compact.completed is False
+        assert compact.winner is None
+        for pawn in game.players[PlayerColor.YELLOW].pawns:
+            pawn.position.move_to_home()
+        compact = CompactGame.from_game(game)
+        assert compact.completed is True
+        assert compact.winner == PlayerColor.YELLOW
+
+    def test_create_player_view(self):
+        game = _create_realistic_game()
+        compact = CompactGame.from_game(game)
+        for color in PlayerColor:
+            assert compact.create_player_view(color).to_view() == game.create_player_view(color)
+
+
+class TestCompactView:
+    def test_roundtrip(self):
+        game = _create_realistic_game()
+        for color in PlayerColor:
+            view = game.create_player_view(color)
+            compact = CompactView.from_view(view)
+            assert compact.color == color
+            assert compact.to_view() == view
+
+    def test_copy(self):
+        compact = CompactView.from_view(_create_realistic_game().create_player_view(PlayerColor.BLUE))
+        copy = compact.copy()
+        assert copy is not compact and copy == compact
+        copy.pawns[0] = HOME_CODE
+        copy.hand.clear()
+        assert compact.pawns[0] == START_CODE
+        assert len(compact.hand) == 1
+
+    def test_to_view_invalid(self):
+        compact = CompactView.from_view(Game(2).create_player_view(PlayerColor.RED))
+        compact.color = PlayerColor.BLUE
+        with pytest.raises(ValueError):
+            compact.to_view()
+
+
+class TestExecuteCompactMove:
+    def test_equivalent_to_evaluate_move(self):
+        game = _create_realistic_game()
+        view = game.create_player_view(PlayerColor.RED)
+        move = Move(
+            game.deck.draw(),
+            actions=[
+                Action(ActionType.MOVE_TO_POSITION, view.player.pawns[1], Position().move_to_square(10)),
+                Action(ActionType.MOVE_TO_POSITION, view.opponents[PlayerColor.YELLOW].pawns[3], Position().move_to_safe(4)),
+            ],
+            side_effects=[
+                Action(ActionType.MOVE_TO_START, view.player.pawns[0]),
+                Action(ActionType.MOVE_TO_POSITION, view.opponents[PlayerColor.BLUE].pawns[2], Position().move_to_square(12)),
+            ],
+        )
+        compact = CompactView.from_view(view)
+        Rules.execute_compact_move(compact, move)
+        assert compact.to_view() == Rules.evaluate_move(view, move)
+
+    def test_invalid_pawn_ignored(self):
+        game = Game(2)
+        card = game.deck.draw()
+        compact = CompactGame.from_game(game)
+        pawn = Game(4).players[PlayerColor.BLUE].pawns[0]
+        move = Move(card, actions=[Action(ActionType.MOVE_TO_POSITION, pawn, Position().move_to_square(10))])
+        Rules.execute_compact_move(compact, move)
+        assert compact == CompactGame.from_game(game)
+
+    def test_equivalent_to_evaluate_move_played_games(self):
+        for view, moves in random_positions():
+            for move in moves:
+                compact = CompactView.from_view(view)
+                Rules.execute_compact_move(compact, move)
+                assert compact.to_view() == Rules.evaluate_move(view, move)
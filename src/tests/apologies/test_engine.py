@@ -1,13 +1,42 @@
 # vim: set ft=python ts=4 sw=4 expandtab:
+# ruff: noqa: S311
 # Unit tests for engine.py
 
-from unittest.mock import MagicMock, Mock, PropertyMock, call, patch
+import asyncio
+import random
+from unittest.mock import AsyncMock, MagicMock, Mock, PropertyMock, call, patch
 
 import pytest
 
-from apologies.engine import Character, Engine
-from apologies.game import Card, CardType, GameMode, PlayerColor
-from apologies.rules import Action, ActionType, Move, Rules
+from apologies.engine import AsyncCharacter, AsyncEngine, Character, Engine, EnginePhase, EngineProfiler, PhaseTiming
+from apologies.game import Card, CardType, Game, GameMode, HistoryMode, PlayerColor
+from apologies.rules import Action, ActionType, LegalMoveCache, Move, Rules
+from apologies.source import AsyncInputSourceAdapter, QueueInputSource, RandomInputSource, RewardV1InputSource
+
+
+class TestEngineProfiler:
+    def test_phase_timing(self):
+        timing = PhaseTiming()
+        assert timing.mean_ns is None
+        timing.add(100)
+        timing.add(500, calls=3)
+        assert timing.calls == 4
+        assert timing.total_ns == 600
+        assert timing.mean_ns == 150
+
+    def test_record_and_merge(self):
+        profiler = EngineProfiler()
+        assert profiler.timing("source", EnginePhase.TURN) == PhaseTiming()
+        profiler.record("source", EnginePhase.TURN, 100)
+        with profiler.measure("source", EnginePhase.CHOOSE_MOVE):
+            pass
+        other = EngineProfiler()
+        other.record("source", EnginePhase.TURN, 50)
+        other.record("other", EnginePhase.EXECUTE_MOVE, 25)
+        profiler.merge(other)
+        assert profiler.timing("source", EnginePhase.TURN) == PhaseTiming(2, 150)
+        assert profiler.timing("source", EnginePhase.CHOOSE_MOVE).calls == 1
+        assert profiler.timing("other", EnginePhase.EXECUTE_MOVE) == PhaseTiming(1, 25)
 
 
 class TestCharacter:
@@ -49,6 +78,79 @@ def test_constructor_not_random(self):
         assert engine.colors == engine._map and engine.colors is not engine._map  # it's a copy
         assert engine._map == {PlayerColor.RED: character1, PlayerColor.YELLOW: character2}
 
+    def test_constructor_seed(self):
+        for _ in range(10):
+            engines = [Engine(GameMode.STANDARD, [Character(f"{i}", Mock()) for i in range(4)], rng=5) for _ in range(2)]
+            assert isinstance(engines[0].rng, random.Random)
+            assert engines[0].first == engines[1].first
+            assert engines[0]._game.deck.rng is engines[0].rng
+
+    def test_constructor_rng(self):
+        rng = random.Random()
+        engine = Engine(GameMode.STANDARD, [Character("one", Mock()), Character("two", Mock())], rng=rng)
+        assert engine.rng is rng
+        assert engine._game.deck.rng is rng
+        assert engine.reset().deck.rng is rng
+
+    def test_seeded_game_reproducible(self):
+        def play(seed):
+            characters = [Character(f"{i}", RandomInputSource()) for i in range(4)]
+            engine = Engine(GameMode.ADULT, characters, rng=seed)
+            engine.start_game()
+            assert all(character.source.rng is engine.rng for character in characters)
+            while not engine.completed:
+                engine.play_next()
+            return [(entry.action, entry.color, entry.card) for entry in engine.game.history]
+
+        assert play(5) == play(5)
+        assert play(5) != play(6)
+
+    def test_constructor_history_mode(self):
+        characters = [Character("one", Mock()), Character("two", Mock())]
+        assert Engine(GameMode.STANDARD, characters).game.history_mode == HistoryMode.FULL
+        engine = Engine(GameMode.STANDARD, characters, history_mode=HistoryMode.GENERAL)
+        assert engine.game.history_mode == HistoryMode.GENERAL
+        assert engine.reset().history_mode == HistoryMode.GENERAL
+
+    def test_constructor_legal_move_cache(self):
+        characters = [Character("one", Mock()), Character("two", Mock())]
+        assert Engine(GameMode.STANDARD, characters)._rules.cache is None
+        cache = LegalMoveCache(10)
+        assert Engine(GameMode.STANDARD, characters, legal_move_cache=cache)._rules.cache is cache
+
+    def test_profiler(self):
+        profiler = EngineProfiler()
+        characters = [Character("one", RandomInputSource()), Character("two", RewardV1InputSource())]
+        engine = Engine(GameMode.ADULT, characters, rng=5, profiler=profiler)
+        engine.start_game()
+        while not engine.completed:
+            engine.play_next()
+        assert set(profiler.timings) == {"RandomInputSource", "RewardV1InputSource"}
+        for color, character in engine.colors.items():
+            player = engine.game.players[color]
+            timings = profiler.timings[character.source.name]
+            assert set(timings) == set(EnginePhase)
+            moves = timings[EnginePhase.CHOOSE_MOVE].calls
+            assert moves == player.turns  # the player's turn count is incremented for every move
+            assert timings[EnginePhase.TURN].calls <= moves  # a 2 card means that a turn has more than one move
+            assert timings[EnginePhase.CREATE_PLAYER_VIEW].calls == moves
+            assert timings[EnginePhase.CONSTRUCT_LEGAL_MOVES].calls == moves
+            assert timings[EnginePhase.EXECUTE_MOVE].calls == moves
+            assert all(timing.total_ns > 0 for timing in timings.values())
+            phases = sum(timing.total_ns for phase, timing in timings.items() if phase != EnginePhase.TURN)
+            assert phases <= timings[EnginePhase.TURN].total_ns
+
+    def test_general_history_mode(self):
+        characters = [Character(f"{i}", RandomInputSource()) for i in range(4)]
+        engine = Engine(GameMode.ADULT, characters, rng=5, history_mode=HistoryMode.GENERAL)
+        engine.start_game()
+        while not engine.completed:
+            engine.play_next()
+        _, winner = engine.winner()
+        assert winner.turns > 0
+        assert [entry.color for entry in engine.game.history] == [None, None]  # game started, game completed
+        assert engine.game.history[-1].action.endswith(f"after {winner.turns} turns")
+
     def test_constructor_random(self):
         found = []
         for _ in range(100):
@@ -121,6 +223,27 @@ def test_reset(self):
         engine.reset()
         assert engine._game is not None and engine._game is not saved and not engine._game.started
 
+    def test_next_color(self):
+        engine = TestEngine._create_engine()
+        assert engine.next_color == PlayerColor.RED
+        assert engine.next_turn()[0] == PlayerColor.RED
+        assert engine.next_color == PlayerColor.YELLOW
+
+    def test_restore(self):
+        engine = TestEngine._create_engine()
+        game = engine._game.copy()
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(10)
+        restored = Game.from_json(game.to_json())
+        assert engine.restore(restored) is restored
+        assert engine._game is restored and engine._game == game
+        assert restored.deck.rng is engine.rng
+        assert restored.history_mode == engine.history_mode
+
+    def test_restore_wrong_players(self):
+        engine = TestEngine._create_engine()
+        with pytest.raises(ValueError, match=r"wrong number of players"):
+            engine.restore(Game(3))
+
     def test_start_game(self):
         engine = TestEngine._create_engine()
         engine._rules.start_game = MagicMock()
@@ -214,17 +337,36 @@ def test_play_next_completed(self):
 
     def test_play_next_failed(self):
         engine = TestEngine._create_engine()
+        game = engine._game
+        saved = game.copy()
 
         exception = Exception("Hello")
-        copy = Mock()
-
         engine._queue.next = MagicMock(side_effect=exception)
-        engine._game.copy = MagicMock(return_value=copy)
 
         with pytest.raises(Exception) as e:
             engine.play_next()
         assert e.value is exception
-        assert engine._game is copy  # we replace with a copy of original if method raises exception
+        assert engine._game is game and game == saved
+        assert game.journal is None and game.deck.journal is None
+
+    def test_play_next_failed_rollback(self):
+        for mode in GameMode:
+            engine = TestEngine._create_engine(mode)
+            game = engine._game
+            game.players[PlayerColor.RED].pawns[0].position.move_to_square(10)  # so every card has a legal move
+            game.players[PlayerColor.YELLOW].pawns[0].position.move_to_square(40)
+            saved = game.copy()
+
+            exception = Exception("Hello")
+            for character in engine.characters:
+                character.choose_move.side_effect = lambda _mode, _view, legal_moves, _evaluator: legal_moves[0]
+            engine._rules.draw_again = MagicMock(side_effect=exception)  # fails after the move has been executed
+
+            with pytest.raises(Exception) as e:
+                engine.play_next()
+            assert e.value is exception
+            assert engine._game is game and game == saved  # all changes made during the turn are rolled back
+            assert game.journal is None and game.deck.journal is None
 
     # noinspection PyUnresolvedReferences
     def test_play_next_standard_forfeit(self):
@@ -562,3 +704,192 @@ def _create_engine(mode: GameMode = GameMode.STANDARD) -> Engine:
         engine.start_game()
 
         return engine
+
+
+class TestAsyncCharacter:
+    def test_constructor(self):
+        source = Mock()
+        character = AsyncCharacter("c", source)
+        assert character.name == "c"
+        assert character.source is source
+
+    # noinspection PyTypeChecker
+    def test_choose_move(self):
+        move = Mock()
+        source = Mock()
+        source.choose_move = AsyncMock(return_value=move)
+        character = AsyncCharacter("c", source)
+        mode = Mock()
+        view = Mock()
+        legal_moves = []
+        evaluator = MagicMock()
+        assert asyncio.run(character.choose_move(mode, view, legal_moves, evaluator)) is move
+        source.choose_move.assert_awaited_once_with(mode, view, legal_moves, evaluator)
+
+
+class TestAsyncEngine:
+    def test_constructor(self):
+        character1 = AsyncCharacter("character1", QueueInputSource())
+        character2 = AsyncCharacter("character2", QueueInputSource())
+        engine = AsyncEngine(GameMode.STANDARD, [character1, character2], first=PlayerColor.YELLOW)
+        assert engine.mode == GameMode.STANDARD
+        assert engine.players == 2
+        assert engine.first == PlayerColor.YELLOW
+        assert engine.colors == {PlayerColor.RED: character1, PlayerColor.YELLOW: character2}
+        assert engine.game.playercount == 2
+        assert engine.state == "Game waiting to start"
+        assert not engine.started and not engine.completed and not engine.playing
+        assert engine._engine.first == PlayerColor.YELLOW and engine._engine.rng is engine.rng
+
+    def test_reset(self):
+        engine = TestAsyncEngine._create_engine()
+        game = engine.game
+        assert engine.reset() is engine.game
+        assert engine.game is not game
+
+    def test_start_game(self):
+        engine = AsyncEngine(GameMode.STANDARD, [AsyncCharacter("c", QueueInputSource()), AsyncCharacter("d", QueueInputSource())])
+        assert engine.start_game() is engine.game
+        assert engine.started and engine.state == "Game in progress"
+        assert all(character.source.rng is engine.rng for character in engine.characters)
+
+    def test_restore(self):
+        engine = TestAsyncEngine._create_engine()
+        engine._turn = (PlayerColor.YELLOW, engine.characters[1])  # as if a turn had failed
+        assert engine.next_color == PlayerColor.YELLOW
+        saved = engine.game.to_json()
+        restored = AsyncEngine(engine.mode, engine.characters, first=engine.next_color)
+        restored.restore(Game.from_json(saved))
+        assert restored.game == engine.game
+        assert restored.next_color == PlayerColor.YELLOW
+        assert all(character.source.rng is restored.rng for character in restored.characters)
+
+    def test_play_same_as_engine(self):
+        for mode in GameMode:
+            engine = Engine(mode, [Character(f"{index}", RandomInputSource()) for index in range(3)], rng=5)
+            engine.start_game()
+            while not engine.completed:
+                engine.play_next()
+
+            characters = [AsyncCharacter(f"{index}", AsyncInputSourceAdapter(RandomInputSource())) for index in range(3)]
+            async_engine = AsyncEngine(mode, characters, rng=5)
+            async_engine.start_game()
+            while not async_engine.completed:
+                asyncio.run(async_engine.play_next())
+
+            assert async_engine.game.players == engine.game.players  # the same seed plays the same game
+            assert async_engine.winner()[0].name == engine.winner()[0].name
+            assert async_engine.winner()[1] == engine.winner()[1]
+            assert async_engine.state == "Game completed"
+
+    def test_play_next_completed(self):
+        engine = TestAsyncEngine._create_engine()
+        engine._engine._game = MagicMock(completed=True)
+        with pytest.raises(ValueError, match=r"Game is complete"):
+            asyncio.run(engine.play_next())
+
+    def test_play_next_illegal_move(self):
+        engine = TestAsyncEngine._create_engine()
+        source = engine.characters[0].source
+        assert isinstance(source, QueueInputSource)
+
+        async def play() -> None:
+            task = asyncio.create_task(engine.play_next())
+            request = await source.requests.get()
+            request.reply.set_result(Move(Card("bogus", CardType.CARD_1), []))
+            await task
+
+        asyncio.run(play())
+        assert engine.game.history[-2].action == "Illegal move: a random legal move will be chosen"
+
+    def test_play_next_concurrent(self):
+        engine = TestAsyncEngine._create_engine()
+        source = engine.characters[0].source
+        assert isinstance(source, QueueInputSource)
+
+        async def play() -> None:
+            task = asyncio.create_task(engine.play_next())
+            request = await source.requests.get()
+            assert engine.playing
+            with pytest.raises(ValueError, match=r"A turn is already being played"):
+                await engine.play_next()
+            request.reply.set_result(request.legal_moves[0])
+            await task
+            assert not engine.playing
+
+        asyncio.run(play())
+
+    def test_play_next_cancelled(self):
+        engine = TestAsyncEngine._create_engine()
+        source = engine.characters[0].source
+        assert isinstance(source, QueueInputSource)
+        saved = engine.game.copy()
+
+        async def play() -> None:
+            with pytest.raises(TimeoutError):
+                await asyncio.wait_for(engine.play_next(), timeout=0.01)  # nobody ever answers the request
+            assert engine.game == saved  # all changes made during the turn are rolled back
+            assert not engine.playing
+            await source.requests.get()  # discard the request that was never answered
+
+            task = asyncio.create_task(engine.play_next())
+            request = await source.requests.get()  # the same player retries the turn
+            assert request.view.player.color == PlayerColor.RED
+            request.reply.set_result(request.legal_moves[0])
+            await task
+
+        asyncio.run(play())
+        assert engine.game.players[PlayerColor.RED].turns > 0
+        assert engine.game.players[PlayerColor.YELLOW].turns == 0
+
+    def test_play_next_move_deadline(self):
+        engine = TestAsyncEngine._create_engine()
+        engine.move_deadline = 0.01
+        source = engine.characters[0].source
+        assert isinstance(source, QueueInputSource)
+
+        async def play() -> None:
+            await engine.play_next()  # nobody ever answers the request
+            request = await source.requests.get()
+            assert request.reply.cancelled()
+
+        asyncio.run(play())
+        missed = [entry for entry in engine.game.history if entry.action.startswith("Move deadline exceeded")]
+        assert engine.missed_deadlines == len(missed) == 1
+        assert engine.game.players[PlayerColor.RED].turns > 0
+        assert engine.game.players[PlayerColor.YELLOW].turns == 0
+
+    def test_play_next_character_timeout(self):
+        for deadline in [None, 10.0]:
+            engine = TestAsyncEngine._create_engine()
+            engine.move_deadline = deadline
+            error = TimeoutError("Network read timed out")
+            engine.characters[0].source.choose_move = AsyncMock(side_effect=error)
+            saved = engine.game.copy()
+            with pytest.raises(TimeoutError) as e:
+                asyncio.run(engine.play_next())
+            assert e.value is error  # the character's own timeout is not a missed deadline
+            assert engine.missed_deadlines == 0
+            assert engine.game == saved
+
+    def test_profiler(self):
+        profiler = EngineProfiler()
+        characters = [AsyncCharacter(f"{index}", AsyncInputSourceAdapter(RandomInputSource())) for index in range(2)]
+        engine = AsyncEngine(GameMode.STANDARD, characters, rng=5, profiler=profiler)
+        engine.start_game()
+        for _ in range(10):
+            asyncio.run(engine.play_next())
+        assert list(profiler.timings) == ["RandomInputSource"]
+        assert profiler.timing("RandomInputSource", EnginePhase.TURN).calls == 10
+        for phase in EnginePhase:
+            assert profiler.timing("RandomInputSource", phase).total_ns > 0
+
+    @staticmethod
+    def _create_engine(mode: GameMode = GameMode.STANDARD) -> AsyncEngine:
+        character1 = AsyncCharacter("character1", QueueInputSource())
+        character2 = AsyncCharacter("character2", QueueInputSource())
+        engine = AsyncEngine(mode, [character1, character2], first=PlayerColor.RED)
+        engine._engine._rules.draw_again = MagicMock(return_value=False)  # type: ignore[method-assign] # so every turn is exactly one move
+        engine.start_game()
+        engine.game.players[PlayerColor.RED].pawns[0].position.move_to_square(10)  # so every card has a legal move
+        return engine
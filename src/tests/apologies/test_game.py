@@ -1,5 +1,8 @@
 # vim: set ft=python ts=4 sw=4 expandtab:
+# ruff: noqa: S311
 
+import json
+import random
 from unittest.mock import MagicMock
 
 import pytest
@@ -17,6 +20,8 @@
     Deck,
     Game,
     History,
+    HistoryMode,
+    Journal,
     Pawn,
     Player,
     PlayerColor,
@@ -32,19 +37,75 @@ def test_constructor(self):
         assert card.cardtype == CardType.CARD_12
 
 
+class TestJournal:
+    def test_rollback(self):
+        journal = Journal()
+        values = [1, 2]
+        values.append(3)
+        journal.record(values.pop)
+        values.insert(0, 0)
+        journal.record(lambda: values.pop(0))
+        assert len(journal) == 2
+        journal.rollback()
+        assert values == [1, 2]
+        assert len(journal) == 0
+        journal.rollback()  # nothing left to do
+        assert values == [1, 2]
+
+
 class TestDeck:
     def test_constructor(self):
         deck = Deck()
 
-        assert len(deck._draw_pile.keys()) == DECK_SIZE
-        assert len(deck._discard_pile.keys()) == 0
+        assert len(deck._draw_pile) == DECK_SIZE
+        assert len(deck._discard_pile) == 0
 
         cardcounts = dict.fromkeys(CardType, 0)
-        for card in deck._draw_pile.values():
+        for card in deck._draw_pile:
             cardcounts[card.cardtype] += 1
         for cardtype in CardType:
             assert cardcounts[cardtype] == DECK_COUNTS[cardtype]
 
+    def test_copy(self):
+        deck = Deck()
+        deck.discard(deck.draw())
+        copy = deck.copy()
+        assert copy is not deck and copy == deck
+        copy.draw()
+        assert copy != deck
+        assert len(deck._draw_pile) == DECK_SIZE - 1
+
+    def test_equality_ignores_order(self):
+        cards = [Card("0", CardType.CARD_1), Card("1", CardType.CARD_2), Card("2", CardType.CARD_3)]
+        assert Deck(draw_pile=cards[:2], discard_pile=cards[2:]) == Deck(draw_pile=cards[1::-1], discard_pile=cards[2:])
+        assert Deck(draw_pile=cards[:2], discard_pile=cards[2:]) != Deck(draw_pile=cards[1:], discard_pile=cards[:1])
+
+    def test_draw_rng(self):
+        deck1 = Deck()
+        deck2 = Deck()
+        deck1.rng = random.Random(5)
+        deck2.rng = random.Random(5)
+        assert deck1 == deck2  # the generator is not part of the deck's state
+        assert [deck1.draw() for _ in range(DECK_SIZE)] == [deck2.draw() for _ in range(DECK_SIZE)]
+
+    def test_draw_and_discard_rollback(self):
+        deck = Deck()
+        drawn = [deck.draw() for _ in range(DECK_SIZE - 1)]
+        deck.discard(drawn.pop())
+        deck.discard(drawn.pop())
+        saved = deck.copy()
+
+        journal = Journal()
+        deck.journal = journal
+        deck.draw()  # the last card in the draw pile
+        card = deck.draw()  # reshuffles the discard pile into the draw pile
+        deck.discard(card)
+        deck.discard(drawn.pop())
+        assert deck != saved
+
+        journal.rollback()
+        assert deck == saved
+
     def test_draw_and_discard(self):
         deck = Deck()
 
@@ -308,6 +369,14 @@ def test_constructor_with_name(self):
         assert pawn.position == Position()
         assert f"{pawn}" == "whatever->start"  # because default position is in start
 
+    def test_copy(self):
+        pawn = Pawn(PlayerColor.RED, 2, name="whatever")
+        pawn.position.move_to_square(32)
+        copy = pawn.copy()
+        assert copy is not pawn and copy == pawn
+        copy.position.move_to_home()
+        assert pawn.position.square == 32
+
 
 class TestPlayer:
     def test_constructor(self):
@@ -325,6 +394,19 @@ def test_copy(self):
         player.pawns[2].position.move_to_square(32)
         copy = player.copy()
         assert copy is not player and copy == player
+        copy.pawns[2].position.move_to_start()
+        copy.hand.append(Card("0", CardType.CARD_1))
+        assert player.pawns[2].position.square == 32
+        assert len(player.hand) == 0
+
+    def test_public_data(self):
+        player = Player(PlayerColor.RED, hand=[Card("0", CardType.CARD_1)], turns=3)
+        player.pawns[0].position.move_to_square(32)
+        public = player.public_data()
+        assert public.hand == []
+        assert public.turns == 3
+        assert public.pawns == player.pawns
+        assert len(player.hand) == 1
 
     def test_find_first_pawn_in_start(self):
         player = Player(PlayerColor.RED)
@@ -363,6 +445,13 @@ def test_str(self):
         history = History("This is an action", color=PlayerColor.BLUE, card=CardType.CARD_10, timestamp=timestamp)
         assert f"{history}" == "[14:02:16] Blue - This is an action"
 
+    def test_copy(self):
+        history = History("action", PlayerColor.BLUE, CardType.CARD_10)
+        copy = history.copy()
+        assert copy is not history and copy == history
+        copy.action = "changed"
+        assert history.action == "action"
+
 
 class TestPlayerView:
     def test_constructor(self):
@@ -378,6 +467,8 @@ def test_copy(self):
         view = PlayerView(player, opponents)
         copy = view.copy()
         assert copy is not view and copy == view
+        copy.opponents[PlayerColor.GREEN].pawns[0].position.move_to_home()
+        assert opponents[PlayerColor.GREEN].pawns[0].position.start is True
 
     def test_get_pawn(self):
         player = Player(PlayerColor.RED)
@@ -456,6 +547,15 @@ def test_copy(self):
         game = TestGame._create_realistic_game()
         copy = game.copy()
         assert copy == game
+        copy.players[PlayerColor.RED].pawns[0].position.move_to_home()
+        copy.players[PlayerColor.RED].hand.append(copy.deck.draw())
+        copy.history[0].action = "changed"
+        copy.track("another")
+        assert copy != game
+        assert game.players[PlayerColor.RED].pawns[0].position.square == 32
+        assert len(game.players[PlayerColor.RED].hand) == 0
+        assert game.history[0].action != "changed"
+        assert len(game.history) == len(copy.history) - 1
 
     def test_json_roundtrip(self):
         game = TestGame._create_realistic_game()
@@ -463,6 +563,99 @@ def test_json_roundtrip(self):
         copy = Game.from_json(data)
         assert copy == game
 
+    def test_json_deck_format(self):
+        game = TestGame._create_realistic_game()
+        deck = json.loads(game.to_json())["deck"]
+        assert deck["_draw_pile"] == {card.id: {"id": card.id, "cardtype": card.cardtype.value} for card in game.deck._draw_pile}
+        assert deck["_discard_pile"] == {
+            card.id: {"id": card.id, "cardtype": card.cardtype.value} for card in game.deck._discard_pile
+        }
+        assert len(deck["_draw_pile"]) == DECK_SIZE - 3 and len(deck["_discard_pile"]) == 2
+
+    def test_json_transaction(self):
+        game = TestGame._create_realistic_game()
+        data = game.to_json()
+        with game.transaction():
+            assert "journal" not in game.to_json()  # the journal is never serialized
+        assert game.to_json() == data
+
+    def test_transaction_commit(self):
+        game = TestGame._create_realistic_game()
+        with game.transaction() as result:
+            assert result is game
+            assert game.journal is not None and game.deck.journal is game.journal
+            game.track("action", game.players[PlayerColor.RED])
+            game.deck.discard(game.deck.draw())
+        assert game.journal is None and game.deck.journal is None
+        assert game.history[-1].action == "action"
+        assert game.players[PlayerColor.RED].turns == 2
+
+    def test_transaction_rollback(self):
+        game = TestGame._create_realistic_game()
+        saved = game.copy()
+
+        def change():
+            with game.transaction():
+                game.track("general")
+                game.track("action", game.players[PlayerColor.RED])
+                game.deck.discard(game.deck.draw())
+                game.deck.draw()
+                raise ValueError("rollback")
+
+        with pytest.raises(ValueError):
+            change()
+        assert game.journal is None and game.deck.journal is None
+        assert game == saved
+
+    def test_transaction_nested(self):
+        game = TestGame._create_realistic_game()
+        saved = game.copy()
+
+        def inner(action, fail):
+            with game.transaction():
+                game.track(action)
+                if fail:
+                    raise ValueError("inner")
+
+        def outer():
+            with game.transaction():
+                inner("committed", fail=False)
+                with pytest.raises(ValueError):
+                    inner("rolled back", fail=True)
+                assert game.history[-1].action == "committed"
+                raise ValueError("outer")
+
+        with pytest.raises(ValueError):
+            outer()
+        assert game == saved
+
+    def test_track_general_mode(self):
+        game = Game(4)
+        game.history_mode = HistoryMode.GENERAL
+        assert game.tracks_player_actions is False
+        assert game.copy().history_mode == HistoryMode.GENERAL
+        game.track("general")
+        game.track("player", game.players[PlayerColor.RED], Card("0", CardType.CARD_1))
+        assert [entry.action for entry in game.history] == ["general"]  # only general actions are tracked
+        assert game.started is True
+        assert game.players[PlayerColor.RED].turns == 1  # but turns are still counted
+
+    def test_track_general_mode_rollback(self):
+        game = Game(4)
+        game.history_mode = HistoryMode.GENERAL
+        game.track("general")
+        saved = game.copy()
+
+        def change():
+            with game.transaction():
+                game.track("player", game.players[PlayerColor.RED])
+                game.track("another")
+                raise ValueError("rollback")
+
+        with pytest.raises(ValueError):
+            change()
+        assert game == saved
+
     def test_track_no_player(self):
         game = Game(4)
         game.track("action")
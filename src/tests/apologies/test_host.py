@@ -0,0 +1,314 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+
+import asyncio
+import itertools
+import json
+from collections.abc import Callable
+
+import pytest
+
+from apologies.engine import AsyncCharacter
+from apologies.game import Game, GameMode, HistoryMode, PlayerColor, PlayerView
+from apologies.host import FileStorage, GameHost, HostMetrics, MemoryStorage
+from apologies.rules import LegalMoveCache, Move
+from apologies.source import AsyncCharacterInputSource, AsyncInputSourceAdapter, QueueInputSource, RandomInputSource
+
+
+class _RecordingSource(AsyncCharacterInputSource):
+    """A source that records a label for every move it chooses, optionally failing instead."""
+
+    def __init__(self, label: str, moves: list[str], error: Exception | None = None) -> None:
+        self.label = label
+        self.moves = moves
+        self.error = error
+
+    async def choose_move(
+        self,
+        _mode: GameMode,
+        _view: PlayerView,
+        legal_moves: list[Move],
+        _evaluator: Callable[[PlayerView, Move], PlayerView],
+    ) -> Move:
+        if self.error:
+            raise self.error
+        self.moves.append(self.label)
+        await asyncio.sleep(0)  # give other games a chance to run, like a real source would
+        return legal_moves[0]
+
+
+def _characters(players: int = 2) -> list[AsyncCharacter]:
+    return [AsyncCharacter(f"Player {index}", AsyncInputSourceAdapter(RandomInputSource())) for index in range(players)]
+
+
+def _clock() -> Callable[[], float]:
+    """A fake clock that advances by one second every time it is read."""
+    return itertools.count().__next__
+
+
+class TestMemoryStorage:
+    def test_storage(self):
+        storage = MemoryStorage()
+        with pytest.raises(ValueError, match=r"Game not found: a"):
+            storage.load("a")
+        storage.save("a", "data")
+        assert storage.load("a") == "data"
+        storage.save("a", "other")
+        assert storage.load("a") == "other"
+        storage.delete("a")
+        storage.delete("a")  # deleting a missing game is not an error
+        with pytest.raises(ValueError):
+            storage.load("a")
+
+
+class TestFileStorage:
+    def test_storage(self, tmp_path):
+        storage = FileStorage(str(tmp_path / "games"))
+        assert storage.directory.is_dir()
+        with pytest.raises(ValueError, match=r"Game not found: a"):
+            storage.load("a")
+        storage.save("a", "data")
+        assert (tmp_path / "games" / "a.json").read_text(encoding="utf-8") == "data"
+        assert storage.load("a") == "data"
+        storage.delete("a")
+        storage.delete("a")  # deleting a missing game is not an error
+        assert not (tmp_path / "games" / "a.json").exists()
+
+
+class TestGameHost:
+    def test_constructor(self):
+        host = GameHost()
+        assert isinstance(host.storage, MemoryStorage)
+        assert host.move_deadline is None
+        assert host.idle_timeout is None
+        assert host.max_active is None
+        assert host.concurrency == 100
+        assert host.history_mode == HistoryMode.FULL
+        assert host.game_ids == []
+        assert host.metrics() == HostMetrics(0, 0, 0, 0, 0, 0, 0, 0, None, None, None)
+
+    def test_constructor_invalid(self):
+        with pytest.raises(ValueError, match=r"Concurrency must be at least 1"):
+            GameHost(concurrency=0)
+
+    def test_create_game(self):
+        cache = LegalMoveCache(maxsize=10)
+        host = GameHost(move_deadline=5.0, history_mode=HistoryMode.GENERAL, legal_move_cache=cache)
+        characters = _characters(3)
+        engine = host.create_game("a", GameMode.ADULT, characters, seed=5)
+        assert host.engine("a") is engine
+        assert host.game_ids == ["a"]
+        assert engine.mode == GameMode.ADULT
+        assert engine.characters == characters
+        assert engine.started
+        assert engine.move_deadline == 5.0
+        assert engine.history_mode == HistoryMode.GENERAL
+        assert engine.legal_move_cache is cache
+        with pytest.raises(ValueError, match=r"Game already exists: a"):
+            host.create_game("a", GameMode.ADULT, _characters())
+
+    def test_engine_not_found(self):
+        with pytest.raises(ValueError, match=r"Game not in memory: a"):
+            GameHost().engine("a")
+
+    def test_run(self):
+        host = GameHost(concurrency=3)
+        engines = [
+            host.create_game(f"{index}", mode, _characters(), seed=index) for index, mode in enumerate([*GameMode, *GameMode])
+        ]
+        asyncio.run(host.run())
+        assert all(engine.completed for engine in engines)
+        metrics = host.metrics()
+        assert metrics.active_games == metrics.completed_games == 4
+        assert metrics.playing_games == metrics.paused_games == metrics.evicted_games == 0
+        assert metrics.turns > 0 and metrics.missed_deadlines == metrics.failed_turns == 0
+        assert metrics.turn_p50_ms is not None and metrics.turn_p95_ms is not None and metrics.turn_p99_ms is not None
+        assert 0 < metrics.turn_p50_ms <= metrics.turn_p95_ms <= metrics.turn_p99_ms
+
+    def test_run_fair(self):
+        moves: list[str] = []
+        host = GameHost(concurrency=2)
+        for game_id in ["a", "b", "c"]:
+            characters = [AsyncCharacter(f"{index}", _RecordingSource(game_id, moves)) for index in range(2)]
+            host.create_game(game_id, GameMode.STANDARD, characters, seed=1)
+        asyncio.run(host.run())
+        turns = [label for label, _ in itertools.groupby(moves)]  # a turn may have more than one move
+        assert turns[:9] == ["a", "b", "c"] * 3  # every game gets a turn before any game gets another one
+
+    def test_run_failed_turn(self):
+        error = ConnectionError("Player disconnected")
+        host = GameHost()
+        host.create_game("a", GameMode.STANDARD, [AsyncCharacter(f"{i}", _RecordingSource("a", [], error)) for i in range(2)])
+        saved = host.engine("a").game.copy()
+        asyncio.run(host.run())
+        assert host.error("a") is error
+        assert host.engine("a").game == saved  # the failed turn is rolled back
+        assert host.metrics().failed_turns == 1
+        assert host.metrics().paused_games == 1
+        assert host.resume("a") is host.engine("a")
+        assert host.error("a") is None
+
+    def test_move_deadline(self):
+        host = GameHost(move_deadline=0.01)
+        engine = host.create_game("a", GameMode.STANDARD, [AsyncCharacter(f"{i}", QueueInputSource()) for i in range(2)])
+
+        async def play() -> None:
+            for _ in range(2):
+                await host.play_turn("a")  # nobody ever answers
+
+        asyncio.run(play())
+        assert host.metrics().missed_deadlines == engine.missed_deadlines >= 2
+        assert host.metrics().turns == 2
+
+    def test_play_turn_concurrent(self):
+        host = GameHost()
+        source = QueueInputSource()
+        host.create_game("a", GameMode.STANDARD, [AsyncCharacter("0", source), AsyncCharacter("1", source)])
+
+        async def play() -> None:
+            task = asyncio.create_task(host.play_turn("a"))
+            request = await source.requests.get()
+            assert host.metrics().playing_games == 1
+            with pytest.raises(ValueError, match=r"A turn is being played for game: a"):
+                await host.play_turn("a")
+            with pytest.raises(ValueError, match=r"A turn is being played for game: a"):
+                host.evict("a")
+            with pytest.raises(ValueError, match=r"A turn is being played for game: a"):
+                host.remove("a")
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert request.reply.cancelled()
+
+        asyncio.run(play())
+        assert host.metrics().playing_games == 0
+
+    def test_pause_and_resume(self):
+        host = GameHost()
+        paused = host.create_game("a", GameMode.STANDARD, _characters(), seed=1)
+        played = host.create_game("b", GameMode.STANDARD, _characters(), seed=2)
+        host.pause("a")
+        assert host.metrics().paused_games == 1
+        asyncio.run(host.run())
+        assert played.completed and not paused.completed
+        assert host.resume("a") is paused
+        asyncio.run(host.run())
+        assert paused.completed
+
+    def test_evict_and_resume(self, tmp_path):
+        host = GameHost(storage=FileStorage(str(tmp_path)))
+        engine = host.create_game("a", GameMode.ADULT, _characters(3), seed=1)
+
+        async def play() -> None:
+            for _ in range(10):
+                await host.play_turn("a")
+
+        asyncio.run(play())
+        saved = engine.game.copy()
+        color = engine.next_color
+
+        host.evict("a")
+        assert host.is_evicted("a")
+        assert host.game_ids == ["a"]
+        assert host.metrics().evicted_games == 1 and host.metrics().active_games == 0
+        with pytest.raises(ValueError, match=r"Game not in memory: a"):
+            host.engine("a")
+        with pytest.raises(ValueError, match=r"Characters are required"):
+            host.resume("a")
+        with pytest.raises(ValueError, match=r"Game requires 3 characters"):
+            host.resume("a", _characters(2))
+        with pytest.raises(ValueError, match=r"Game already exists: a"):
+            host.create_game("a", GameMode.ADULT, _characters(3))
+
+        characters = _characters(3)
+        resumed = host.resume("a", characters)
+        assert resumed is host.engine("a") and resumed is not engine
+        assert resumed.characters == characters
+        assert resumed.mode == GameMode.ADULT
+        assert resumed.game == saved
+        assert resumed.next_color == color
+        assert not host.is_evicted("a")
+        assert not (tmp_path / "a.json").exists()
+
+        asyncio.run(host.run())
+        assert resumed.completed
+
+    def test_evict_and_resume_reproducible(self):
+        async def play(host: GameHost, evict: bool) -> None:
+            for turn in range(40):
+                if evict and turn % 10 == 0:
+                    host.evict("a")
+                    host.resume("a", _characters(3))
+                await host.play_turn("a")
+
+        games = []
+        for evict in [False, True]:
+            host = GameHost()
+            host.create_game("a", GameMode.STANDARD, _characters(3), seed=5)
+            asyncio.run(play(host, evict))
+            games.append(host.engine("a").game)
+        assert games[0].players == games[1].players  # eviction doesn't change how a seeded game plays out
+
+    def test_resume_not_found(self):
+        with pytest.raises(ValueError, match=r"Game not found: a"):
+            GameHost().resume("a", _characters())
+
+    def test_evict_idle_timeout(self):
+        host = GameHost(idle_timeout=10, clock=_clock())
+        host.create_game("playing", GameMode.STANDARD, _characters())
+        host.create_game("paused", GameMode.STANDARD, _characters())
+        host.create_game("completed", GameMode.STANDARD, _characters())
+        host.pause("paused")
+        host._sessions["completed"].engine.game.players[PlayerColor.RED].pawns.clear()  # all remaining pawns are home
+        assert host.evict_idle() == []  # nothing has been idle for long enough
+        for _ in range(10):
+            host.clock()
+        assert host.evict_idle() == ["completed", "paused"]  # a game that can still be played is never idle
+        assert host.game_ids == ["playing", "completed", "paused"]
+
+    def test_evict_idle_max_active(self):
+        host = GameHost(max_active=2, clock=_clock())
+        for game_id in ["a", "b", "c", "d"]:
+            host.create_game(game_id, GameMode.STANDARD, _characters())
+        host.pause("c")
+        host.pause("b")
+        host.pause("a")
+        assert host.evict_idle() == ["c", "b"]  # least recently active first
+        assert host.evict_idle() == []
+        assert host.metrics().active_games == 2
+
+    def test_remove(self):
+        host = GameHost()
+        host.create_game("a", GameMode.STANDARD, _characters())
+        host.create_game("b", GameMode.STANDARD, _characters())
+        host.evict("b")
+        host.remove("a")
+        host.remove("b")
+        assert host.game_ids == []
+        with pytest.raises(ValueError):
+            host.storage.load("b")
+        with pytest.raises(ValueError, match=r"Game not found: a"):
+            host.remove("a")
+
+    def test_metrics_latency(self):
+        host = GameHost(clock=_clock())
+        host.create_game("a", GameMode.STANDARD, _characters())
+
+        async def play() -> None:
+            await host.play_turn("a")
+            assert host.metrics().turn_p50_ms is None  # not enough turns yet
+            await host.play_turn("a")
+
+        asyncio.run(play())
+        metrics = host.metrics()
+        assert metrics.turn_p50_ms == metrics.turn_p95_ms == metrics.turn_p99_ms == 1000.0  # the fake clock advances 1s per turn
+
+    def test_saved_game(self):
+        host = GameHost()
+        engine = host.create_game("a", GameMode.STANDARD, _characters(), seed=3)
+        host.evict("a")
+        data = json.loads(host.storage.load("a"))
+        assert data["mode"] == "Standard"
+        assert data["names"] == ["Player 0", "Player 1"]
+        assert data["next"] == engine.next_color.value
+        assert data["rng"][0] == engine.rng.getstate()[0]
+        assert Game.from_json(data["game"]) == engine.game
@@ -1,7 +1,9 @@
 # vim: set ft=python ts=4 sw=4 expandtab:
 
-from apologies.game import Game, PlayerColor
-from apologies.reward import RewardCalculatorV1
+from apologies.game import Card, CardType, Game, PlayerColor, Position
+from apologies.reward import IncrementalRewardV1, RewardCalculatorV1
+from apologies.rules import Action, ActionType, Move, Rules
+from tests.apologies.helpers import random_positions
 
 
 class TestRewardCalculatorV1:
@@ -108,3 +110,65 @@ def test_arbitrary(self):
 
         view = game.create_player_view(PlayerColor.BLUE)
         assert RewardCalculatorV1().calculate(view) == 0
+
+
+class TestIncrementalRewardV1:
+    """
+    Unit tests for IncrementalRewardV1.
+    """
+
+    def test_from_view(self):
+        game = Game(playercount=3)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_safe(4)
+        view = game.create_player_view(PlayerColor.RED)
+        incremental = RewardCalculatorV1().incremental(view)
+        assert isinstance(incremental, IncrementalRewardV1)
+        assert incremental.color == PlayerColor.RED
+        assert incremental.positions[PlayerColor.RED] == [64, 66, 66, 66]
+        assert incremental.scores == {PlayerColor.RED: 74, PlayerColor.YELLOW: 0, PlayerColor.GREEN: 0}
+        assert incremental.reward == RewardCalculatorV1().calculate(view) == 148
+
+    def test_empty_move(self):
+        game = Game(playercount=2)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(6)
+        view = game.create_player_view(PlayerColor.RED)
+        incremental = IncrementalRewardV1.from_view(view)
+        assert incremental.calculate(Move(Card("0", CardType.CARD_1), actions=[])) == incremental.reward
+
+    def test_invalid_pawn(self):
+        game = Game(playercount=2)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(6)
+        view = game.create_player_view(PlayerColor.RED)
+        pawn = Game(playercount=4).players[PlayerColor.GREEN].pawns[0]  # GREEN is not part of a 2-player game
+        move = Move(Card("0", CardType.CARD_1), actions=[Action(ActionType.MOVE_TO_START, pawn)])
+        assert IncrementalRewardV1.from_view(view).calculate(move) == RewardCalculatorV1().calculate(view)
+
+    def test_actions_and_side_effects(self):
+        game = Game(playercount=3)
+        red = game.players[PlayerColor.RED].pawns
+        yellow = game.players[PlayerColor.YELLOW].pawns
+        red[0].position.move_to_square(6)
+        yellow[0].position.move_to_safe(4)
+        yellow[1].position.move_to_home()
+        yellow[2].position.move_to_home()
+        yellow[3].position.move_to_home()
+        view = game.create_player_view(PlayerColor.YELLOW)
+        move = Move(
+            Card("0", CardType.CARD_1),
+            actions=[
+                Action(ActionType.MOVE_TO_POSITION, yellow[0], Position().move_to_square(22)),
+                Action(ActionType.MOVE_TO_POSITION, yellow[0], Position().move_to_home()),  # the last action wins
+            ],
+            side_effects=[Action(ActionType.MOVE_TO_START, red[0])],
+        )
+        expected = RewardCalculatorV1().calculate(Rules.evaluate_move(view, move))
+        assert IncrementalRewardV1.from_view(view).calculate(move) == expected == 800  # winner, and RED is back in start
+
+    def test_random_games(self):
+        # Play random ADULT mode games, checking the reward for every legal move at every turn
+        calculator = RewardCalculatorV1()
+        for view, moves in random_positions():
+            incremental = calculator.incremental(view)
+            assert incremental.reward == calculator.calculate(view)
+            for move in moves:
+                assert incremental.calculate(move) == calculator.calculate(Rules.evaluate_move(view, move))
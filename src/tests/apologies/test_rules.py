@@ -4,8 +4,10 @@
 
 import pytest
 
-from apologies.game import ADULT_HAND, DECK_SIZE, PAWNS, Card, CardType, Game, GameMode, Pawn, PlayerColor, Position
-from apologies.rules import Action, ActionType, BoardRules, Move, Rules
+from apologies.compact import HOME_CODE, POSITION_CODES, SAFE_BASE, START_CODE, decode_position, encode_position
+from apologies.game import ADULT_HAND, DECK_SIZE, PAWNS, Card, CardType, Game, GameMode, HistoryMode, Pawn, PlayerColor, Position
+from apologies.rules import DISTANCE_TO_HOME, Action, ActionType, BoardRules, LegalMoveCache, Move, Rules
+from apologies.util import create_rng
 
 _UUID = MagicMock(return_value=MagicMock(hex="uuid"))  # any call to get a random UUID returns a UUID with hex value "uuid"
 
@@ -37,6 +39,17 @@ def test_constructor_uuid_unique(self):
         move2 = Move(card, actions)
         assert move1.id != move2.id  # just make sure we get a unique UUID each time in the default case
 
+    def test_constructor_uuid_lazy(self):
+        card = Card(3, CardType.CARD_12)
+        with patch("apologies.rules.uuid.uuid4") as uuid4:
+            uuid4.return_value = MagicMock(hex="lazy")
+            move = Move(card, [])
+            uuid4.assert_not_called()  # the UUID isn't generated until it's needed
+            assert move.id == "lazy"
+            assert move.id == "lazy"
+            uuid4.assert_called_once()
+        assert move == Move(card, [], id="other")  # the id isn't part of equality
+
     def test_constructor_explicit(self):
         card = Card(3, CardType.CARD_12)
         actions = [Action(ActionType.MOVE_TO_START, pawn=Pawn(PlayerColor.BLUE, 1, "whatever"))]
@@ -45,6 +58,118 @@ def test_constructor_explicit(self):
         assert move.actions == actions
         assert move.id == "whatever"
 
+    def test_key(self):
+        red = Pawn(PlayerColor.RED, 0)
+        blue = Pawn(PlayerColor.BLUE, 1)
+        left = _square(red, 10)
+        right = Action(ActionType.MOVE_TO_POSITION, blue, Position().move_to_safe(2))
+        bump = Action(ActionType.MOVE_TO_START, Pawn(PlayerColor.GREEN, 3))
+
+        move = Move(Card(0, CardType.CARD_7), actions=[left, right], side_effects=[bump])
+        assert move.key() == (CardType.CARD_7, frozenset({(RED, 0, 10), (BLUE, 1, SAFE_BASE + 2), (GREEN, 3, START_CODE)}))
+        assert hash(move.key()) == hash(Move(Card(1, CardType.CARD_7), actions=[right, left], side_effects=[bump]).key())
+        assert move.key() != Move(Card(0, CardType.CARD_10), actions=[left, right], side_effects=[bump]).key()
+        assert move.key() != Move(Card(0, CardType.CARD_7), actions=[left, right]).key()
+
+        # only the final position of each pawn is included, after all actions and side effects are executed
+        forward = Move(Card(0, CardType.CARD_1), actions=[_square(red, 10), _square(red, 12)])
+        assert forward.key() == (CardType.CARD_1, frozenset({(RED, 0, 12)}))
+        assert Move(Card(0, CardType.CARD_1), actions=[]).key() == (CardType.CARD_1, frozenset())
+
+    def test_final_positions(self):
+        red = Pawn(PlayerColor.RED, 0)
+        bump = Action(ActionType.MOVE_TO_START, Pawn(PlayerColor.GREEN, 3))
+        ignored = Action(ActionType.MOVE_TO_POSITION, Pawn(PlayerColor.BLUE, 1))  # no position, so nothing happens
+
+        move = Move(Card(0, CardType.CARD_7), actions=[_square(red, 10), _square(red, 12), ignored], side_effects=[bump])
+        assert move.final_positions() == {(RED, 0): 12, (GREEN, 3): START_CODE}
+
+        back = Move(
+            Card(0, CardType.CARD_APOLOGIES), actions=[_square(red, 10)], side_effects=[Action(ActionType.MOVE_TO_START, red)]
+        )
+        assert back.final_positions() == {(RED, 0): START_CODE}  # side effects are executed after actions
+        assert Move(Card(0, CardType.CARD_1), actions=[]).final_positions() == {}
+
+
+class TestLegalMoveCache:
+    def test_constructor(self):
+        cache = LegalMoveCache(10)
+        assert cache.maxsize == 10
+        assert cache.hits == cache.misses == 0
+        assert cache.hit_rate == 0.0
+        assert len(cache) == 0
+
+    def test_constructor_invalid(self):
+        with pytest.raises(ValueError):
+            LegalMoveCache(0)
+
+    def test_get_and_put(self):
+        game = Game(2)
+        game.players[RED].pawns[0].position.move_to_square(6)
+        game.players[YELLOW].pawns[0].position.move_to_square(10)
+        view = game.create_player_view(RED)
+        moves = Rules(GameMode.STANDARD).construct_legal_moves(view, Card(0, CardType.CARD_4))
+        cache = LegalMoveCache(10)
+        key = (LegalMoveCache.placement(view.all_pawns()), RED, CardType.CARD_4)
+        assert cache.get(key, Card(0, CardType.CARD_4)) is None
+        cache.put(key, moves)
+        card = Card(1, CardType.CARD_4)
+        cached = cache.get(key, card)
+        assert cached is not None
+        assert [move.actions for move in cached] == [move.actions for move in moves]
+        assert [move.side_effects for move in cached] == [move.side_effects for move in moves]
+        assert all(move.card is card for move in cached)  # re-bound to the caller's card
+        view.player.pawns[0].position.move_to_square(30)
+        assert cached[0].actions[0].pawn.position.square == 6  # the cached templates don't reference the pawns in the view
+        assert cache.hits == cache.misses == 1
+        assert cache.hit_rate == 0.5
+
+    def test_get_copies(self):
+        game = Game(2)
+        game.players[RED].pawns[0].position.move_to_square(6)
+        view = game.create_player_view(RED)
+        moves = Rules(GameMode.STANDARD).construct_legal_moves(view, Card(0, CardType.CARD_4))
+        cache = LegalMoveCache(10)
+        key = (LegalMoveCache.placement(view.all_pawns()), RED, CardType.CARD_4)
+        cache.put(key, moves)
+        first = cache.get(key, Card(1, CardType.CARD_4))
+        assert first is not None
+        action = first[0].actions[0]
+        assert action.position is not None
+        action.position.move_to_square(40)  # changes to a returned move must not leak into the cache
+        action.pawn.position.move_to_square(50)
+        second = cache.get(key, Card(2, CardType.CARD_4))
+        assert second is not None
+        assert second[0].actions == moves[0].actions
+
+    def test_placement(self):
+        game = Game(2)
+        game.players[YELLOW].pawns[0].position.move_to_square(10)
+        red, yellow = game.create_player_view(RED), game.create_player_view(YELLOW)
+        colors, codes = LegalMoveCache.placement(red.all_pawns())
+        assert colors == (RED,) * PAWNS + (YELLOW,) * PAWNS
+        assert codes == bytes(encode_position(pawn.position) for pawn in red.all_pawns())
+        swapped = [pawn.copy() for pawn in red.all_pawns()]
+        for pawn in swapped:
+            pawn.color = GREEN if pawn.color == YELLOW else pawn.color  # the same positions, but owned by a different color
+        assert LegalMoveCache.placement(swapped) != LegalMoveCache.placement(red.all_pawns())
+        assert LegalMoveCache.placement(yellow.all_pawns()) != LegalMoveCache.placement(red.all_pawns())
+
+    def test_eviction(self):
+        cache = LegalMoveCache(2)
+        keys = [(((RED,), bytes([code])), RED, CardType.CARD_1) for code in range(3)]
+        cache.put(keys[0], [])
+        cache.put(keys[1], [])
+        assert cache.get(keys[0], Card(0, CardType.CARD_1)) == []  # now, keys[1] is least-recently used
+        cache.put(keys[2], [])
+        assert len(cache) == 2
+        assert cache.get(keys[1], Card(0, CardType.CARD_1)) is None
+        assert cache.get(keys[0], Card(0, CardType.CARD_1)) == []
+        assert cache.get(keys[2], Card(0, CardType.CARD_1)) == []
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.hits == cache.misses == 0
+
 
 class TestRules:
     def test_constructor(self):
@@ -125,12 +250,12 @@ def test_construct_legal_moves_no_moves_with_card(self):
         view.all_pawns = MagicMock(return_value=all_pawns)
 
         rules = Rules(GameMode.STANDARD)
-        rules._board_rules.construct_legal_moves = MagicMock(side_effect=legal_moves)
+        rules._board_rules.iter_legal_moves = MagicMock(side_effect=legal_moves)
         assert rules.construct_legal_moves(view, card=card) == expected_moves
 
-        rules._board_rules.construct_legal_moves.assert_has_calls([
-            call(PlayerColor.RED, card, pawn1, all_pawns),
-            call(PlayerColor.RED, card, pawn2, all_pawns),
+        rules._board_rules.iter_legal_moves.assert_has_calls([
+            call(PlayerColor.RED, card, pawn1, all_pawns, {}),
+            call(PlayerColor.RED, card, pawn2, all_pawns, {}),
         ])
 
     @patch("apologies.rules.uuid.uuid4", new=_UUID)
@@ -159,14 +284,14 @@ def test_construct_legal_moves_no_moves_no_card(self):
         view.all_pawns = MagicMock(return_value=all_pawns)
 
         rules = Rules(GameMode.STANDARD)
-        rules._board_rules.construct_legal_moves = MagicMock(side_effect=legal_moves)
+        rules._board_rules.iter_legal_moves = MagicMock(side_effect=legal_moves)
         assert rules.construct_legal_moves(view, card=card) == expected_moves
 
-        rules._board_rules.construct_legal_moves.assert_has_calls([
-            call(PlayerColor.RED, hand1, pawn1, all_pawns),
-            call(PlayerColor.RED, hand1, pawn2, all_pawns),
-            call(PlayerColor.RED, hand2, pawn1, all_pawns),
-            call(PlayerColor.RED, hand2, pawn2, all_pawns),
+        rules._board_rules.iter_legal_moves.assert_has_calls([
+            call(PlayerColor.RED, hand1, pawn1, all_pawns, {}),
+            call(PlayerColor.RED, hand1, pawn2, all_pawns, {}),
+            call(PlayerColor.RED, hand2, pawn1, all_pawns, {}),
+            call(PlayerColor.RED, hand2, pawn2, all_pawns, {}),
         ])
 
     @patch("apologies.rules.uuid.uuid4", new=_UUID)
@@ -199,12 +324,12 @@ def test_construct_legal_moves_with_moves_with_card(self):
         view.all_pawns = MagicMock(return_value=all_pawns)
 
         rules = Rules(GameMode.STANDARD)
-        rules._board_rules.construct_legal_moves = MagicMock(side_effect=legal_moves)
+        rules._board_rules.iter_legal_moves = MagicMock(side_effect=legal_moves)
         assert rules.construct_legal_moves(view, card=card) == expected_moves
 
-        rules._board_rules.construct_legal_moves.assert_has_calls([
-            call(PlayerColor.RED, card, pawn1, all_pawns),
-            call(PlayerColor.RED, card, pawn2, all_pawns),
+        rules._board_rules.iter_legal_moves.assert_has_calls([
+            call(PlayerColor.RED, card, pawn1, all_pawns, {}),
+            call(PlayerColor.RED, card, pawn2, all_pawns, {}),
         ])
 
     @patch("apologies.rules.uuid.uuid4", new=_UUID)
@@ -241,14 +366,14 @@ def test_construct_legal_moves_with_moves_no_card(self):
         view.all_pawns = MagicMock(return_value=all_pawns)
 
         rules = Rules(GameMode.STANDARD)
-        rules._board_rules.construct_legal_moves = MagicMock(side_effect=legal_moves)
+        rules._board_rules.iter_legal_moves = MagicMock(side_effect=legal_moves)
         assert rules.construct_legal_moves(view, card=card) == expected_moves
 
-        rules._board_rules.construct_legal_moves.assert_has_calls([
-            call(PlayerColor.RED, hand1, pawn1, all_pawns),
-            call(PlayerColor.RED, hand1, pawn2, all_pawns),
-            call(PlayerColor.RED, hand2, pawn1, all_pawns),
-            call(PlayerColor.RED, hand2, pawn2, all_pawns),
+        rules._board_rules.iter_legal_moves.assert_has_calls([
+            call(PlayerColor.RED, hand1, pawn1, all_pawns, {}),
+            call(PlayerColor.RED, hand1, pawn2, all_pawns, {}),
+            call(PlayerColor.RED, hand2, pawn1, all_pawns, {}),
+            call(PlayerColor.RED, hand2, pawn2, all_pawns, {}),
         ])
 
     # noinspection PyUnresolvedReferences
@@ -281,6 +406,110 @@ def test_execute_move(self):
         game.players[PlayerColor.BLUE].pawns[2].position.move_to_start.assert_called_once()
         game.players[PlayerColor.GREEN].pawns[0].position.move_to_position.assert_called_once_with(Position().move_to_square(12))
 
+    def test_execute_move_rollback(self):
+        rules = Rules(GameMode.STANDARD)
+        game = Game(4)
+        player = game.players[PlayerColor.RED]
+        game.players[PlayerColor.BLUE].pawns[2].position.move_to_square(32)
+        saved = game.copy()
+
+        move = Move(
+            Card("0", CardType.CARD_10),
+            actions=[
+                Action(ActionType.MOVE_TO_POSITION, MagicMock(color=PlayerColor.RED, index=1), Position().move_to_square(10)),
+                Action(ActionType.MOVE_TO_POSITION, MagicMock(color=PlayerColor.RED, index=1), Position().move_to_safe(2)),
+            ],
+            side_effects=[
+                Action(ActionType.MOVE_TO_START, MagicMock(color=PlayerColor.BLUE, index=2)),
+            ],
+        )
+
+        def execute():
+            with game.transaction():
+                rules.execute_move(game, player, move)
+                assert game.players[PlayerColor.RED].pawns[1].position == Position().move_to_safe(2)
+                assert game.players[PlayerColor.BLUE].pawns[2].position == Position()
+                assert len(game.history) == 1
+                raise ValueError("rollback")
+
+        with pytest.raises(ValueError):
+            execute()
+        assert game == saved
+
+    def test_construct_legal_moves_no_duplicates(self):
+        game = Game(4)
+        game.players[RED].pawns[0].position.move_to_square(6)
+        game.players[RED].pawns[2].position.move_to_square(20)
+        view = game.create_player_view(RED)
+        moves = Rules(GameMode.STANDARD).construct_legal_moves(view, Card(0, CardType.CARD_7))
+        assert len({move.key() for move in moves}) == len(moves)
+        assert len([move for move in moves if len(move.actions) == 2]) == 6  # each split appears once, not once per pawn
+        assert len(moves) == 2 + 6  # move either pawn 7, or split the move between them
+
+    def test_construct_legal_moves_same_card_type(self):
+        game = Game(4)
+        game.players[RED].pawns[0].position.move_to_square(6)
+        view = game.create_player_view(RED)
+        view.player.hand.extend([Card(0, CardType.CARD_5), Card(1, CardType.CARD_5)])
+        moves = Rules(GameMode.ADULT).construct_legal_moves(view)
+        assert [move.card.id for move in moves] == [0, 1]  # playing a different card is a different move
+        assert moves[0].key() == moves[1].key()
+
+    def test_iter_legal_moves(self):
+        rng = create_rng(5)
+        rules = Rules(GameMode.ADULT)
+        for _ in range(50):
+            game = Game(3)
+            for pawn in game.players[RED].pawns + game.players[YELLOW].pawns:
+                pawn.position.move_to_position(decode_position(rng.randrange(POSITION_CODES)))
+            view = game.create_player_view(RED)
+            view.player.hand.extend(Card(index, rng.choice(list(CardType))) for index in range(ADULT_HAND))
+            moves = rules.construct_legal_moves(view)
+            assert list(rules.iter_legal_moves(view)) == moves
+            assert next(rules.iter_legal_moves(view)) == moves[0]  # a caller can stop early
+            for pawn in view.player.pawns:  # BoardRules generates the same moves that it constructs
+                for card in view.player.hand:
+                    expected = BoardRules().construct_legal_moves(RED, card, pawn, view.all_pawns())
+                    assert list(BoardRules().iter_legal_moves(RED, card, pawn, view.all_pawns())) == expected
+
+    def test_iter_legal_moves_forfeit(self):
+        view = Game(4).create_player_view(RED)  # all pawns are in start, so there are no legal moves for a 3
+        card = Card(0, CardType.CARD_3)
+        assert list(Rules(GameMode.STANDARD).iter_legal_moves(view, card)) == [Move(card, [])]
+        with pytest.raises(ValueError, match="Internal error"):
+            next(Rules(GameMode.ADULT).iter_legal_moves(view))  # adult mode, but there are no cards in the hand
+
+    def test_construct_legal_moves_cache(self):
+        rng = create_rng(5)
+        cache = LegalMoveCache(1000)
+        uncached = Rules(GameMode.ADULT)
+        cached = Rules(GameMode.ADULT, cache=cache)
+        for _ in range(50):
+            game = Game(3)
+            for pawn in game.players[RED].pawns + game.players[YELLOW].pawns:
+                pawn.position.move_to_position(decode_position(rng.randrange(POSITION_CODES)))
+            view = game.create_player_view(RED)
+            view.player.hand.extend(Card(index, rng.choice(list(CardType))) for index in range(ADULT_HAND))
+            expected = uncached.construct_legal_moves(view)
+            assert cached.construct_legal_moves(view) == expected
+            assert cached.construct_legal_moves(view) == expected  # found in the cache this time
+        assert 0 < cache.misses <= 50 * ADULT_HAND  # a card type that appears twice in a hand is only constructed once
+        assert cache.hits + cache.misses == 2 * 50 * ADULT_HAND
+
+    def test_execute_move_general_history(self):
+        rules = Rules(GameMode.STANDARD)
+        game = Game(4)
+        game.history_mode = HistoryMode.GENERAL
+        player = game.players[PlayerColor.RED]
+        move = Move(
+            Card("0", CardType.CARD_10),
+            actions=[Action(ActionType.MOVE_TO_POSITION, MagicMock(color=PlayerColor.RED, index=1), Position().move_to_square(10))],
+        )
+        rules.execute_move(game, player, move)
+        assert game.players[PlayerColor.RED].pawns[1].position == Position().move_to_square(10)
+        assert game.players[PlayerColor.RED].turns == 1
+        assert not game.history
+
     def test_evaluate_move(self):
         move = Move(
             MagicMock(),
@@ -305,6 +534,63 @@ def test_evaluate_move(self):
 
         assert expected == Rules.evaluate_move(view, move)
 
+    def test_apply_and_undo_move(self):
+        move = TestRules._create_evaluate_move()
+
+        game = Game(4)
+        game.players[PlayerColor.BLUE].pawns[2].position.move_to_safe(3)
+        view = game.create_player_view(PlayerColor.RED)
+        original = view.copy()
+        expected = Rules.evaluate_move(view, move)
+
+        undo = Rules.apply_move(view, move)
+        assert view == expected
+        Rules.undo_move(undo)
+        assert view == original
+
+    def test_apply_move_invalid_pawn(self):
+        move = Move(MagicMock(), actions=[Action(ActionType.MOVE_TO_START, MagicMock(color=PlayerColor.BLUE, index=0))])
+        view = Game(2).create_player_view(PlayerColor.RED)
+        original = view.copy()
+        assert Rules.apply_move(view, move) == []  # blue is not part of a 2-player game, so the action is ignored
+        assert view == original
+
+    def test_evaluate_move_in_place(self):
+        move = TestRules._create_evaluate_move()
+        view = Game(4).create_player_view(PlayerColor.RED)
+        original = view.copy()
+        expected = Rules.evaluate_move(view, move)
+
+        with Rules.evaluate_move_in_place(view, move) as result:
+            assert result is view
+            assert result == expected
+        assert view == original
+
+    def test_evaluate_move_in_place_exception(self):
+        move = TestRules._create_evaluate_move()
+        view = Game(4).create_player_view(PlayerColor.RED)
+        original = view.copy()
+
+        with pytest.raises(RuntimeError):
+            with Rules.evaluate_move_in_place(view, move):
+                raise RuntimeError("Hello")
+        assert view == original  # the view is restored even if an exception is raised
+
+    @staticmethod
+    def _create_evaluate_move():
+        return Move(
+            MagicMock(),
+            actions=[
+                Action(ActionType.MOVE_TO_POSITION, MagicMock(color=PlayerColor.RED, index=1), Position().move_to_square(10)),
+                Action(ActionType.MOVE_TO_POSITION, MagicMock(color=PlayerColor.YELLOW, index=3), Position().move_to_square(11)),
+                Action(ActionType.MOVE_TO_POSITION, MagicMock(color=PlayerColor.RED, index=1), Position().move_to_safe(2)),
+            ],
+            side_effects=[
+                Action(ActionType.MOVE_TO_START, MagicMock(color=PlayerColor.BLUE, index=2)),
+                Action(ActionType.MOVE_TO_POSITION, MagicMock(color=PlayerColor.GREEN, index=0), Position().move_to_square(12)),
+            ],
+        )
+
 
 RED = PlayerColor.RED
 YELLOW = PlayerColor.YELLOW
@@ -363,6 +649,19 @@ def test_distance_to_home(self):
         assert BoardRules.distance_to_home(_pawn(BLUE, square=0)) == 23
         assert BoardRules.distance_to_home(_pawn(GREEN, square=40)) == 13
 
+    def test_distance_table(self):
+        for color in PlayerColor:
+            assert len(DISTANCE_TO_HOME[color]) == POSITION_CODES
+            assert DISTANCE_TO_HOME[color][HOME_CODE] == 0
+            assert DISTANCE_TO_HOME[color][START_CODE] == 65
+            assert DISTANCE_TO_HOME[color][SAFE_BASE] == 5
+            for code in range(POSITION_CODES):  # the table agrees with the calculation for every position
+                position = decode_position(code)
+                assert DISTANCE_TO_HOME[color][code] == BoardRules._distance_to_home(color, position)
+                assert BoardRules.distance_to_home(Pawn(color, 0, position=position)) == DISTANCE_TO_HOME[color][code]
+        assert DISTANCE_TO_HOME[RED][9] == 59
+        assert DISTANCE_TO_HOME[GREEN][40] == 13
+
     def test_calculate_position_home(self):
         for color in PlayerColor:
             with pytest.raises(ValueError):
@@ -373,6 +672,34 @@ def test_calculate_position_start(self):
             with pytest.raises(ValueError):
                 BoardRules()._position(color, Position().move_to_start(), 1)
 
+    def test_occupancy(self):
+        first = _pawn(RED, square=10)
+        second = _pawn(BLUE, square=10)
+        safe = _pawn(GREEN, safe=3)
+        start = _pawn(YELLOW, start=True)
+        home = _pawn(YELLOW, home=True)
+        all_pawns = [first, second, safe, start, home]
+        assert BoardRules.occupancy(all_pawns) == {10: first, SAFE_BASE + 3: safe}  # start and home are never indexed
+        assert BoardRules.occupancy(all_pawns, exclude=first) == {10: second, SAFE_BASE + 3: safe}
+        assert BoardRules.occupancy([]) == {}
+
+    def test_target(self):
+        for color in PlayerColor:
+            for code in range(POSITION_CODES):
+                for squares in range(-20, 21):  # covers values both inside and outside of the precomputed table
+                    position = decode_position(code)
+                    try:
+                        expected = BoardRules._position(color, position, squares)
+                    except ValueError:
+                        expected = None
+                    assert BoardRules._target(color, position, squares) == expected
+
+    def test_target_independent(self):
+        position = Position().move_to_square(10)
+        target1 = BoardRules._target(PlayerColor.RED, position, 5)
+        target2 = BoardRules._target(PlayerColor.RED, position, 5)
+        assert target1 == target2 and target1 is not target2
+
     def test_calculate_position_from_safe(self):
         for color in PlayerColor:
             assert BoardRules()._position(color, Position().move_to_safe(0), 0) == Position().move_to_safe(0)
@@ -0,0 +1,179 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+
+import csv
+import json
+import statistics
+from unittest.mock import patch
+
+import pytest
+
+from apologies.engine import EnginePhase
+from apologies.game import GameMode
+from apologies.simulation import (
+    BASE_HEADERS,
+    RESULT_HEADERS,
+    SOURCE_HEADERS,
+    _Latency,
+    _play_game,
+    _Quantile,
+    _scenarios,
+    _shard_sizes,
+    _Summary,
+    run_simulation,
+)
+from apologies.source import MonteCarloInputSource, RandomInputSource
+from apologies.util import create_rng
+
+
+def _read_csv(path):
+    with path.open(encoding="utf-8", newline="") as csvfile:
+        return list(csv.reader(csvfile))
+
+
+class TestFunctions:
+    def test_shard_sizes(self):
+        assert _shard_sizes(1, 1) == [1]
+        assert _shard_sizes(10, 1) == [10]
+        assert _shard_sizes(10, 3) == [4, 3, 3]
+        assert _shard_sizes(10, 5) == [2, 2, 2, 2, 2]
+        assert _shard_sizes(2, 4) == [1, 1]  # never an empty shard
+        assert _shard_sizes(1000, 2) == [100] * 10  # shards are limited in size
+
+    def test_scenarios(self):
+        sources = [RandomInputSource(), RandomInputSource()]
+        scenarios = list(_scenarios(sources))
+        assert len(scenarios) == 2 * (3 + 4 + 5)  # for each mode, combinations of 2, 3 and 4 players
+        assert [scenario.scenario for scenario in scenarios] == list(range(1, len(scenarios) + 1))
+        assert scenarios[0].mode == GameMode.STANDARD and scenarios[-1].mode == GameMode.ADULT
+        assert scenarios[0].prefix == "Scenario 1: STANDARD mode with 2 players (case 0): "
+
+
+class TestQuantile:
+    def test_empty(self):
+        assert _Quantile(0.5).value is None
+
+    def test_exact_for_small_samples(self):
+        quantile = _Quantile(0.5)
+        for value, expected in [(5, 5), (1, 3), (3, 3), (10, 4), (7, 5)]:
+            quantile.add(value)
+            assert quantile.value == expected
+
+    def test_estimate(self):
+        rng = create_rng(5)
+        data = [rng.gauss(100, 20) for _ in range(5000)]
+        for p in [0.5, 0.95, 0.99]:
+            quantile = _Quantile(p)
+            for value in data:
+                quantile.add(value)
+            expected = statistics.quantiles(data, n=100, method="inclusive")[round(p * 100) - 1]
+            assert quantile.value == pytest.approx(expected, abs=1.0)
+
+
+class TestLatency:
+    def test_empty(self):
+        assert _Latency().values == [None, None, None]
+
+    def test_add(self):
+        latency = _Latency()
+        for value in range(1, 1001):
+            latency.add(value)
+        p50, p95, p99 = latency.values
+        assert p50 == pytest.approx(500, abs=10)
+        assert p95 == pytest.approx(950, abs=10)
+        assert p99 == pytest.approx(990, abs=10)
+
+
+class TestSummary:
+    def test_empty(self):
+        summary = _Summary()
+        assert summary.count == 0
+        assert summary.mean is None
+        assert summary.median is None
+
+    def test_add(self):
+        rng = create_rng(5)
+        data = [rng.randint(20, 200) for _ in range(1000)]
+        summary = _Summary()
+        for value in data:
+            summary.add(value)
+        assert summary.count == len(data)
+        assert summary.mean == pytest.approx(statistics.mean(data))
+        assert summary.median == pytest.approx(statistics.median(data), abs=3.0)
+
+
+class TestPlayGame:
+    def test_duration(self):
+        scenario = next(_scenarios([RandomInputSource()]))
+        with patch("apologies.simulation.time") as clock:
+            clock.perf_counter_ns.side_effect = [1_000_000, 2_501_000_000]  # a game that takes longer than a second
+            result = _play_game(scenario, 5, 0)
+        assert result.duration_ms == 2500.0
+        samples = result.profile.samples
+        assert {phase for _, phase in samples} == {EnginePhase.TURN, EnginePhase.CHOOSE_MOVE}
+        assert all(sample > 0 for values in samples.values() for sample in values)
+
+
+class TestRunSimulation:
+    def test_invalid_workers(self, tmp_path):
+        with pytest.raises(ValueError):
+            run_simulation(1, str(tmp_path / "out.csv"), [RandomInputSource()], workers=-1)
+
+    def test_serial_and_parallel(self, tmp_path):
+        serial = tmp_path / "serial.csv"
+        parallel = tmp_path / "parallel.csv"
+        run_simulation(3, str(serial), [RandomInputSource()], workers=1, seed=5)
+        run_simulation(3, str(parallel), [RandomInputSource()], workers=2, seed=5)
+        serial_rows = _read_csv(serial)
+        parallel_rows = _read_csv(parallel)
+        assert serial_rows[0] == parallel_rows[0] == BASE_HEADERS + [f"RandomInputSource - {column}" for column in SOURCE_HEADERS]
+        assert len(serial_rows) == len(parallel_rows) == 1 + 2 * 3  # header, then 3 scenarios per mode
+        for serial_row, parallel_row in zip(serial_rows[1:], parallel_rows[1:], strict=True):
+            assert serial_row[:10] == parallel_row[:10]  # same seed plays the same games, so turns are identical
+            assert serial_row[12:14] == parallel_row[12:14]
+            assert serial_row[-2:] == parallel_row[-2:] == ["3", "100.0"]  # the only source wins every game
+            assert all(float(value) > 0 for value in serial_row[16:21] + parallel_row[16:21])  # mean time for each phase
+            assert all(float(value) > 0 for value in serial_row[21:27] + parallel_row[21:27])  # turn and decision latencies
+            turn_p50, turn_p95, turn_p99 = (float(value) for value in serial_row[21:24])
+            assert turn_p50 <= turn_p95 <= turn_p99
+
+    def test_serial_and_parallel_stateful_source(self, tmp_path):
+        # MonteCarloInputSource keeps its search tree between moves, but never from one game to the next
+        results = {}
+        for workers in [1, 2]:
+            path = tmp_path / f"results-{workers}.jsonl"
+            source = MonteCarloInputSource(rollouts=4, depth=1)
+            run_simulation(2, str(tmp_path / f"output-{workers}.csv"), [source], workers=workers, seed=5, results=str(path))
+            rows = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+            results[workers] = sorted((row["scenario"], row["iteration"], row["color"], row["turns"]) for row in rows)
+        assert results[1] == results[2]
+
+    def test_seed(self, tmp_path):
+        first = tmp_path / "first.csv"
+        second = tmp_path / "second.csv"
+        run_simulation(1, str(first), [RandomInputSource()], seed=5)
+        run_simulation(1, str(second), [RandomInputSource()], seed=6)
+        assert [row[:10] for row in _read_csv(first)] != [row[:10] for row in _read_csv(second)]
+
+    def test_results_csv(self, tmp_path):
+        output = tmp_path / "output.csv"
+        results = tmp_path / "results.csv"
+        run_simulation(2, str(output), [RandomInputSource()], seed=5, results=str(results))
+        rows = _read_csv(results)
+        assert rows[0] == RESULT_HEADERS
+        assert len(rows) == 1 + 2 * 3 * 2  # header, then 2 games for each of 3 scenarios per mode
+        assert [row[0] for row in rows[1:3]] == ["Scenario 1", "Scenario 1"]
+        assert [row[3] for row in rows[1:3]] == ["0", "1"]
+        assert {row[4] for row in rows[1:]} == {"RandomInputSource"}
+        for summary in _read_csv(output)[1:]:  # mean turns in the summary agrees with the per-game results
+            turns = [int(row[6]) for row in rows[1:] if row[0] == summary[0]]
+            assert float(summary[9]) == pytest.approx(statistics.mean(turns), abs=0.01)
+
+    def test_results_jsonl(self, tmp_path):
+        output = tmp_path / "output.csv"
+        results = tmp_path / "results.jsonl"
+        run_simulation(1, str(output), [RandomInputSource()], seed=5, workers=2, results=str(results))
+        rows = [json.loads(line) for line in results.read_text(encoding="utf-8").splitlines()]
+        assert [row["scenario"] for row in rows] == [1, 2, 3, 4, 5, 6]
+        assert [row["mode"] for row in rows] == ["STANDARD"] * 3 + ["ADULT"] * 3
+        assert [row["players"] for row in rows] == [2, 3, 4, 2, 3, 4]
+        assert set(rows[0]) == {"scenario", "mode", "players", "iteration", "winner", "color", "turns", "duration_ms"}
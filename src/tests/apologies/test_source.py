@@ -1,13 +1,31 @@
 # vim: set ft=python ts=4 sw=4 expandtab:
+# ruff: noqa: S311
 # Unit tests for source.py
 
-from unittest.mock import MagicMock
+import asyncio
+import random
+import time
+from unittest.mock import MagicMock, patch
 
 import pytest
 
-from apologies.game import GameMode
+from apologies.compact import zobrist_hash
+from apologies.engine import Character, Engine
+from apologies.game import DECK_COUNTS, Card, CardType, Game, GameMode, HistoryMode, PlayerColor, Position
 from apologies.reward import RewardCalculatorV1
-from apologies.source import NoOpInputSource, RandomInputSource, RewardV1InputSource, source
+from apologies.rules import Rules
+from apologies.source import (
+    AsyncInputSourceAdapter,
+    ExpectimaxInputSource,
+    MonteCarloInputSource,
+    NoOpInputSource,
+    QueueInputSource,
+    RandomInputSource,
+    RewardV1InputSource,
+    VectorizedRewardV1InputSource,
+    _SearchState,
+    source,
+)
 
 
 class TestFunctions:
@@ -39,6 +57,71 @@ def test_choose_move(self):
             NoOpInputSource().choose_move(GameMode.ADULT, MagicMock(), MagicMock(), MagicMock())
 
 
+class TestAsyncInputSourceAdapter:
+    def test_constructor(self):
+        ris = RandomInputSource()
+        adapter = AsyncInputSourceAdapter(ris)
+        assert adapter.source is ris
+        assert adapter.name == "RandomInputSource"
+        assert adapter.fullname == "apologies.source.AsyncInputSourceAdapter"
+
+    def test_rng(self):
+        ris = RandomInputSource()
+        adapter = AsyncInputSourceAdapter(ris)
+        rng = random.Random(5)
+        adapter.rng = rng
+        assert ris.rng is rng and adapter.rng is rng
+
+    # noinspection PyTypeChecker
+    def test_choose_move(self):
+        move = MagicMock()
+        source = MagicMock()
+        source.choose_move.return_value = move
+        adapter = AsyncInputSourceAdapter(source)
+        view = MagicMock()
+        legal_moves = [move]
+        evaluator = MagicMock()
+        assert asyncio.run(adapter.choose_move(GameMode.ADULT, view, legal_moves, evaluator)) is move
+        source.choose_move.assert_called_once_with(GameMode.ADULT, view, legal_moves, evaluator)
+
+
+class TestQueueInputSource:
+    def test_constructor(self):
+        qis = QueueInputSource()
+        assert qis.name == "QueueInputSource"
+        assert qis.requests.empty()
+
+    # noinspection PyTypeChecker
+    def test_choose_move(self):
+        move = MagicMock()
+        view = MagicMock()
+        legal_moves = [MagicMock(), move]
+
+        async def choose() -> None:
+            qis = QueueInputSource(asyncio.Queue())
+            task = asyncio.create_task(qis.choose_move(GameMode.ADULT, view, legal_moves, MagicMock()))
+            request = await qis.requests.get()
+            assert request.mode == GameMode.ADULT
+            assert request.view is view
+            assert request.legal_moves is legal_moves
+            request.reply.set_result(move)
+            assert await task is move
+
+        asyncio.run(choose())
+
+    # noinspection PyTypeChecker
+    def test_choose_move_exception(self):
+        async def choose() -> None:
+            qis = QueueInputSource()
+            task = asyncio.create_task(qis.choose_move(GameMode.ADULT, MagicMock(), [], MagicMock()))
+            request = await qis.requests.get()
+            request.reply.set_exception(ConnectionError("Player disconnected"))
+            with pytest.raises(ConnectionError):
+                await task
+
+        asyncio.run(choose())
+
+
 class TestRandomInputSource:
     def test_constructor(self):
         ris = RandomInputSource()  # the contract says there must be a valid zero-args constructor
@@ -55,6 +138,18 @@ def test_choose_move(self):
         for _ in range(100):
             assert ris.choose_move(GameMode.ADULT, MagicMock(), legal_moves, MagicMock()) in legal_moves
 
+    # noinspection PyTypeChecker
+    def test_choose_move_rng(self):
+        legal_moves = [MagicMock() for _ in range(10)]
+        ris1 = RandomInputSource()
+        ris2 = RandomInputSource()
+        assert isinstance(ris1.rng, random.Random) and ris1.rng is not ris2.rng
+        ris1.rng = random.Random(5)
+        ris2.rng = random.Random(5)
+        moves1 = [ris1.choose_move(GameMode.ADULT, MagicMock(), legal_moves, MagicMock()) for _ in range(20)]
+        moves2 = [ris2.choose_move(GameMode.ADULT, MagicMock(), legal_moves, MagicMock()) for _ in range(20)]
+        assert moves1 == moves2
+
 
 class TestRewardV1InputSource:
     def test_constructor(self):
@@ -74,7 +169,296 @@ def test_choose_move(self):
 
         ris = RewardV1InputSource()
 
+        ris.calculator = MagicMock()
         ris.calculator.calculate = MagicMock(side_effect=[200, 300, 100])
         evaluator = MagicMock(side_effect=[1, 2, 3])
 
         assert ris.choose_move(GameMode.ADULT, view, legal_moves, evaluator) is move2
+        assert evaluator.call_count == 3  # a custom evaluator and calculator are always used
+        ris.calculator.incremental.assert_not_called()
+
+    def test_choose_move_override(self):
+        class Source(RewardV1InputSource):
+            def calculate(self, _view, move, _evaluator):
+                return move, {move1: 200, move2: 300, move3: 100}[move]
+
+        move1 = MagicMock()
+        move2 = MagicMock()
+        move3 = MagicMock()
+        legal_moves = [move1, move2, move3]
+
+        ris = Source()
+        assert ris.choose_move(GameMode.ADULT, MagicMock(), legal_moves, Rules.evaluate_move) is move2  # calculate() is honored
+
+    def test_calculate(self):
+        game = Game(4)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(6)
+        view = game.create_player_view(PlayerColor.RED)
+        view.player.hand.append(Card("0", CardType.CARD_4))
+        original = view.copy()
+        move = Rules(GameMode.ADULT).construct_legal_moves(view)[0]
+
+        ris = RewardV1InputSource()
+        ris.calculator = RewardCalculatorV1()  # the default calculator is shared at class level
+        expected = ris.calculator.calculate(Rules.evaluate_move(view, move))
+
+        assert ris.calculate(view, move, Rules.evaluate_move) == (move, expected)  # evaluated in-place
+        assert view == original
+
+        evaluated = Rules.evaluate_move(view, move)
+        evaluator = MagicMock(return_value=evaluated)
+        assert ris.calculate(view, move, evaluator=evaluator) == (move, expected)  # a custom evaluator is always used
+        evaluator.assert_called_once_with(view, move)
+
+    def test_choose_move_in_place(self):
+        game = Game(4)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(6)
+        game.players[PlayerColor.YELLOW].pawns[0].position.move_to_square(10)
+        view = game.create_player_view(PlayerColor.RED)
+        view.player.hand.append(Card("0", CardType.CARD_4))
+        view.player.hand.append(Card("1", CardType.CARD_5))
+        original = view.copy()
+        legal_moves = Rules(GameMode.ADULT).construct_legal_moves(view)
+
+        ris = RewardV1InputSource()
+        ris.calculator = RewardCalculatorV1()  # the default calculator is shared at class level and is mocked elsewhere
+        expected = max(legal_moves, key=lambda move: ris.calculator.calculate(Rules.evaluate_move(view, move)))
+
+        with patch.object(
+            RewardCalculatorV1, "incremental", autospec=True, side_effect=RewardCalculatorV1.incremental
+        ) as incremental:
+            assert ris.choose_move(GameMode.ADULT, view, legal_moves, Rules.evaluate_move) == expected
+        incremental.assert_called_once_with(ris.calculator, view)  # the default scoring is done incrementally
+        assert view == original  # the view is unchanged after evaluation
+
+
+class TestVectorizedRewardV1InputSource:
+    def test_constructor(self):
+        ris = VectorizedRewardV1InputSource()  # the contract says there must be a valid zero-args constructor
+        assert ris.name == "VectorizedRewardV1InputSource"
+        assert ris.fullname == "apologies.source.VectorizedRewardV1InputSource"
+
+    def test_choose_move(self):
+        pytest.importorskip("numpy")
+        game = Game(4)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(6)
+        game.players[PlayerColor.YELLOW].pawns[0].position.move_to_square(10)
+        view = game.create_player_view(PlayerColor.RED)
+        view.player.hand.append(Card("0", CardType.CARD_4))
+        view.player.hand.append(Card("1", CardType.CARD_5))
+        original = view.copy()
+        legal_moves = Rules(GameMode.ADULT).construct_legal_moves(view)
+
+        calculator = RewardCalculatorV1()
+        expected = max(legal_moves, key=lambda move: calculator.calculate(Rules.evaluate_move(view, move)))
+
+        ris = VectorizedRewardV1InputSource()
+        assert ris.choose_move(GameMode.ADULT, view, legal_moves, Rules.evaluate_move) == expected
+        assert view == original  # the view is never modified
+
+        evaluator = MagicMock(wraps=Rules.evaluate_move)
+        assert ris.choose_move(GameMode.ADULT, view, legal_moves, evaluator) == expected
+        assert evaluator.call_count == len(legal_moves)  # a custom evaluator is always used
+
+
+class TestSearchState:
+    def test_play_and_restore(self):
+        game = Game(3)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(6)
+        game.players[PlayerColor.YELLOW].pawns[0].position.move_to_square(11)
+        view = game.create_player_view(PlayerColor.RED)
+        original = view.copy()
+        state = _SearchState(Rules(GameMode.STANDARD), view)
+        assert list(state.players) == [PlayerColor.RED, PlayerColor.YELLOW, PlayerColor.GREEN]
+        assert state.key() == zobrist_hash(view.all_pawns())
+
+        bump = state.legal_moves(PlayerColor.RED, Card("0", CardType.CARD_5))[0]  # bumps YELLOW back to start
+        chance = state.play(PlayerColor.RED, bump)
+        assert chance.color == PlayerColor.YELLOW and chance.winner is None
+        assert view.opponents[PlayerColor.YELLOW].pawns[0].position == Position()
+        assert state.key() == zobrist_hash(view.all_pawns())  # the hash is updated incrementally
+
+        again = state.legal_moves(PlayerColor.YELLOW, Card("1", CardType.CARD_2))[0]
+        assert state.play(PlayerColor.YELLOW, again).color == PlayerColor.YELLOW  # a 2 draws again
+        assert state.key() == zobrist_hash(view.all_pawns())
+
+        state.unplay()
+        assert state.key() == zobrist_hash(view.all_pawns())
+        state.restore()
+        assert view == original
+        assert state.key() == zobrist_hash(view.all_pawns())
+
+
+class TestMonteCarloInputSource:
+    def test_constructor(self):
+        mis = MonteCarloInputSource()  # the contract says there must be a valid zero-args constructor
+        assert mis.name == "MonteCarloInputSource"
+        assert mis.fullname == "apologies.source.MonteCarloInputSource"
+        assert mis.rollouts == 200
+        assert mis.time_budget is None
+        assert mis.depth == 4
+        assert mis.exploration == 1.4
+
+    def test_choose_move_single(self):
+        move = MagicMock()
+        mis = MonteCarloInputSource()
+        assert mis.choose_move(GameMode.STANDARD, MagicMock(), [move], MagicMock()) is move
+        assert mis._tree is None  # there is no need to search if there's only one legal move
+
+    def test_choose_move_winner(self):
+        game = Game(2)
+        for pawn in game.players[PlayerColor.RED].pawns[:3]:
+            pawn.position.move_to_home()
+        game.players[PlayerColor.RED].pawns[3].position.move_to_safe(4)
+        game.players[PlayerColor.YELLOW].pawns[0].position.move_to_square(40)
+        view = game.create_player_view(PlayerColor.RED)
+        view.player.hand.extend([Card("0", CardType.CARD_4), Card("1", CardType.CARD_1)])
+        original = view.copy()
+        legal_moves = Rules(GameMode.ADULT).construct_legal_moves(view)
+        winner = next(move for move in legal_moves if move.card.cardtype == CardType.CARD_1)
+
+        mis = MonteCarloInputSource(rollouts=20)
+        mis.rng = random.Random(5)
+        evaluator = MagicMock()
+        assert mis.choose_move(GameMode.ADULT, view, legal_moves, evaluator) is winner
+        evaluator.assert_not_called()
+        assert view == original  # the view is never modified
+
+    def test_choose_move_reuse(self):
+        game = Game(3)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(6)
+        game.players[PlayerColor.YELLOW].pawns[0].position.move_to_square(10)
+        view = game.create_player_view(PlayerColor.RED)
+        view.player.hand.extend([Card("0", CardType.CARD_4), Card("1", CardType.CARD_5), Card("2", CardType.CARD_10)])
+        rules = Rules(GameMode.ADULT)
+
+        mis = MonteCarloInputSource(rollouts=30)
+        mis.rng = random.Random(5)
+        mis.choose_move(GameMode.ADULT, view, rules.construct_legal_moves(view), MagicMock())
+        assert mis._tree.visits == 30
+
+        legal_moves = rules.construct_legal_moves(view)  # equivalent moves, but not the same objects
+        assert mis.choose_move(GameMode.ADULT, view, legal_moves, MagicMock()) in legal_moves
+        assert mis._tree.visits == 60  # the tree from the first search was reused
+
+    def test_choose_move_new_game(self):
+        game = Game(3)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(6)
+        view = game.create_player_view(PlayerColor.RED)
+        view.player.hand.extend([Card("0", CardType.CARD_4), Card("1", CardType.CARD_5), Card("2", CardType.CARD_10)])
+        rules = Rules(GameMode.ADULT)
+
+        mis = MonteCarloInputSource(rollouts=30)
+        mis.rng = random.Random(5)
+        mis.choose_move(GameMode.ADULT, view, rules.construct_legal_moves(view), MagicMock())
+        mis.rng = mis.rng  # the same generator, so this is still the same game
+        assert mis._tree is not None
+
+        mis.rng = random.Random(6)  # the engine assigns a new generator when a new game starts
+        assert mis._tree is None
+        fresh = MonteCarloInputSource(rollouts=30)
+        fresh.rng = random.Random(6)
+        legal_moves = rules.construct_legal_moves(view)
+        assert mis.choose_move(GameMode.ADULT, view, legal_moves, MagicMock()) == fresh.choose_move(
+            GameMode.ADULT, view, legal_moves, MagicMock()
+        )
+        assert mis._tree.visits == fresh._tree.visits == 30  # nothing was reused from the previous game
+
+    def test_choose_move_time_budget(self):
+        game = Game(2)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(6)
+        view = game.create_player_view(PlayerColor.RED)
+        view.player.hand.extend([Card("0", CardType.CARD_4), Card("1", CardType.CARD_5)])
+        legal_moves = Rules(GameMode.ADULT).construct_legal_moves(view)
+
+        mis = MonteCarloInputSource(rollouts=0, time_budget=0.05)
+        start = time.perf_counter()
+        assert mis.choose_move(GameMode.ADULT, view, legal_moves, MagicMock()) in legal_moves
+        assert time.perf_counter() - start >= 0.05
+        assert mis._tree.visits > 0  # the time budget takes precedence over the number of rollouts
+
+    def test_seeded_game_reproducible(self):
+        def play():
+            characters = [Character("mcts", MonteCarloInputSource(rollouts=5, depth=2)), Character("random", RandomInputSource())]
+            engine = Engine(GameMode.ADULT, characters, rng=5, history_mode=HistoryMode.GENERAL)
+            engine.start_game()
+            while not engine.completed:
+                engine.play_next()
+            return [(player.color, player.turns, player.pawns) for player in engine.game.players.values()]
+
+        assert play() == play()
+
+
+class TestExpectimaxInputSource:
+    def test_constructor(self):
+        eis = ExpectimaxInputSource()  # the contract says there must be a valid zero-args constructor
+        assert eis.name == "ExpectimaxInputSource"
+        assert eis.fullname == "apologies.source.ExpectimaxInputSource"
+        assert eis.depth == 2
+
+    def test_remaining(self):
+        view = Game(2).create_player_view(PlayerColor.RED)
+        assert ExpectimaxInputSource._remaining(view) == DECK_COUNTS
+        view.player.hand.extend([Card("0", CardType.CARD_1), Card("1", CardType.CARD_1), Card("2", CardType.CARD_12)])
+        remaining = ExpectimaxInputSource._remaining(view)
+        assert remaining[CardType.CARD_1] == DECK_COUNTS[CardType.CARD_1] - 2
+        assert remaining[CardType.CARD_12] == DECK_COUNTS[CardType.CARD_12] - 1
+        assert remaining[CardType.CARD_2] == DECK_COUNTS[CardType.CARD_2]
+
+    def test_choose_move_single(self):
+        move = MagicMock()
+        assert ExpectimaxInputSource().choose_move(GameMode.STANDARD, MagicMock(), [move], MagicMock()) is move
+
+    def test_choose_move_winner(self):
+        game = Game(2)
+        for pawn in game.players[PlayerColor.RED].pawns[:3]:
+            pawn.position.move_to_home()
+        game.players[PlayerColor.RED].pawns[3].position.move_to_safe(4)
+        game.players[PlayerColor.YELLOW].pawns[0].position.move_to_square(40)
+        view = game.create_player_view(PlayerColor.RED)
+        view.player.hand.extend([Card("0", CardType.CARD_4), Card("1", CardType.CARD_1)])
+        original = view.copy()
+        legal_moves = Rules(GameMode.ADULT).construct_legal_moves(view)
+        winner = next(move for move in legal_moves if move.card.cardtype == CardType.CARD_1)
+
+        evaluator = MagicMock()
+        assert ExpectimaxInputSource().choose_move(GameMode.ADULT, view, legal_moves, evaluator) is winner
+        evaluator.assert_not_called()
+        assert view == original  # the view is never modified
+
+    def test_choose_move_bump(self):
+        game = Game(2)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(6)
+        game.players[PlayerColor.YELLOW].pawns[0].position.move_to_square(11)
+        view = game.create_player_view(PlayerColor.RED)
+        view.player.hand.extend([Card("0", CardType.CARD_3), Card("1", CardType.CARD_5)])
+        legal_moves = Rules(GameMode.ADULT).construct_legal_moves(view)
+        move = ExpectimaxInputSource(depth=1).choose_move(GameMode.ADULT, view, legal_moves, MagicMock())
+        assert move.side_effects  # moving forward 5 bumps the opponent back to start, which is the best move
+
+    def test_transposition_table(self):
+        game = Game(2)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(6)
+        game.players[PlayerColor.YELLOW].pawns[0].position.move_to_square(30)
+        view = game.create_player_view(PlayerColor.RED)
+        view.player.hand.extend([
+            Card("0", CardType.CARD_5),
+            Card("1", CardType.CARD_5),
+        ])  # each move can be played with either card
+        legal_moves = Rules(GameMode.ADULT).construct_legal_moves(view)
+        assert len(legal_moves) == 2
+
+        eis = ExpectimaxInputSource()
+        eis.choose_move(GameMode.ADULT, view, legal_moves, MagicMock())
+        assert eis._hits > 0  # the position after the second move was already searched for the first move
+
+    def test_seeded_game_reproducible(self):
+        def play():
+            characters = [Character("expectimax", ExpectimaxInputSource()), Character("random", RandomInputSource())]
+            engine = Engine(GameMode.STANDARD, characters, rng=5, history_mode=HistoryMode.GENERAL)
+            engine.start_game()
+            while not engine.completed:
+                engine.play_next()
+            return [(player.color, player.turns, player.pawns) for player in engine.game.players.values()]
+
+        assert play() == play()
@@ -1,8 +1,21 @@
 # vim: set ft=python ts=4 sw=4 expandtab:
+# ruff: noqa: S311
+
+import random
 
 import pytest
 
-from apologies.util import CircularQueue
+from apologies.util import CircularQueue, create_rng
+
+
+class TestFunctions:
+    def test_create_rng(self):
+        assert isinstance(create_rng(), random.Random)
+        assert create_rng(5).random() == create_rng(5).random()
+        assert create_rng("1:2:3").random() == create_rng("1:2:3").random()
+        assert create_rng(5).random() != create_rng(6).random()
+        rng = random.Random()
+        assert create_rng(rng) is rng
 
 
 class TestCircularQueue:
@@ -30,6 +43,16 @@ def test_constructor_single_none(self):
         assert queue.next() is None
         assert queue.next() is None
 
+    def test_peek(self):
+        queue = CircularQueue(["a", "b", "c"], first="b")
+        assert queue.peek() == "b"
+        assert queue.next() == "b"
+        assert queue.peek() == "c"
+        assert queue.next() == "c"
+        assert queue.peek() == "a"  # wraps around before the working entries are refilled
+        assert queue.next() == "a"
+        assert queue.peek() == "b"
+
     def test_constructor_multiple(self):
         queue = CircularQueue(["a", "b", "c", "d", "e", None])
         assert queue.entries == ["a", "b", "c", "d", "e", None]
@@ -0,0 +1,64 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# Unit tests for vectorized.py
+
+import pytest
+
+from apologies.game import Card, CardType, Game, PlayerColor, Position
+from apologies.reward import RewardCalculatorV1
+from apologies.rules import Action, ActionType, Move, Rules
+from tests.apologies.helpers import random_positions
+
+pytest.importorskip("numpy")
+
+from apologies.vectorized import rewards_v1
+
+
+def _expected(view, moves):
+    calculator = RewardCalculatorV1()
+    return [calculator.calculate(Rules.evaluate_move(view, move)) for move in moves]
+
+
+class TestRewardsV1:
+    def test_empty_game(self):
+        game = Game(4)
+        view = game.create_player_view(PlayerColor.RED)
+        move = Move(Card("0", CardType.CARD_1), actions=[])
+        assert rewards_v1(view, [move]).tolist() == [0]
+        assert rewards_v1(view, []).tolist() == []
+
+    def test_invalid_pawn(self):
+        game = Game(2)
+        game.players[PlayerColor.RED].pawns[0].position.move_to_square(6)
+        view = game.create_player_view(PlayerColor.RED)
+        moves = [
+            Move(Card("0", CardType.CARD_1), actions=[Action(ActionType.MOVE_TO_START, game.players[PlayerColor.RED].pawns[0])]),
+            Move(
+                Card("0", CardType.CARD_1), actions=[Action(ActionType.MOVE_TO_START, Game(4).players[PlayerColor.GREEN].pawns[0])]
+            ),
+        ]
+        assert rewards_v1(view, moves).tolist() == _expected(view, moves) == [0, 3]  # the GREEN pawn is ignored
+
+    def test_actions_and_side_effects(self):
+        game = Game(3)
+        red = game.players[PlayerColor.RED].pawns
+        yellow = game.players[PlayerColor.YELLOW].pawns
+        red[0].position.move_to_square(6)
+        yellow[1].position.move_to_square(12)
+        view = game.create_player_view(PlayerColor.YELLOW)
+        moves = [
+            Move(
+                Card("0", CardType.CARD_10),
+                actions=[
+                    Action(ActionType.MOVE_TO_POSITION, yellow[1], Position().move_to_square(22)),
+                    Action(ActionType.MOVE_TO_POSITION, yellow[1], Position().move_to_square(26)),  # the last action wins
+                ],
+                side_effects=[Action(ActionType.MOVE_TO_START, red[0])],
+            ),
+            Move(Card("1", CardType.CARD_12), actions=[Action(ActionType.MOVE_TO_POSITION, yellow[0], Position().move_to_home())]),
+        ]
+        assert rewards_v1(view, moves).tolist() == _expected(view, moves)
+
+    def test_random_games(self):
+        # Play random ADULT mode games, checking the reward for every legal move at every turn
+        for view, moves in random_positions():
+            assert rewards_v1(view, moves).tolist() == _expected(view, moves)